@@ -0,0 +1,87 @@
+""" Compare two benchmark result files written by `updaters.py`.
+
+Cases are matched on their settings and the ratio of sweeps per second and ESS per second of the new results to the
+old results is printed. Cases where the sweep rate dropped by more than the threshold are flagged and the script exits
+with a non-zero status if there are any.
+
+Example
+-------
+python benchmarks/compare.py old.json new.json --threshold 0.1
+"""
+import json
+import sys
+
+CASE_KEYS = ('model', 'updater', 'N', 'K', 'D', 'num_particles')
+
+
+def main(args):
+    old = load_results(args.old_file)
+
+    new = load_results(args.new_file)
+
+    num_regressions = 0
+
+    for key in sorted(new, key=str):
+        if key not in old:
+            continue
+
+        r_old = old[key]
+
+        r_new = new[key]
+
+        if (r_old['status'] != 'ok') or (r_new['status'] != 'ok'):
+            print('{0}: status {1} -> {2}'.format(format_key(key), r_old['status'], r_new['status']))
+
+            continue
+
+        sweep_ratio = r_new['sweeps_per_sec'] / r_old['sweeps_per_sec']
+
+        ess_ratio = r_new['ess_per_sec'] / r_old['ess_per_sec']
+
+        flag = ''
+
+        if sweep_ratio < 1 - args.threshold:
+            flag = ' REGRESSION'
+
+            num_regressions += 1
+
+        print('{0}: sweeps/s x{1:.2f}, ESS/s x{2:.2f}{3}'.format(format_key(key), sweep_ratio, ess_ratio, flag))
+
+    if num_regressions > 0:
+        sys.exit(1)
+
+
+def format_key(key):
+    return ', '.join('{0}={1}'.format(k, v) for k, v in zip(CASE_KEYS, key) if v is not None)
+
+
+def load_results(file_name):
+    with open(file_name) as fh:
+        results = json.load(fh)['results']
+
+    return dict((tuple(r[k] for k in CASE_KEYS), r) for r in results)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        'old_file',
+        help='''Baseline results.'''
+    )
+
+    parser.add_argument(
+        'new_file',
+        help='''Results to compare against the baseline.'''
+    )
+
+    parser.add_argument(
+        '--threshold', default=0.1, type=float,
+        help='''Relative drop in sweeps per second reported as a regression.'''
+    )
+
+    args = parser.parse_args()
+
+    main(args)
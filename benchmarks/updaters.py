@@ -0,0 +1,263 @@
+""" Benchmark the feature allocation updaters on simulated data from each model.
+
+For every combination of model, updater and data size a chain is run from a fixed seed. The time spent in the
+feature allocation sweeps and in full model updates is recorded along with the trace of the joint log density. Results
+are written to a JSON file which can be compared against another run with `compare.py`.
+
+Example
+-------
+python benchmarks/updaters.py -o results.json --models linear_gaussian --updaters g pg -N 100 -K 4 8
+"""
+import datetime
+import itertools
+import json
+import numba
+import numpy as np
+import platform
+import subprocess
+import sys
+import time
+
+from pgfa.diagnostics import get_ess
+from pgfa.utils import set_seed
+
+import pgfa.models.lfrm
+import pgfa.models.linear_gaussian
+import pgfa.models.pyclone.binomial
+import pgfa.updates
+
+PARTICLE_UPDATERS = ('dpf', 'pg')
+
+
+def main(args):
+    results = []
+
+    for case in get_cases(args):
+        print('Running: {}'.format(format_case(case)))
+
+        try:
+            result = run_case(case, num_iters=args.num_iters, num_warmup_iters=args.num_warmup_iters, seed=args.seed)
+
+            print(
+                'Sweeps per second: {0:.3f}, ESS per second: {1:.3f}'.format(
+                    result['sweeps_per_sec'], result['ess_per_sec']
+                )
+            )
+
+        except Exception as e:
+            result = {'status': 'error', 'error': '{0}: {1}'.format(type(e).__name__, e)}
+
+            print('Failed: {}'.format(result['error']))
+
+        result.update(case)
+
+        results.append(result)
+
+    out = {'meta': get_meta(args), 'results': results}
+
+    with open(args.out_file, 'w') as fh:
+        json.dump(out, fh, indent=4)
+
+
+def get_cases(args):
+    """ Expand the grid of benchmark cases. Particle counts only apply to the particle updaters and the number of
+    dimensions does not apply to the LFRM.
+    """
+    cases = []
+
+    for model, updater, N, K in itertools.product(args.models, args.updaters, args.num_data_points, args.num_features):
+        Ds = [None] if model == 'lfrm' else args.num_dims
+
+        Ps = args.num_particles if updater in PARTICLE_UPDATERS else [None]
+
+        for D, P in itertools.product(Ds, Ps):
+            cases.append({'model': model, 'updater': updater, 'N': N, 'K': K, 'D': D, 'num_particles': P})
+
+    return cases
+
+
+def get_meta(args):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+
+    except Exception:
+        commit = None
+
+    return {
+        'args': vars(args),
+        'commit': commit,
+        'numba': numba.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'python': sys.version.split()[0],
+        'time': datetime.datetime.now().isoformat()
+    }
+
+
+def format_case(case):
+    return ', '.join('{0}={1}'.format(key, value) for key, value in case.items() if value is not None)
+
+
+def run_case(case, num_iters=100, num_warmup_iters=5, seed=0):
+    set_seed(seed)
+
+    model, model_updater = get_model(case)
+
+    # Compile kernels and leave the initial transient before timing
+    for _ in range(num_warmup_iters):
+        model_updater.update(model)
+
+    sweep_time = 0
+
+    total_time = 0
+
+    trace = np.zeros(num_iters)
+
+    for i in range(num_iters):
+        t_0 = time.perf_counter()
+
+        model_updater.feat_alloc_updater.update(model)
+
+        t_1 = time.perf_counter()
+
+        model_updater.update(model, feat_alloc_updates=0)
+
+        t_2 = time.perf_counter()
+
+        sweep_time += t_1 - t_0
+
+        total_time += t_2 - t_0
+
+        trace[i] = model.log_p
+
+    ess = get_ess(trace)
+
+    return {
+        'status': 'ok',
+        'ess': ess,
+        'ess_per_sec': ess / total_time,
+        'num_iters': num_iters,
+        'sweep_time': sweep_time,
+        'sweeps_per_sec': num_iters / sweep_time,
+        'total_time': total_time
+    }
+
+
+def get_model(case):
+    N = case['N']
+    K = case['K']
+    D = case['D']
+
+    feat_alloc_updater = get_feat_alloc_updater(case['updater'], case['num_particles'])
+
+    if case['model'] == 'lfrm':
+        params = pgfa.models.lfrm.simulate_params(N, K=K)
+
+        data, _ = pgfa.models.lfrm.simulate_data(params)
+
+        model = pgfa.models.lfrm.get_model(data, K=K)
+
+        model_updater = pgfa.models.lfrm.ModelUpdater(feat_alloc_updater)
+
+    elif case['model'] == 'linear_gaussian':
+        params = pgfa.models.linear_gaussian.simulate_params(D=D, K=K, N=N)
+
+        data, _ = pgfa.models.linear_gaussian.simulate_data(params)
+
+        model = pgfa.models.linear_gaussian.get_model(data, K=K)
+
+        model_updater = pgfa.models.linear_gaussian.ModelUpdater(feat_alloc_updater)
+
+    elif case['model'] == 'pyclone':
+        params = pgfa.models.pyclone.binomial.simulate_params(D, N, K=K)
+
+        data = pgfa.models.pyclone.binomial.simulate_data(params)
+
+        model = pgfa.models.pyclone.binomial.get_model(data, K=K)
+
+        model_updater = pgfa.models.pyclone.binomial.ModelUpdater(feat_alloc_updater)
+
+    else:
+        raise Exception('Unrecognized model: {}'.format(case['model']))
+
+    return model, model_updater
+
+
+def get_feat_alloc_updater(updater, num_particles):
+    if updater == 'dpf':
+        feat_alloc_updater = pgfa.updates.DiscreteParticleFilterUpdater(num_particles=num_particles)
+
+    elif updater == 'g':
+        feat_alloc_updater = pgfa.updates.GibbsUpdater()
+
+    elif updater == 'pg':
+        feat_alloc_updater = pgfa.updates.ParticleGibbsUpdater(num_particles=num_particles)
+
+    elif updater == 'rg':
+        feat_alloc_updater = pgfa.updates.RowGibbsUpdater()
+
+    else:
+        raise Exception('Unrecognized feature allocation updater: {}'.format(updater))
+
+    return feat_alloc_updater
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '-o', '--out-file', required=True,
+        help='''Path where JSON results will be written.'''
+    )
+
+    parser.add_argument(
+        '--models', choices=['lfrm', 'linear_gaussian', 'pyclone'], default=['lfrm', 'linear_gaussian', 'pyclone'],
+        nargs='+',
+        help='''Models to benchmark.'''
+    )
+
+    parser.add_argument(
+        '--updaters', choices=['dpf', 'g', 'pg', 'rg'], default=['dpf', 'g', 'pg', 'rg'], nargs='+',
+        help='''Feature allocation updaters to benchmark.'''
+    )
+
+    parser.add_argument(
+        '-D', '--num-dims', default=[2, 10], nargs='+', type=int,
+        help='''Number of dimensions of data. Not used for the LFRM.'''
+    )
+
+    parser.add_argument(
+        '-K', '--num-features', default=[4, 8], nargs='+', type=int,
+        help='''Number of features.'''
+    )
+
+    parser.add_argument(
+        '-N', '--num-data-points', default=[50, 200], nargs='+', type=int,
+        help='''Number of data points.'''
+    )
+
+    parser.add_argument(
+        '-P', '--num-particles', default=[10, 20], nargs='+', type=int,
+        help='''Number of particles for the dpf and pg updaters.'''
+    )
+
+    parser.add_argument(
+        '--num-iters', default=100, type=int,
+        help='''Number of timed iterations per case.'''
+    )
+
+    parser.add_argument(
+        '--num-warmup-iters', default=5, type=int,
+        help='''Number of untimed iterations run before timing to compile kernels.'''
+    )
+
+    parser.add_argument(
+        '--seed', default=0, type=int,
+        help='''Random seed used for every case.'''
+    )
+
+    args = parser.parse_args()
+
+    main(args)
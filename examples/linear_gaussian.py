@@ -205,9 +205,10 @@ if __name__ == '__main__':
     # Sampler options
     # ===================================================================================================================
     parser.add_argument(
-        '-s', '--sampler', choices=['dpf', 'g', 'pg', 'rg'], default='g',
+        '-s', '--sampler', choices=['adaptive', 'dpf', 'g', 'pg', 'rg'], default='g',
         help='''Sampler used to fit the feature allocation model.
-        Choices are: `dpf`-Discrete Particle Filter, `g`-Gibbs, `pg`-Particle Gibbs, `rg`-Row Gibbs
+        Choices are: `dpf`-Discrete Particle Filter, `g`-Gibbs, `pg`-Particle Gibbs, `rg`-Row Gibbs, `adaptive`-Mixture
+        of all four tuned by distance moved per second
         '''
     )
 
@@ -97,7 +97,7 @@ def main(args):
 
 
 def get_model_updater(
-        feat_alloc_updater_type='g',
+        feat_alloc_updater_type='rcg',
         annealing_power=0.0,
         ibp=True,
         mixture_prob=0.0,
@@ -119,7 +119,9 @@ def get_model_updater(
 
         updater_kwargs['test_path'] = test_path
 
-    feat_alloc_updater = get_feat_alloc_updater(mixture_prob, feat_alloc_updater_type, updater_kwargs)
+    feat_alloc_updater = get_feat_alloc_updater(
+        mixture_prob=mixture_prob, updater=feat_alloc_updater_type, updater_kwargs=updater_kwargs
+    )
 
     return pgfa.models.pyclone.binomial.ModelUpdater(feat_alloc_updater)
 
@@ -164,9 +166,10 @@ if __name__ == '__main__':
     # Sampler options
     #===================================================================================================================
     parser.add_argument(
-        '-s', '--sampler', choices=['dpf', 'g', 'pg', 'rg'], default='g',
+        '-s', '--sampler', choices=['dpf', 'g', 'pg', 'rcg', 'rg'], default='rcg',
         help='''Sampler used to fit the feature allocation model.
-        Choices are: `dpf`-Discrete Particle Filter, `g`-Gibbs, `pg`-Particle Gibbs, `rg`-Row Gibbs
+        Choices are: `dpf`-Discrete Particle Filter, `g`-Gibbs, `pg`-Particle Gibbs, `rcg`-Gibbs with cached
+        cellular prevalences, `rg`-Row Gibbs
         '''
     )
 
@@ -0,0 +1,8 @@
+def compile_all(verbose=False):
+    """ Compile and cache all numba kernels, see `pgfa.compilation.compile_all`.
+
+    The import is deferred so importing pgfa does not load the models.
+    """
+    import pgfa.compilation
+
+    return pgfa.compilation.compile_all(verbose=verbose)
@@ -0,0 +1,145 @@
+""" Adaptive scaling of Metropolis-Hastings proposals.
+
+Moves look up a multiplicative scale for their proposal and record whether each proposal was accepted. During the
+adaptation phase the log scale is moved towards the target acceptance rate by a Robbins-Monro step which decays with
+the number of proposals. Afterwards the scales are frozen so the chain satisfies detailed balance, and only the
+acceptance counts are updated.
+
+Scales are kept per move and optionally per parameter block, for example per sample for the PyClone V updates. Blocks
+should be stable labels such as data dimensions rather than feature indices which change meaning as features are added
+and removed.
+
+Example
+-------
+model_updater = pgfa.models.lfrm.ModelUpdater(feat_alloc_updater, mh_adaptor=MetropolisHastingsAdaptor(1000))
+"""
+import numpy as np
+
+from pgfa.utils import format_table
+
+
+class MetropolisHastingsAdaptor(object):
+    """ Tune the proposal scales of Metropolis-Hastings moves and record their acceptance rates.
+
+    Parameters
+    ----------
+    num_adapt_iters: (int) Number of model updates during which scales are adapted. Call `next_iter` once per update,
+        which `AbstractModelUpdater.update` does.
+    decay: (float) Exponent of the Robbins-Monro step size (n + 1)^-decay. Should be in (0.5, 1].
+    """
+
+    def __init__(self, num_adapt_iters=1000, decay=0.6):
+        self.num_adapt_iters = num_adapt_iters
+
+        self.decay = decay
+
+        self.iter = 0
+
+        self._log_scales = {}
+
+        self._num_adapt_proposals = {}
+
+        self._num_proposals = {}
+
+        self._num_accepted = {}
+
+    @property
+    def adapting(self):
+        return self.iter < self.num_adapt_iters
+
+    def get_scale(self, move, block=None):
+        """ Multiplicative scale for the proposal of a move. Scales start at 1.
+        """
+        return np.exp(self._log_scales.get((move, block), 0.0))
+
+    def next_iter(self):
+        """ Mark the end of a model update. Acceptance counts are reset when the scales are frozen, so the reported
+        rates only include proposals with the final scales.
+        """
+        self.iter += 1
+
+        if self.iter == self.num_adapt_iters:
+            self._num_proposals = {}
+
+            self._num_accepted = {}
+
+    def record(self, move, accept, block=None, target_accept_rate=0.44):
+        """ Record the outcome of a proposal and adapt the scale of the move if still adapting.
+
+        Parameters
+        ----------
+        move: (str) Name of the move.
+        accept: (bool) Whether the proposal was accepted.
+        block: (hashable) Label of the parameter block or None if the move has a single scale.
+        target_accept_rate: (float) Acceptance rate the scale is tuned towards. Typically 0.44 for moves on a single
+            variable and 0.234 for moves on many variables. If None only the acceptance rate is recorded, for moves
+            without a scale.
+        """
+        key = (move, block)
+
+        self._num_proposals[key] = self._num_proposals.get(key, 0) + 1
+
+        self._num_accepted[key] = self._num_accepted.get(key, 0) + int(accept)
+
+        if self.adapting and (target_accept_rate is not None):
+            n = self._num_adapt_proposals.get(key, 0)
+
+            step = (n + 1) ** (-self.decay)
+
+            self._log_scales[key] = self._log_scales.get(key, 0.0) + step * (int(accept) - target_accept_rate)
+
+            self._num_adapt_proposals[key] = n + 1
+
+    def get_stats(self):
+        """ Acceptance statistics of each move and block.
+
+        Returns
+        -------
+        stats: (dict) Map from (move, block) to a dictionary with the number of proposals, the number accepted, the
+            acceptance rate and the current scale.
+        """
+        stats = {}
+
+        for key, num_proposals in self._num_proposals.items():
+            num_accepted = self._num_accepted[key]
+
+            stats[key] = {
+                'num_proposals': num_proposals,
+                'num_accepted': num_accepted,
+                'accept_rate': num_accepted / num_proposals,
+                'scale': self.get_scale(*key)
+            }
+
+        return stats
+
+    def format_stats(self):
+        """ Format the acceptance statistics as a text table.
+        """
+        rows = [['move', 'block', 'num_proposals', 'accept_rate', 'scale']]
+
+        for (move, block), s in sorted(self.get_stats().items(), key=lambda x: (x[0][0], str(x[0][1]))):
+            rows.append([
+                move,
+                '' if block is None else str(block),
+                str(s['num_proposals']),
+                '{:.3f}'.format(s['accept_rate']),
+                '{:.4g}'.format(s['scale'])
+            ])
+
+        return format_table(rows)
+
+
+def get_scale(adaptor, move, block=None):
+    """ Scale of a move or 1 if adaptor is None.
+    """
+    if adaptor is None:
+        return 1.0
+
+    return adaptor.get_scale(move, block=block)
+
+
+def record(adaptor, move, accept, block=None, target_accept_rate=0.44):
+    """ Record the outcome of a proposal if adaptor is not None.
+    """
+    if adaptor is not None:
+        adaptor.record(move, accept, block=block, target_accept_rate=target_accept_rate)
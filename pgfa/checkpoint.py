@@ -0,0 +1,119 @@
+""" Save and restore the complete state of a running sampler.
+
+A checkpoint holds the model, the model updater (including the feature allocation updater and its iteration count),
+and the state of both the numpy and numba random number generators. A chain restored from a checkpoint continues
+exactly as it would have without interruption.
+
+Example
+-------
+checkpointer = Checkpointer('chain.ckpt', interval=100)
+
+for i in range(num_iters):
+    model_updater.update(model)
+
+    checkpointer.update(model, model_updater, i + 1)
+
+...
+
+checkpoint = load_checkpoint('chain.ckpt')
+"""
+from collections import namedtuple
+
+import numpy as np
+import os
+import pickle
+
+from pgfa.utils import get_numba_rng_state, set_numba_rng_state
+
+CHECKPOINT_VERSION = 1
+
+Checkpoint = namedtuple('Checkpoint', ['model', 'model_updater', 'iter', 'time'])
+
+
+def save_checkpoint(file_name, model, model_updater, iteration=0, time=0.0):
+    """ Write the sampler state to a file.
+
+    The file is written to a temporary path and moved into place, so an interrupted write never corrupts an existing
+    checkpoint.
+
+    Parameters
+    ----------
+    file_name: (str) Path of checkpoint file.
+    model: (AbstractModel) Model being sampled.
+    model_updater: (AbstractModelUpdater) Updater of the model.
+    iteration: (int) Number of completed iterations.
+    time: (float) Sampling time so far.
+    """
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'iter': iteration,
+        'time': time,
+        # Pickled together so objects shared between the model and updater, such as the data, stay shared
+        'sampler': (model, model_updater),
+        'numpy_rng_state': np.random.get_state(),
+        'numba_rng_state': get_numba_rng_state()
+    }
+
+    tmp_file_name = file_name + '.tmp'
+
+    with open(tmp_file_name, 'wb') as fh:
+        pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(tmp_file_name, file_name)
+
+
+def load_checkpoint(file_name, restore_rng=True):
+    """ Load a checkpoint written by `save_checkpoint`.
+
+    Parameters
+    ----------
+    file_name: (str) Path of checkpoint file.
+    restore_rng: (bool) Whether to restore the random number generators to their state at the checkpoint.
+
+    Returns
+    -------
+    checkpoint: (Checkpoint) The model, model updater, number of completed iterations and sampling time.
+    """
+    with open(file_name, 'rb') as fh:
+        state = pickle.load(fh)
+
+    if state['version'] != CHECKPOINT_VERSION:
+        raise Exception('Unsupported checkpoint version: {}'.format(state['version']))
+
+    if restore_rng:
+        np.random.set_state(state['numpy_rng_state'])
+
+        set_numba_rng_state(state['numba_rng_state'])
+
+    model, model_updater = state['sampler']
+
+    return Checkpoint(model, model_updater, state['iter'], state['time'])
+
+
+class Checkpointer(object):
+    """ Save checkpoints at a fixed interval of iterations.
+
+    Parameters
+    ----------
+    file_name: (str) Path of checkpoint file. Each checkpoint replaces the previous one.
+    interval: (int) Number of iterations between checkpoints.
+    """
+
+    def __init__(self, file_name, interval=100):
+        self.file_name = file_name
+
+        self.interval = interval
+
+    def update(self, model, model_updater, iteration, time=0.0):
+        """ Save a checkpoint if `iteration` is a multiple of the interval.
+
+        Returns
+        -------
+        saved: (bool) Whether a checkpoint was saved.
+        """
+        if (iteration % self.interval) != 0:
+            return False
+
+        save_checkpoint(self.file_name, model, model_updater, iteration=iteration, time=time)
+
+        return True
@@ -0,0 +1,251 @@
+""" Ahead of time warm-up of the compiled kernels.
+
+All numba kernels in the package are compiled with cache=True, so the machine code is written to the numba cache the
+first time a kernel is used and loaded from disk by later processes. The cache lives in the __pycache__ directories of
+the package, or in NUMBA_CACHE_DIR if it is set, for example when the package is installed read only.
+
+`compile_all` runs a tiny workload through every model, feature allocation updater and singletons updater so the cache
+holds the standard signatures before a batch of jobs is launched. Jobs started afterwards load the kernels instead of
+compiling them.
+
+Example
+-------
+python -c "import pgfa; pgfa.compile_all(verbose=True)"
+"""
+import numba
+import numpy as np
+import os
+import sys
+import time
+
+from pgfa.feature_allocation_distributions import (
+    BetaBernoulliFeatureAllocationDistribution, IndianBuffetProcessDistribution
+)
+from pgfa.utils import get_feat_alloc_updater, get_numba_rng_state, set_numba_rng_state, set_seed
+
+import pgfa.models.lfrm as lfrm
+import pgfa.models.linear_gaussian as lg
+import pgfa.models.pyclone.beta_binomial as beta_binomial
+import pgfa.models.pyclone.binomial as binomial
+import pgfa.models.pyclone.feat_alloc_updates
+import pgfa.models.pyclone.singletons_updates
+import pgfa.models.pyclone.utils
+import pgfa.utils
+
+UPDATERS = ('dpf', 'g', 'pg', 'rg')
+
+
+def compile_all(verbose=False):
+    """ Compile and cache all kernels by running a small workload through each model and updater.
+
+    The state of the numpy and numba random number generators is restored afterwards, so calling this does not change
+    the results of a seeded chain.
+
+    Parameters
+    ----------
+    verbose: (bool) Whether to print progress.
+
+    Returns
+    -------
+    summary: (dict) Number of kernels, names of kernels which were neither compiled by the workload nor found in the
+        cache and time taken in seconds. Kernels which are not used by any model, such as the unused resampling
+        schemes, are compiled on first use.
+    """
+    np_rng_state = np.random.get_state()
+
+    numba_rng_state = get_numba_rng_state()
+
+    t_0 = time.perf_counter()
+
+    try:
+        set_seed(0)
+
+        for name, func in [('lfrm', _warm_up_lfrm), ('linear_gaussian', _warm_up_lg), ('pyclone', _warm_up_pyclone)]:
+            if verbose:
+                print('Compiling: {}'.format(name))
+
+            func()
+
+    finally:
+        np.random.set_state(np_rng_state)
+
+        set_numba_rng_state(numba_rng_state)
+
+    kernels = get_kernels()
+
+    summary = {
+        'num_kernels': len(kernels),
+        'uncompiled': sorted(name for name, kernel in kernels.items() if not _is_compiled(kernel)),
+        'time': time.perf_counter() - t_0
+    }
+
+    if verbose:
+        print('Compiled {0} kernels in {1:.1f}s'.format(summary['num_kernels'], summary['time']))
+
+        if summary['uncompiled']:
+            print('Not compiled: {}'.format(', '.join(summary['uncompiled'])))
+
+    return summary
+
+
+def get_kernels():
+    """ Get all numba kernels defined in the loaded pgfa modules.
+
+    Returns
+    -------
+    kernels: (dict) Map from qualified name to the numba dispatcher or ufunc.
+    """
+    kernels = {}
+
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith('pgfa.') or module_name.startswith('pgfa.tests'):
+            continue
+
+        for name, obj in vars(module).items():
+            if not isinstance(obj, (numba.core.dispatcher.Dispatcher, numba.np.ufunc.dufunc.DUFunc)):
+                continue
+
+            # Skip kernels imported from other modules
+            if getattr(obj, '__module__', module_name) != module_name:
+                continue
+
+            kernels['{0}.{1}'.format(module_name, name)] = obj
+
+    return kernels
+
+
+def _is_compiled(kernel):
+    """ Whether a kernel has been compiled in this process or has an entry in the cache.
+
+    Kernels called from other kernels are not loaded when their caller is loaded from the cache, so the index file of
+    the cache is checked as well.
+    """
+    if isinstance(kernel, numba.np.ufunc.dufunc.DUFunc):
+        return len(kernel.types) > 0
+
+    if len(kernel.signatures) > 0:
+        return True
+
+    cache = getattr(kernel, '_cache', None)
+
+    return hasattr(cache, '_cache_file') and os.path.exists(cache._cache_file._index_path)
+
+
+def _run(model, model_updater, num_iters=1):
+    for _ in range(num_iters):
+        model_updater.update(model)
+
+    model.log_p
+
+
+def _warm_up_lfrm():
+    for symmetric in [False, True]:
+        params = lfrm.simulate_params(10, K=4)
+
+        if symmetric:
+            params.V = np.triu(params.V) + np.triu(params.V, 1).T
+
+        data, _ = lfrm.simulate_data(params, prop_missing=0.1, symmetric=symmetric)
+
+        for updater in UPDATERS:
+            model = lfrm.get_model(data, K=4, symmetric=symmetric)
+
+            feat_alloc_updater = get_feat_alloc_updater(updater=updater, updater_kwargs=_get_kwargs(updater))
+
+            _run(model, lfrm.ModelUpdater(feat_alloc_updater))
+
+        for V_update in ['mh', 'pg']:
+            model = lfrm.get_model(data, K=4, symmetric=symmetric)
+
+            _run(model, lfrm.ModelUpdater(get_feat_alloc_updater(), V_update=V_update))
+
+        model = lfrm.Model(data, IndianBuffetProcessDistribution(), params=params.copy(), symmetric=symmetric)
+
+        feat_alloc_updater = get_feat_alloc_updater(
+            updater_kwargs={'singletons_updater': lfrm.PriorSingletonsUpdater()}
+        )
+
+        _run(model, lfrm.ModelUpdater(feat_alloc_updater))
+
+
+def _warm_up_lg():
+    params = lg.simulate_params(D=2, K=4, N=10)
+
+    for prop_missing in [0, 0.1]:
+        data, _ = lg.simulate_data(params, prop_missing=prop_missing)
+
+        for updater in UPDATERS:
+            model = lg.get_model(data, K=4)
+
+            feat_alloc_updater = get_feat_alloc_updater(updater=updater, updater_kwargs=_get_kwargs(updater))
+
+            _run(model, lg.ModelUpdater(feat_alloc_updater))
+
+        if prop_missing == 0:
+            model = lg.get_model(data, K=4, sufficient_statistics=True)
+
+            _run(model, lg.ModelUpdater(get_feat_alloc_updater()))
+
+        for singletons_updater in [lg.CollapsedSingletonsUpdater(), lg.PriorSingletonsUpdater()]:
+            model = lg.Model(data, IndianBuffetProcessDistribution(), params=params.copy())
+
+            feat_alloc_updater = get_feat_alloc_updater(updater_kwargs={'singletons_updater': singletons_updater})
+
+            _run(model, lg.ModelUpdater(feat_alloc_updater))
+
+    Zs = np.array([params.Z, params.Z])
+
+    pgfa.utils.summarize_feature_allocation_matrix(Zs, burnin=len(Zs))
+
+
+def _warm_up_pyclone():
+    data = _simulate_pyclone_data(D=2, N=10)
+
+    for module in [binomial, beta_binomial]:
+        feat_alloc_updaters = [
+            get_feat_alloc_updater(updater=updater, updater_kwargs=_get_kwargs(updater)) for updater in UPDATERS
+        ]
+
+        feat_alloc_updaters.append(pgfa.models.pyclone.feat_alloc_updates.RowCacheGibbsUpdater())
+
+        for feat_alloc_updater in feat_alloc_updaters:
+            model = module.Model(data, BetaBernoulliFeatureAllocationDistribution(4))
+
+            _run(model, module.ModelUpdater(feat_alloc_updater))
+
+        model = module.Model(data, IndianBuffetProcessDistribution(), params=model.params.copy())
+
+        feat_alloc_updater = get_feat_alloc_updater(
+            updater_kwargs={'singletons_updater': pgfa.models.pyclone.singletons_updates.PriorSingletonsUpdater()}
+        )
+
+        _run(model, module.ModelUpdater(feat_alloc_updater))
+
+        pgfa.models.pyclone.singletons_updates.SplitMergeUpdater(num_proposals=2).update(model)
+
+
+def _get_kwargs(updater):
+    if updater in ['dpf', 'pg']:
+        return {'num_particles': 4}
+
+    return {}
+
+
+def _simulate_pyclone_data(D, N):
+    """ Simulate data points directly rather than with `binomial.simulate_data` to avoid importing scipy.stats.
+    """
+    data = []
+
+    for _ in range(N):
+        sample_data_points = []
+
+        for _ in range(D):
+            d = np.random.poisson(100)
+
+            b = np.random.binomial(d, np.random.random())
+
+            sample_data_points.append(pgfa.models.pyclone.utils.get_sample_data_point(d - b, b, 2, 0))
+
+        data.append(pgfa.models.pyclone.utils.DataPoint(sample_data_points))
+
+    return data
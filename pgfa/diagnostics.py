@@ -0,0 +1,259 @@
+""" Convergence and efficiency diagnostics for scalar MCMC traces.
+
+Traces are 1d arrays for a single chain or 2d arrays with one row per chain. The main use is to compare feature
+allocation updaters by effective samples per second of sampling time, see `compare_trace_files`.
+"""
+import numpy as np
+
+DEFAULT_TRACE_NAMES = ('log_p', 'K', 'alpha', 'precision', 'tau', 'tau_v', 'tau_x')
+
+
+def get_autocorrelation(x, max_lag=None):
+    """ Autocorrelation of a trace computed with the FFT.
+
+    Parameters
+    ----------
+    x: (ndarray) Trace of a single chain.
+    max_lag: (int) Maximum lag returned. Defaults to the length of the trace minus one.
+
+    Returns
+    -------
+    acf: (ndarray) Autocorrelation at lags 0 to max_lag.
+    """
+    x = np.asarray(x, dtype=np.float64)
+
+    n = len(x)
+
+    if max_lag is None:
+        max_lag = n - 1
+
+    x = x - np.mean(x)
+
+    # Pad to avoid circular correlation
+    f = np.fft.rfft(x, n=2 * n)
+
+    acov = np.fft.irfft(f * np.conjugate(f))[:max_lag + 1] / n
+
+    if acov[0] == 0:
+        acf = np.zeros(max_lag + 1)
+
+        acf[0] = 1
+
+    else:
+        acf = acov / acov[0]
+
+    return acf
+
+
+def get_ess(x):
+    """ Effective sample size of a scalar trace.
+
+    Autocorrelations are combined across chains as in Gelman et al. (2013) and summed using Geyer's initial monotone
+    sequence estimator.
+
+    Parameters
+    ----------
+    x: (ndarray) Trace of a single chain or array with one row per chain.
+    """
+    x = _as_chains(x)
+
+    M, n = x.shape
+
+    if n < 4:
+        return float(M * n)
+
+    acov = np.array([get_autocorrelation(c) * np.var(c) for c in x])
+
+    W = np.mean(acov[:, 0]) * n / (n - 1)
+
+    var_plus = W * (n - 1) / n
+
+    if M > 1:
+        var_plus += np.var(np.mean(x, axis=1), ddof=1)
+
+    if var_plus == 0:
+        return float(M * n)
+
+    rho = 1 - (W - np.mean(acov, axis=0)) / var_plus
+
+    rho[0] = 1
+
+    # Sum of pairs of autocorrelations, truncated at the first negative pair and forced to be monotone
+    tau = -1
+
+    pair_min = np.inf
+
+    for t in range(0, n - 1, 2):
+        pair = rho[t] + rho[t + 1]
+
+        if pair < 0:
+            break
+
+        pair_min = min(pair_min, pair)
+
+        tau += 2 * pair_min
+
+    return M * n / max(tau, 1 / np.log10(M * n))
+
+
+def get_ess_per_sec(x, time):
+    """ Effective sample size per second of sampling time.
+
+    Parameters
+    ----------
+    x: (ndarray) Trace of a single chain or array with one row per chain.
+    time: (float or array_like) Total sampling time, summed over chains if one value per chain is given.
+    """
+    return get_ess(x) / np.sum(time)
+
+
+def get_rhat(x):
+    """ Split R-hat of a scalar trace. Values close to 1 indicate the chains have mixed.
+
+    Parameters
+    ----------
+    x: (ndarray) Trace of a single chain or array with one row per chain.
+
+    Reference: Gelman et al. Bayesian Data Analysis, 3rd edition (2013)
+    """
+    x = _as_chains(x)
+
+    n = x.shape[1] // 2
+
+    # Split chains in half to detect non-stationarity within chains
+    x = np.row_stack([x[:, :n], x[:, -n:]])
+
+    B = n * np.var(np.mean(x, axis=1), ddof=1)
+
+    W = np.mean(np.var(x, axis=1, ddof=1))
+
+    if W == 0:
+        return 1.0 if B == 0 else np.inf
+
+    var_plus = (n - 1) / n * W + B / n
+
+    return np.sqrt(var_plus / W)
+
+
+def get_summary(traces, time, names=None):
+    """ Summarise scalar traces of one or more chains.
+
+    Parameters
+    ----------
+    traces: (list) Dictionaries mapping names to 1d traces, one per chain. Chains are truncated to the same length.
+    time: (list) Total sampling time of each chain.
+    names: (list) Names of the traces to summarise. Defaults to all names in `DEFAULT_TRACE_NAMES` which are present.
+
+    Returns
+    -------
+    summary: (dict) Map from trace name to a dictionary of mean, ESS, ESS per second and R-hat.
+    """
+    if names is None:
+        names = [x for x in DEFAULT_TRACE_NAMES if all(x in t for t in traces)]
+
+    n = min(len(t[names[0]]) for t in traces)
+
+    summary = {}
+
+    for name in names:
+        x = np.row_stack([t[name][:n] for t in traces]).astype(np.float64)
+
+        summary[name] = {
+            'mean': np.mean(x),
+            'ess': get_ess(x),
+            'ess_per_sec': get_ess_per_sec(x, time),
+            'rhat': get_rhat(x)
+        }
+
+    return summary
+
+
+def load_trace_file(file_name, burnin=0):
+    """ Load the scalar traces from a file written by `pgfa.models.trace.TraceWriter`.
+
+    The time trace is assumed to be the cumulative sampling time. The sampling time returned excludes the burnin.
+
+    Returns
+    -------
+    traces: (dict) Map from name to 1d trace after burnin.
+    time: (float) Sampling time after burnin.
+    """
+    from pgfa.models.trace import TraceReader
+
+    with TraceReader(file_name) as reader:
+        traces = reader.get_scalar_traces()
+
+    time = traces['time']
+
+    if burnin > 0:
+        sampling_time = time[-1] - time[burnin - 1]
+
+    else:
+        sampling_time = time[-1]
+
+    traces = dict((name, x[burnin:]) for name, x in traces.items() if name != 'time')
+
+    return traces, sampling_time
+
+
+def compare_trace_files(configs, burnin=0, names=None):
+    """ Compare sampler configurations by the efficiency of their chains.
+
+    Parameters
+    ----------
+    configs: (dict) Map from configuration label to a list of trace files, one per chain.
+    burnin: (int) Number of iterations discarded from the start of each chain.
+    names: (list) Names of traces to compare. Defaults to the names in `DEFAULT_TRACE_NAMES` present in all files.
+
+    Returns
+    -------
+    report: (list) One dictionary per configuration and trace with the label, name, number of chains, mean, ESS, ESS
+        per second and R-hat. Use `format_report` to print it.
+    """
+    report = []
+
+    for label, file_names in configs.items():
+        traces, times = zip(*[load_trace_file(x, burnin=burnin) for x in file_names])
+
+        summary = get_summary(traces, times, names=names)
+
+        for name, stats in summary.items():
+            row = {'config': label, 'name': name, 'num_chains': len(file_names)}
+
+            row.update(stats)
+
+            report.append(row)
+
+    return report
+
+
+def format_report(report):
+    """ Format a report from `compare_trace_files` as a text table sorted by trace name and ESS per second.
+    """
+    columns = ['name', 'config', 'num_chains', 'mean', 'ess', 'ess_per_sec', 'rhat']
+
+    rows = [columns]
+
+    for r in sorted(report, key=lambda r: (r['name'], -r['ess_per_sec'])):
+        rows.append([
+            r['name'],
+            str(r['config']),
+            str(r['num_chains']),
+            '{:.4g}'.format(r['mean']),
+            '{:.1f}'.format(r['ess']),
+            '{:.3f}'.format(r['ess_per_sec']),
+            '{:.3f}'.format(r['rhat'])
+        ])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+
+    return '\n'.join('  '.join(x.ljust(w) for x, w in zip(row, widths)) for row in rows)
+
+
+def _as_chains(x):
+    x = np.asarray(x, dtype=np.float64)
+
+    if x.ndim == 1:
+        x = x[np.newaxis, :]
+
+    return x
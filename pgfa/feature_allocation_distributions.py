@@ -1,8 +1,12 @@
+import functools
+import math
 import numba
 import numpy as np
-import scipy.stats
 
-from pgfa.math_utils import bernoulli_rvs, log_beta, log_factorial, do_metropolis_hastings_accept_reject
+from pgfa.math_utils import (
+    do_metropolis_hastings_accept_reject, ffa_rvs, ibp_rvs, log_beta, log_factorial, slice_sampler
+)
+from pgfa.stats import gamma_rvs
 
 
 def get_feature_allocation_distribution(K=None):
@@ -53,21 +57,21 @@ class BetaBernoulliFeatureAllocationDistribution(object):
         return cols
 
     def log_p(self, params):
-        alpha = params.alpha
         Z = params.Z
 
-        if Z.shape[1] != self.K:
-            return float('-inf')
+        return self.log_p_counts(params.alpha, np.sum(Z, axis=0), Z.shape[0])
 
-        K = Z.shape[1]
+    def log_p_counts(self, alpha, m, N):
+        """ Log pdf of a feature allocation matrix with N rows and column counts m.
+        """
+        if len(m) != self.K:
+            return float('-inf')
 
-        N = Z.shape[0]
+        K = len(m)
 
         if K == 0:
             return 0
 
-        m = np.sum(Z, axis=0)
-
         a0, b0 = self._get_beta_params(alpha)
 
         a = a0 + m
@@ -77,18 +81,24 @@ class BetaBernoulliFeatureAllocationDistribution(object):
         return np.sum(log_beta(a, b) - log_beta(a0, b0))
 
     def rvs(self, alpha, N):
-        K = self.K
-
         a, b = self._get_beta_params(alpha)
 
-        p = np.random.beta(a, b, size=K)
+        return ffa_rvs(a, b, self.K, N)
 
-        Z = np.zeros((N, K), dtype=np.int64)
+    def update_alpha(self, alpha, alpha_prior, m, N, width=1.0):
+        """ Slice sampling update of alpha on the log scale given the column counts m of a matrix with N rows.
+        """
+        a, b = alpha_prior
 
-        for k in range(K):
-            Z[:, k] = np.random.multinomial(1, [1 - p[k], p[k]], size=N).argmax(axis=1)
+        def log_p_func(log_alpha):
+            alpha = np.exp(log_alpha)
 
-        return Z
+            # Gamma prior and Jacobian of the log transform
+            return _log_p_alpha_beta_bernoulli(alpha, m, N) + a * log_alpha - b * alpha
+
+        log_alpha, _ = slice_sampler(log_p_func, np.log(alpha), width=width)
+
+        return float(np.exp(log_alpha))
 
     def _get_beta_params(self, alpha):
         return alpha / self.K, 1
@@ -119,19 +129,21 @@ class IndianBuffetProcessDistribution(object):
         return cols
 
     def log_p(self, params):
-        alpha = params.alpha
         Z = params.Z
-        
-        Z = Z[:, np.sum(Z, axis=0) > 0]
-        
-        N, K = Z.shape
+
+        return self.log_p_counts(params.alpha, np.sum(Z, axis=0), Z.shape[0])
+
+    def log_p_counts(self, alpha, m, N):
+        """ Log pdf of a feature allocation matrix with N rows and column counts m.
+        """
+        m = m[m > 0]
+
+        K = len(m)
 
         if K == 0:
-            return 0        
-                
-        m = np.sum(Z, axis=0)
-        
-        H = np.sum(1 / np.arange(1, N + 1))
+            return 0
+
+        H = _harmonic_number(N)
 
         log_p = 0
         
@@ -146,36 +158,46 @@ class IndianBuffetProcessDistribution(object):
         return log_p
 
     def rvs(self, alpha, N):
-        K = np.random.poisson(alpha)
+        return ibp_rvs(alpha, N)
 
-        Z = np.ones((1, K), dtype=np.int64)
+    def update_alpha(self, alpha, alpha_prior, m, N):
+        """ Conjugate Gibbs update of alpha given the column counts m of a matrix with N rows.
 
-        for idx in range(1, N):
-            n = idx + 1
+        The IBP likelihood of alpha is proportional to alpha^K exp(-H_N alpha), where K is the number of non-empty
+        columns and H_N the N-th harmonic number, so the Gamma prior is conjugate.
+        """
+        a = alpha_prior[0] + np.count_nonzero(m)
 
-            K = Z.shape[1]
+        b = alpha_prior[1] + _harmonic_number(N)
 
-            z = np.zeros(K)
+        return gamma_rvs(a, b)
 
-            m = np.sum(Z, axis=0)
 
-            for k in range(K):
-                z[k] = bernoulli_rvs(m[k] / n)
+def update_alpha(model, num_iters=1):
+    """ Update the Beta-Bernoulli or IBP concentration parameter from its Gamma prior.
 
-            Z = np.row_stack([Z, z])
+    The column counts of Z are computed once and shared by all iterations. The IBP uses a conjugate Gibbs update and
+    the Beta-Bernoulli a slice sampling update.
 
-            k_new = np.random.poisson(alpha / n)
+    Note: The model parameters will be updated in place.
 
-            if k_new > 0:
-                Z = np.column_stack([Z, np.zeros((Z.shape[0], k_new))])
+    Parameters
+    ----------
+    model: pgfa.models.base.AbstractModel
+    num_iters: (int) Number of updates.
+    """
+    params = model.params
 
-                Z[idx, K:] = 1
+    m = np.sum(params.Z, axis=0)
 
-        return Z.astype(np.int64)
+    N = params.Z.shape[0]
 
+    for _ in range(num_iters):
+        params.alpha = model.feat_alloc_dist.update_alpha(params.alpha, params.alpha_prior, m, N)
 
-def update_alpha(model):
-    """ Metropolis-Hastings update of the Beta-Bernoulli or IBP concentration parameter from a Gamma(1, 1) prior.
+
+def update_alpha_mh(model):
+    """ Metropolis-Hastings update of the Beta-Bernoulli or IBP concentration parameter using the prior as proposal.
 
     Note: The model parameters will be updated in place.
 
@@ -190,7 +212,7 @@ def update_alpha(model):
 
     log_p_old = model.feat_alloc_dist.log_p(model.params)
 
-    alpha_new = scipy.stats.gamma.rvs(a, scale=(1 / b))
+    alpha_new = gamma_rvs(a, b)
 
     model.params.alpha = alpha_new
 
@@ -203,38 +225,31 @@ def update_alpha(model):
         model.params.alpha = alpha_old
 
 
-def update_alpha_gibbs(model):
-    """ Gibbs update of the IBP concentration parameter.
-
-    Note: The model parameters will be updated in place.
-    Note: This update is not valid for the Beta-Bernoulli distribution.
-
-    Parameters
-    ----------
-    model: pgfa.models.base.AbstractModel
-    """
-    params = model.params
-    priors = model.priors
-
-    Z = params.Z
+@numba.njit(cache=True)
+def _get_conditional_counts(row_idx, Z):
+    m = np.sum(Z, axis=0)
 
-    K = Z.shape[1]
+    m -= Z[row_idx]
 
-    N = Z.shape[0]
+    return m
 
-    a = K + priors[0]
 
-    b = np.sum(1 / np.arange(1, N + 1)) + priors[1]
+@functools.lru_cache(maxsize=None)
+def _harmonic_number(N):
+    return np.sum(1 / np.arange(1, N + 1))
 
-    params.alpha = np.random.gamma(a, 1 / b)
 
-    model.params = params
+@numba.njit(cache=True)
+def _log_p_alpha_beta_bernoulli(alpha, m, N):
+    """ Log likelihood of alpha under the Beta-Bernoulli distribution up to terms constant in alpha.
+    """
+    K = len(m)
 
+    a = alpha / K
 
-@numba.njit(cache=True)
-def _get_conditional_counts(row_idx, Z):
-    m = np.sum(Z, axis=0)
+    log_p = 0.0
 
-    m -= Z[row_idx]
+    for k in range(K):
+        log_p += math.lgamma(a + m[k]) - math.lgamma(a + N + 1) + math.log(a)
 
-    return m
+    return log_p
@@ -34,22 +34,134 @@ def do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_
     return accept
 
 
-@numba.jit(nopython=True)
+def slice_sampler(log_p_func, x, log_p_x=None, width=1.0, max_steps=100):
+    """ Univariate slice sampler with stepping out and shrinkage.
+
+    Parameters
+    ----------
+    log_p_func: (callable) Function returning the unnormalized log density.
+    x: (float) Current value.
+    log_p_x: (float) Log density at the current value. Computed if not given.
+    width: (float) Initial width of the slice bracket.
+    max_steps: (int) Maximum number of stepping out steps.
+
+    Returns
+    -------
+    x_new: (float) New value.
+    log_p_x_new: (float) Log density at the new value.
+
+    Reference: Neal, R. Slice sampling (2003)
+    """
+    if log_p_x is None:
+        log_p_x = log_p_func(x)
+
+    log_y = log_p_x + np.log(np.random.random())
+
+    lower = x - width * np.random.random()
+
+    upper = lower + width
+
+    j = np.random.randint(max_steps)
+
+    k = max_steps - 1 - j
+
+    while (j > 0) and (log_p_func(lower) > log_y):
+        lower -= width
+
+        j -= 1
+
+    while (k > 0) and (log_p_func(upper) > log_y):
+        upper += width
+
+        k -= 1
+
+    while True:
+        x_new = np.random.uniform(lower, upper)
+
+        log_p_x_new = log_p_func(x_new)
+
+        if log_p_x_new > log_y:
+            return x_new, log_p_x_new
+
+        if x_new < x:
+            lower = x_new
+
+        else:
+            upper = x_new
+
+
+@numba.njit(cache=True)
 def log_beta(a, b):
     return log_gamma(a) + log_gamma(b) - log_gamma(a + b)
 
 
-@numba.jit(nopython=True)
+LOG_FACTORIAL_TABLE_MAX_SIZE = 2 ** 20
+
+_log_factorial_table = np.zeros(1)
+
+
+def get_log_factorial_table(n_max):
+    """ Get the shared table of log(n!) for n = 0, 1, ..., at least n_max.
+
+    The table is grown on demand by at least doubling its size, up to `LOG_FACTORIAL_TABLE_MAX_SIZE` entries. The
+    returned array should be treated as read only and is passed to compiled code which uses `log_factorial_lookup`.
+    """
+    global _log_factorial_table
+
+    size = len(_log_factorial_table)
+
+    if n_max >= size:
+        new_size = min(max(n_max + 1, 2 * size), LOG_FACTORIAL_TABLE_MAX_SIZE)
+
+        _log_factorial_table = log_gamma(np.arange(1, new_size + 1, dtype=np.float64))
+
+    return _log_factorial_table
+
+
 def log_factorial(x):
+    """ Log factorial of a scalar or array for use outside of compiled code.
+
+    Integer arguments are read from the shared lookup table. Non-integer arguments and integers beyond the maximum
+    table size fall back to lgamma. Compiled code should take the table from `get_log_factorial_table` and call
+    `log_factorial_lookup`.
+    """
+    if np.ndim(x) == 0:
+        x = float(x)
+
+        # Only integers grow the table
+        n_max = int(x) if (0 <= x < LOG_FACTORIAL_TABLE_MAX_SIZE) and x.is_integer() else 0
+
+        return log_factorial_lookup(get_log_factorial_table(n_max), x)
+
+    x = np.asarray(x)
+
+    if np.issubdtype(x.dtype, np.integer) and (x.size > 0):
+        x_max = x.max()
+
+        if (x_max < LOG_FACTORIAL_TABLE_MAX_SIZE) and (x.min() >= 0):
+            return get_log_factorial_table(x_max)[x]
+
+    return log_gamma(x + 1)
+
+
+@numba.njit(cache=True)
+def log_factorial_lookup(table, x):
+    """ Compiled accessor for a table returned by `get_log_factorial_table`.
+
+    Values of x which are not integers or are beyond the end of the table fall back to lgamma.
+    """
+    if (x >= 0) and (x < len(table)) and (x == np.floor(x)):
+        return table[int(x)]
+
     return log_gamma(x + 1)
 
 
 @numba.njit(cache=True)
 def log_binomial_coefficient(n, x):
-    return log_factorial(n) - log_factorial(x) - log_factorial(n - x)
+    return log_gamma(n + 1) - log_gamma(x + 1) - log_gamma(n - x + 1)
 
 
-@numba.vectorize([numba.float64(numba.float64)])
+@numba.vectorize([numba.float64(numba.float64)], cache=True)
 def log_gamma(x):
     return np.math.lgamma(x)
 
@@ -80,45 +192,44 @@ def exp_normalize(log_p):
 
 
 def ffa_rvs(a, b, K, N):
+    """ Sample a finite Beta-Bernoulli feature allocation matrix with the feature weights marginalized.
+    """
     p = np.random.beta(a, b, size=K)
 
     Z = np.zeros((N, K), dtype=np.int64)
 
     for k in range(K):
-        Z[:, k] = np.random.multinomial(1, [1 - p[k], p[k]], size=N).argmax(axis=1)
+        Z[:, k] = np.random.binomial(1, p[k], size=N)
 
     return Z
 
 
 def ibp_rvs(alpha, N):
-    K = np.random.poisson(alpha)
-
-    Z = np.ones((1, K), dtype=np.int64)
+    """ Sample a feature allocation matrix from the IBP.
 
-    for n in range(1, N):
-        K = Z.shape[1]
-
-        z = np.zeros(K)
-
-        m = np.sum(Z, axis=0)
+    Customer n (starting from one) samples Poisson(alpha / n) new dishes. Conditional on a dish being introduced by
+    customer n, the following customers take it independently with probability p ~ Beta(1, n), which is the de Finetti
+    representation of the urn where customer i takes the dish with probability m / i. The number of dishes is known
+    before any column is sampled, so Z is allocated once and each column is filled with a single binomial draw.
+    """
+    num_new = np.random.poisson(alpha / np.arange(1, N + 1))
 
-        for k in range(K):
-            p = np.array([n - m[k], m[k]])
+    first_row = np.repeat(np.arange(N), num_new)
 
-            p = p / p.sum()
+    K = len(first_row)
 
-            z[k] = discrete_rvs(p)
+    p = np.random.beta(1, first_row + 1)
 
-        Z = np.row_stack([Z, z])
+    Z = np.zeros((N, K), dtype=np.int64)
 
-        k_new = np.random.poisson(alpha / (n + 1))
+    for k in range(K):
+        n = first_row[k]
 
-        if k_new > 0:
-            Z = np.column_stack([Z, np.zeros((Z.shape[0], k_new))])
+        Z[n, k] = 1
 
-            Z[n, K:] = 1
+        Z[n + 1:, k] = np.random.binomial(1, p[k], size=(N - n - 1))
 
-    return Z.astype(np.int64)
+    return Z
 
 
 def log_ffa_pdf(a_0, b_0, Z):
@@ -156,16 +267,25 @@ def log_ibp_pdf(alpha, Z):
 
     m = histories.sum(axis=0)
 
-    num_histories = histories.shape[1]
+    log_p += _log_ibp_histories_pdf(get_log_factorial_table(N), history_counts, m, N)
+
+    return log_p
+
+
+@numba.njit(cache=True)
+def _log_ibp_histories_pdf(log_factorial_table, history_counts, m, N):
+    log_p = 0.0
 
-    for h in range(num_histories):
+    for h in range(len(history_counts)):
         K_h = history_counts[h]
 
-        log_p -= log_factorial(K_h)
+        log_p -= log_factorial_lookup(log_factorial_table, K_h)
+
+        log_p += K_h * log_factorial_lookup(log_factorial_table, m[h] - 1)
 
-        log_p += K_h * log_factorial(m[h] - 1) + K_h * log_factorial(N - m[h])
+        log_p += K_h * log_factorial_lookup(log_factorial_table, N - m[h])
 
-        log_p -= history_counts[h] * log_factorial(N)
+        log_p -= K_h * log_factorial_lookup(log_factorial_table, N)
 
     return log_p
 
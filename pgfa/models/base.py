@@ -1,5 +1,12 @@
+import itertools
+import numpy as np
+
+from pgfa.profiling import PhaseTimer, UpdateStats
+
 import pgfa.feature_allocation_distributions
 
+_revisions = itertools.count()
+
 
 class AbstractModel(object):
 
@@ -35,49 +42,217 @@ class AbstractModel(object):
     @property
     def log_p(self):
         """ Log of joint pdf.
+
+        Note: The data log likelihood is computed from the row cache of the data distribution when possible.
         """
-        return self.joint_dist.log_p(self.data, self.params)
+        log_p = 0
+
+        log_p += self.data_dist.log_p_cached(self.data, self.params)
+
+        log_p += self.feat_alloc_dist.log_p(self.params)
+
+        log_p += self.params_dist.log_p(self.params)
+
+        return log_p
 
 
 class AbstractModelUpdater(object):
+    """ Update the feature allocation matrix, the model specific parameters and alpha.
+
+    Parameters
+    ----------
+    feat_alloc_updater: Updater for the feature allocation matrix.
+    mh_adaptor: (MetropolisHastingsAdaptor) Tunes the proposal scales of the Metropolis-Hastings moves of the model
+        parameters. If None the moves use their default scales.
+    """
 
     def _update_model_params(self, model):
         """ Update the model specific parameters.
         """
         raise NotImplementedError
 
-    def __init__(self, feat_alloc_updater):
+    def __init__(self, feat_alloc_updater, mh_adaptor=None):
         self.feat_alloc_updater = feat_alloc_updater
 
+        self.mh_adaptor = mh_adaptor
+
+        self.stats = None
+
+    def enable_profiling(self, model, stats=None):
+        """ Record time and likelihood evaluations of each update phase.
+
+        Parameters
+        ----------
+        model: (AbstractModel) Model which will be updated. Likelihood evaluations are counted by its data distribution.
+        stats: (UpdateStats) Object to accumulate stats in. A new one is created if None.
+
+        Returns
+        -------
+        stats: (UpdateStats) Object which will accumulate the stats.
+        """
+        if stats is None:
+            stats = UpdateStats()
+
+        self._set_stats(model, stats)
+
+        return stats
+
+    def disable_profiling(self, model):
+        self._set_stats(model, None)
+
     def update(self, model, alpha_updates=1, feat_alloc_updates=1, param_updates=1):
         """ Update all parameters in a feature allocation model.
         """
         for _ in range(feat_alloc_updates):
             self.feat_alloc_updater.update(model)
 
-        for _ in range(param_updates):
-            self._update_model_params(model)
+        with PhaseTimer(self.stats, 'params'):
+            for _ in range(param_updates):
+                self._update_model_params(model)
+
+        with PhaseTimer(self.stats, 'alpha'):
+            pgfa.feature_allocation_distributions.update_alpha(model, num_iters=alpha_updates)
+
+        if self.mh_adaptor is not None:
+            self.mh_adaptor.next_iter()
 
-        for _ in range(alpha_updates):
-            pgfa.feature_allocation_distributions.update_alpha(model)
+        if self.stats is not None:
+            self.stats.num_iters += 1
+
+    def _set_stats(self, model, stats):
+        self.stats = stats
+
+        self.feat_alloc_updater.stats = stats
+
+        model.data_dist.stats = stats
 
 
 class AbstractDataDistribution(object):
+    # Whether the data log likelihood is the sum of the row log likelihoods so rows can be cached independently
+    separable_rows = False
+
+    # Set by `AbstractModelUpdater.enable_profiling` to count likelihood evaluations
+    stats = None
+
+    # If more than this fraction of the cached rows is stale all rows are recomputed with a single call
+    max_stale_fraction = 0.1
+
     def __init__(self, annealing_power=1.0):
         self.annealing_power = annealing_power
 
+        self.row_cache = RowLikelihoodCache()
+
     def log_p(self, data, params):
+        if self.stats is not None:
+            self.stats.count_call('log_p')
+
         return self.annealing_power * self._log_p(data, params)
 
+    def log_p_all_rows(self, data, params):
+        """ Log likelihood of each row. Only defined if the data distribution has separable rows.
+        """
+        if self.stats is not None:
+            self.stats.count_call('log_p_all_rows')
+
+        return self.annealing_power * self._log_p_all_rows(data, params)
+
     def log_p_row(self, data, params, row_idx):
+        if self.stats is not None:
+            self.stats.count_call('log_p_row')
+
         return self.annealing_power * self._log_p_row(data, params, row_idx)
 
+    def log_p_row_flips(self, data, params, row_idx, flip_cols):
+        """ Log likelihood of a row along a path where one entry of the row is flipped at each step.
+
+        Parameters
+        ----------
+        flip_cols: (ndarray) Column flipped at each step.
+
+        Returns
+        -------
+        log_p: (ndarray) Log likelihood of the current row followed by the log likelihood after each flip. The row of Z
+            is left unchanged.
+        """
+        if self.stats is not None:
+            self.stats.count_call('log_p_row_flips')
+
+        return self.annealing_power * self._log_p_row_flips(data, params, row_idx, flip_cols)
+
+    def cache_row(self, data, params, row_idx, log_p):
+        """ Store a value computed by `log_p_row` for the current state of a row.
+        """
+        if self.separable_rows:
+            self.row_cache.set_row(data, params, self.annealing_power, row_idx, log_p)
+
+    def log_p_cached(self, data, params):
+        """ Same as `log_p` but only recomputes the rows which changed since they were cached.
+
+        Parameter updates clear the cache, so if many rows are stale they are refilled with one call to
+        `log_p_all_rows` rather than a call to `log_p_row` for each row.
+        """
+        if not self.separable_rows:
+            return self.log_p(data, params)
+
+        stale_rows = self.row_cache.get_stale_rows(data, params, self.annealing_power)
+
+        if len(stale_rows) > self.max_stale_fraction * params.Z.shape[0]:
+            self.row_cache.set_all_rows(data, params, self.annealing_power, self.log_p_all_rows(data, params))
+
+        else:
+            for row_idx in stale_rows:
+                log_p = self.log_p_row(data, params, row_idx)
+
+                self.row_cache.set_row(data, params, self.annealing_power, row_idx, log_p)
+
+        return self.row_cache.log_p
+
+    def log_p_row_cached(self, data, params, row_idx):
+        """ Same as `log_p_row` but reuses the cached value if the row and the parameters have not changed.
+        """
+        if not self.separable_rows:
+            return self.log_p_row(data, params, row_idx)
+
+        log_p = self.row_cache.get_row(data, params, self.annealing_power, row_idx)
+
+        if log_p is None:
+            log_p = self.log_p_row(data, params, row_idx)
+
+            self.row_cache.set_row(data, params, self.annealing_power, row_idx, log_p)
+
+        return log_p
+
     def _log_p(self, data, params):
         raise NotImplementedError
 
+    def _log_p_all_rows(self, data, params):
+        """ Generic implementation which evaluates each row in turn. Models should override this with a vectorised
+        version.
+        """
+        return np.array([self._log_p_row(data, params, row_idx) for row_idx in range(params.Z.shape[0])])
+
     def _log_p_row(self, data, params, row_idx):
         raise NotImplementedError
 
+    def _log_p_row_flips(self, data, params, row_idx, flip_cols):
+        """ Generic implementation which evaluates the full row at each step. Models should override this with an
+        incremental version.
+        """
+        z = params.Z[row_idx].copy()
+
+        log_p = np.zeros(len(flip_cols) + 1)
+
+        log_p[0] = self._log_p_row(data, params, row_idx)
+
+        for i, k in enumerate(flip_cols):
+            params.Z[row_idx, k] = 1 - params.Z[row_idx, k]
+
+            log_p[i + 1] = self._log_p_row(data, params, row_idx)
+
+        params.Z[row_idx] = z
+
+        return log_p
+
 
 class AbstractParametersDistribution(object):
 
@@ -86,6 +261,36 @@ class AbstractParametersDistribution(object):
 
 
 class AbstractParameters(object):
+    # Assigning these attributes does not change the revision as they do not affect the data distribution
+    untracked_attrs = ('alpha', 'alpha_prior', 'Z')
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        if (not name.startswith('_')) and (name not in self.untracked_attrs):
+            self.touch()
+
+    def __setstate__(self, state):
+        # Copies and unpickled instances, possibly from another process, get a new revision
+        self.__dict__.update(state)
+
+        self.touch()
+
+    @property
+    def revision(self):
+        """ Counter which changes whenever a parameter other than Z or alpha is assigned.
+
+        Revisions are unique across instances so a copy never shares a revision with the original.
+        """
+        if '_revision' not in self.__dict__:
+            self.touch()
+
+        return self._revision
+
+    def touch(self):
+        """ Mark the parameters as changed. This must be called after modifying an array other than Z in place.
+        """
+        self._revision = next(_revisions)
 
     @property
     def param_shapes(self):
@@ -132,3 +337,83 @@ class JointDistribution(object):
         log_p += self.params_dist.log_p(params)
 
         return log_p
+
+
+class RowLikelihoodCache(object):
+    """ Cache of the per row data log likelihoods of a model.
+
+    The cache is tagged with the data, the parameter revision and the annealing power it was computed for, and is
+    cleared if any of them change. Each entry also stores the row of Z it was computed with, so rows of Z changed in
+    place are detected.
+    """
+
+    def __init__(self):
+        self._data = None
+
+        self._key = None
+
+        self._log_p = None
+
+        self._valid = None
+
+        self._Z = None
+
+    @property
+    def log_p(self):
+        """ Sum of the cached row log likelihoods.
+
+        Note: This is summed when read rather than maintained as rows change, so rows with infinite values do not turn
+        the total into NaN and round off does not accumulate.
+        """
+        return np.sum(self._log_p[self._valid])
+
+    def get_row(self, data, params, annealing_power, row_idx):
+        """ Get the cached log likelihood of a row or None if it is missing or stale.
+        """
+        self._check_key(data, params, annealing_power)
+
+        if self._valid[row_idx] and np.array_equal(self._Z[row_idx], params.Z[row_idx]):
+            return self._log_p[row_idx]
+
+        return None
+
+    def get_stale_rows(self, data, params, annealing_power):
+        self._check_key(data, params, annealing_power)
+
+        stale = ~self._valid | np.any(self._Z != params.Z, axis=1)
+
+        return np.flatnonzero(stale)
+
+    def set_all_rows(self, data, params, annealing_power, log_p):
+        self._check_key(data, params, annealing_power)
+
+        self._log_p[:] = log_p
+
+        self._valid[:] = True
+
+        self._Z[:] = params.Z
+
+    def set_row(self, data, params, annealing_power, row_idx, log_p):
+        self._check_key(data, params, annealing_power)
+
+        self._log_p[row_idx] = log_p
+
+        self._valid[row_idx] = True
+
+        self._Z[row_idx] = params.Z[row_idx]
+
+    def _check_key(self, data, params, annealing_power):
+        key = (params.revision, annealing_power, params.Z.shape)
+
+        if (data is not self._data) or (key != self._key):
+            N = params.Z.shape[0]
+
+            self._data = data
+
+            self._key = key
+
+            self._log_p = np.zeros(N)
+
+            self._valid = np.zeros(N, dtype=bool)
+
+            self._Z = np.zeros(params.Z.shape, dtype=params.Z.dtype)
@@ -1,8 +1,13 @@
 import numba
 import numpy as np
-import scipy.stats
+import scipy.linalg
 
+from pgfa.adaptation import get_scale, record
 from pgfa.math_utils import bernoulli_rvs, do_metropolis_hastings_accept_reject
+from pgfa.stats import (
+    gamma_log_pdf, gamma_rvs, isotropic_normal_log_pdf, normal_log_pdf, normal_rvs, normal_rvs_array, poisson_rvs,
+    polya_gamma_rvs_array, sum_of_squares
+)
 
 import pgfa.models.base
 
@@ -61,7 +66,7 @@ def simulate_params(N, K=None, alpha=1, tau=1):
 
     K = Z.shape[1]
 
-    V = scipy.stats.norm.rvs(0, 1 / np.sqrt(tau), size=(K, K))
+    V = normal_rvs_array(0, 1 / np.sqrt(tau), (K, K))
 
     return Parameters(alpha, np.ones(2), tau, np.ones(2), V, Z)
 
@@ -80,7 +85,7 @@ class Model(pgfa.models.base.AbstractModel):
             V = np.zeros((K, K))
 
         else:
-            V = scipy.stats.norm.rvs(0, 1, size=(K, K))
+            V = normal_rvs_array(0, 1, (K, K))
 
             V = np.triu(V)
 
@@ -127,8 +132,33 @@ class Model(pgfa.models.base.AbstractModel):
 
 class ModelUpdater(pgfa.models.base.AbstractModelUpdater):
 
+    """ Update the LFRM parameters.
+
+    Parameters
+    ----------
+    feat_alloc_updater: Updater for the feature allocation matrix.
+    mh_adaptor: (MetropolisHastingsAdaptor) Tunes the proposal scale or step size of the V update.
+    V_update: (str) Update for V, either 'hmc' for a joint Hamiltonian Monte Carlo update, 'pg' for a Gibbs update
+        using Polya-Gamma augmentation or 'mh' for element wise random walk Metropolis-Hastings.
+    """
+
+    def __init__(self, feat_alloc_updater, mh_adaptor=None, V_update='hmc'):
+        super().__init__(feat_alloc_updater, mh_adaptor=mh_adaptor)
+
+        if V_update not in ['hmc', 'mh', 'pg']:
+            raise Exception('Unrecognized V update: {}'.format(V_update))
+
+        self.V_update = V_update
+
     def _update_model_params(self, model):
-        update_V(model)
+        if self.V_update == 'hmc':
+            update_V_hmc(model, adaptor=self.mh_adaptor)
+
+        elif self.V_update == 'pg':
+            update_V_pg(model)
+
+        else:
+            update_V(model, adaptor=self.mh_adaptor)
 
         update_tau(model)
 
@@ -181,58 +211,72 @@ class Parameters(pgfa.models.base.AbstractParameters):
 # =========================================================================
 # Updates
 # =========================================================================
-def update_V(model, proposal_precision=1):
+def update_V(model, proposal_precision=1, adaptor=None):
+    """ Random walk Metropolis-Hastings update of each entry of V.
+
+    Parameters
+    ----------
+    model: pgfa.models.lfrm.Model
+    proposal_precision: (float) Precision of the normal proposal before scaling by the adaptor.
+    adaptor: (MetropolisHastingsAdaptor) Tunes the proposal standard deviation. All entries share a single scale.
+    """
+    proposal_std = get_scale(adaptor, 'V') / np.sqrt(proposal_precision)
+
     if model.symmetric:
-        _update_V_symmetric(model, proposal_precision=proposal_precision)
+        _update_V_symmetric(model, proposal_std, adaptor)
 
     else:
-        _update_V_full(model, proposal_precision=proposal_precision)
+        _update_V_full(model, proposal_std, adaptor)
 
 
-def _update_V_full(model, proposal_precision=1):
+def _update_V_full(model, proposal_std, adaptor):
     for i in np.random.permutation(model.params.K):
         for j in np.random.permutation(model.params.K):
-            _update_V_element(i, j, model, proposal_precision)
+            _update_V_element(i, j, model, proposal_std, adaptor)
 
 
-def _update_V_element(i, j, model, proposal_precision):
-    proposal_std = 1 / np.sqrt(proposal_precision)
+def _update_V_element(i, j, model, proposal_std, adaptor):
 
     v_old = model.params.V[i, j]
 
     log_p_old = model.log_p
 
-    v_new = scipy.stats.norm.rvs(v_old, proposal_std)
+    v_new = normal_rvs(v_old, proposal_std)
 
     model.params.V[i, j] = v_new
 
     log_p_new = model.log_p
 
-    log_q_old = scipy.stats.norm.logpdf(v_old, v_new, proposal_std)
+    log_q_old = normal_log_pdf(v_old, v_new, proposal_std)
+
+    log_q_new = normal_log_pdf(v_new, v_old, proposal_std)
 
-    log_q_new = scipy.stats.norm.logpdf(v_new, v_old, proposal_std)
+    accept = do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old)
 
-    if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old):
+    if accept:
         model.params.V[i, j] = v_new
 
     else:
         model.params.V[i, j] = v_old
 
+    model.params.touch()
+
+    record(adaptor, 'V', accept)
 
-def _update_V_symmetric(model, proposal_precision=1):
+
+def _update_V_symmetric(model, proposal_std, adaptor):
     for i in np.random.permutation(model.params.K):
         for j in np.random.permutation(np.arange(i, model.params.K)):
-            _update_V_element_symmetric(i, j, model, proposal_precision)
+            _update_V_element_symmetric(i, j, model, proposal_std, adaptor)
 
 
-def _update_V_element_symmetric(i, j, model, proposal_precision):
-    proposal_std = 1 / np.sqrt(proposal_precision)
+def _update_V_element_symmetric(i, j, model, proposal_std, adaptor):
 
     v_old = model.params.V[i, j]
 
     log_p_old = model.log_p
 
-    v_new = scipy.stats.norm.rvs(v_old, proposal_std)
+    v_new = normal_rvs(v_old, proposal_std)
 
     model.params.V[i, j] = v_new
 
@@ -240,11 +284,13 @@ def _update_V_element_symmetric(i, j, model, proposal_precision):
 
     log_p_new = model.log_p
 
-    log_q_old = scipy.stats.norm.logpdf(v_old, v_new, proposal_std)
+    log_q_old = normal_log_pdf(v_old, v_new, proposal_std)
+
+    log_q_new = normal_log_pdf(v_new, v_old, proposal_std)
 
-    log_q_new = scipy.stats.norm.logpdf(v_new, v_old, proposal_std)
+    accept = do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old)
 
-    if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old):
+    if accept:
         model.params.V[i, j] = v_new
 
         model.params.V[j, i] = v_new
@@ -254,6 +300,278 @@ def _update_V_element_symmetric(i, j, model, proposal_precision):
 
         model.params.V[j, i] = v_old
 
+    model.params.touch()
+
+    record(adaptor, 'V', accept)
+
+
+def update_V_hmc(model, num_steps=10, step_size=0.5, adaptor=None):
+    """ Hamiltonian Monte Carlo update of all free entries of V jointly.
+
+    The log likelihood and its gradient Z^T (X - sigmoid(Z V Z^T)) Z are computed with a few matrix products, so a
+    trajectory costs about 2 * num_steps full likelihood evaluations instead of the 2 * K^2 of `update_V`. The mass
+    matrix is diagonal and set from an upper bound on the curvature of the log density, which only depends on Z and the
+    missing data pattern, so step sizes are on a common scale.
+
+    Parameters
+    ----------
+    model: pgfa.models.lfrm.Model
+    num_steps: (int) Number of leapfrog steps per trajectory.
+    step_size: (float) Leapfrog step size before scaling by the adaptor.
+    adaptor: (MetropolisHastingsAdaptor) Tunes the step size.
+    """
+    params = model.params
+
+    if params.K == 0:
+        return
+
+    # Jitter the step size to avoid trajectories which return close to their start
+    step_size = step_size * get_scale(adaptor, 'V_hmc') * np.random.uniform(0.8, 1.2)
+
+    X, mask = _get_observed_data(model.data, model.symmetric)
+
+    Z = params.Z.astype(np.float64)
+
+    annealing_power = model.data_dist.annealing_power
+
+    free_idxs, _ = _get_free_params(params.K, model.symmetric)
+
+    def log_p_grad_func(x):
+        V = _get_V(x, free_idxs, params.K, model.symmetric)
+
+        return _log_p_grad_V(X, mask, V, Z, params.tau, annealing_power, free_idxs, model.symmetric)
+
+    # Bound on the diagonal of the negative Hessian using sigmoid'(m) <= 1 / 4
+    B = 0.25 * annealing_power * (Z.T @ mask @ Z)
+
+    if model.symmetric:
+        B = B + B.T - np.diag(np.diag(B))
+
+    mass = params.tau + B[free_idxs]
+
+    x_old = params.V[free_idxs].copy()
+
+    x_new, log_ratio = _leapfrog_trajectory(log_p_grad_func, x_old, mass, num_steps, step_size)
+
+    accept = np.log(np.random.random()) <= log_ratio
+
+    if accept:
+        params.V = _get_V(x_new, free_idxs, params.K, model.symmetric)
+
+    record(adaptor, 'V_hmc', accept, target_accept_rate=0.65)
+
+    model.params = params
+
+
+def update_V_pg(model):
+    """ Gibbs update of V using Polya-Gamma augmentation.
+
+    Given omega_ij ~ PG(1, m_ij) for each observed pair, with m_ij = z_i^T V z_j, the likelihood is Gaussian in the free
+    entries of V. These are drawn jointly from their full conditional with a single Cholesky factorisation. Building the
+    precision matrix costs O(|z_i|^2 |z_j|^2) per observed pair, which is cheap as rows of Z are sparse. For symmetric
+    models only the upper triangle of V is free and only pairs i <= j are observed.
+
+    Note: The augmentation requires an annealing power of one. For other powers this falls back to `update_V_hmc`.
+
+    Parameters
+    ----------
+    model: pgfa.models.lfrm.Model
+    """
+    params = model.params
+
+    if params.K == 0:
+        return
+
+    if model.data_dist.annealing_power != 1:
+        update_V_hmc(model)
+
+        return
+
+    X, mask = _get_observed_data(model.data, model.symmetric)
+
+    Z = params.Z.astype(np.float64)
+
+    free_idxs, param_idxs = _get_free_params(params.K, model.symmetric)
+
+    omega = mask * polya_gamma_rvs_array(Z @ params.V @ Z.T)
+
+    P, b = _get_V_pg_precision(X, mask, omega, params.Z, param_idxs, len(free_idxs[0]))
+
+    P[np.diag_indices_from(P)] += params.tau
+
+    L = scipy.linalg.cholesky(P, lower=True)
+
+    mean = scipy.linalg.cho_solve((L, True), b)
+
+    x = mean + scipy.linalg.solve_triangular(L.T, normal_rvs_array(0, 1, len(b)))
+
+    params.V = _get_V(x, free_idxs, params.K, model.symmetric)
+
+    model.params = params
+
+
+def _get_free_params(K, symmetric):
+    """ Indices of the free entries of V and the map from each entry of V to the index of its free parameter.
+    """
+    if symmetric:
+        free_idxs = np.triu_indices(K)
+
+    else:
+        free_idxs = tuple(np.indices((K, K)).reshape(2, -1))
+
+    param_idxs = np.zeros((K, K), dtype=np.int64)
+
+    param_idxs[free_idxs] = np.arange(len(free_idxs[0]))
+
+    if symmetric:
+        param_idxs[free_idxs[1], free_idxs[0]] = np.arange(len(free_idxs[0]))
+
+    return free_idxs, param_idxs
+
+
+@numba.njit(cache=True)
+def _get_V_pg_precision(X, mask, omega, Z, param_idxs, num_params):
+    """ Precision matrix and linear term of the Gaussian likelihood of the free entries of V given the Polya-Gamma
+    variables.
+
+    Each pair contributes omega_ij a a^T to the precision and (x_ij - 1 / 2) a to the linear term, where a is the
+    vector of counts of (k, l) with z_ik z_jl = 1 mapped to free parameters.
+    """
+    N, K = Z.shape
+
+    P = np.zeros((num_params, num_params))
+
+    b = np.zeros(num_params)
+
+    a = np.zeros(num_params)
+
+    active = np.zeros(num_params, dtype=np.int64)
+
+    for i in range(N):
+        for j in range(N):
+            if mask[i, j] == 0:
+                continue
+
+            num_active = 0
+
+            for k in range(K):
+                if Z[i, k] == 0:
+                    continue
+
+                for l in range(K):
+                    if Z[j, l] == 0:
+                        continue
+
+                    p = param_idxs[k, l]
+
+                    if a[p] == 0:
+                        active[num_active] = p
+
+                        num_active += 1
+
+                    a[p] += 1
+
+            kappa = X[i, j] - 0.5
+
+            for s in range(num_active):
+                p = active[s]
+
+                b[p] += kappa * a[p]
+
+                for t in range(num_active):
+                    q = active[t]
+
+                    P[p, q] += omega[i, j] * a[p] * a[q]
+
+            for s in range(num_active):
+                a[active[s]] = 0
+
+    return P, b
+
+
+def _get_observed_data(data, symmetric):
+    """ Binary data with missing entries set to 0 and the indicator of observed entries. Only the upper triangle is
+    observed for symmetric models.
+    """
+    mask = (~np.isnan(data)).astype(np.float64)
+
+    if symmetric:
+        mask = np.triu(mask)
+
+    X = np.where(mask > 0, (np.nan_to_num(data) != 0).astype(np.float64), 0.0)
+
+    return X, mask
+
+
+def _get_V(x, free_idxs, K, symmetric):
+    V = np.zeros((K, K))
+
+    V[free_idxs] = x
+
+    if symmetric:
+        V = V + V.T - np.diag(np.diag(V))
+
+    return V
+
+
+def _log_p_grad_V(X, mask, V, Z, tau, annealing_power, free_idxs, symmetric):
+    """ Log density of V up to a constant and its gradient with respect to the free entries.
+    """
+    M = Z @ V @ Z.T
+
+    # log sigmoid(m) = -log(1 + exp(-m)) and log(1 - sigmoid(m)) = -log(1 + exp(m))
+    log_p = annealing_power * np.sum(mask * (X * M - np.logaddexp(0, M)))
+
+    G = annealing_power * mask * (X - np.exp(-np.logaddexp(0, -M)))
+
+    grad = Z.T @ G @ Z
+
+    if symmetric:
+        grad = grad + grad.T - np.diag(np.diag(grad))
+
+    x = V[free_idxs]
+
+    log_p -= 0.5 * tau * np.sum(np.square(x))
+
+    return log_p, grad[free_idxs] - tau * x
+
+
+def _leapfrog_trajectory(log_p_grad_func, x, mass, num_steps, step_size):
+    """ Simulate Hamiltonian dynamics with a diagonal mass matrix.
+
+    Returns
+    -------
+    x: (ndarray) End point of the trajectory.
+    log_ratio: (float) Log Metropolis-Hastings acceptance ratio of the end point. This is -inf if the trajectory
+        diverged.
+    """
+    log_p_old, grad = log_p_grad_func(x)
+
+    r = np.random.normal(size=x.shape) * np.sqrt(mass)
+
+    H_old = -log_p_old + 0.5 * np.sum(np.square(r) / mass)
+
+    r = r + 0.5 * step_size * grad
+
+    for i in range(num_steps):
+        x = x + step_size * r / mass
+
+        log_p, grad = log_p_grad_func(x)
+
+        if i < num_steps - 1:
+            r = r + step_size * grad
+
+    r = r + 0.5 * step_size * grad
+
+    H_new = -log_p + 0.5 * np.sum(np.square(r) / mass)
+
+    log_ratio = H_old - H_new
+
+    if np.isnan(log_ratio):
+        log_ratio = -np.inf
+
+    return x, log_ratio
+
 
 def update_tau(model):
     params = model.params
@@ -262,14 +580,14 @@ def update_tau(model):
     if symmetric:
         a = params.tau_prior[0] + 0.5 * (0.5 * params.K * (params.K + 1))
 
-        b = params.tau_prior[1] + 0.5 * np.sum(np.square(np.triu(params.V)))
+        b = params.tau_prior[1] + 0.5 * _triu_sum_of_squares(params.V)
 
     else:
         a = params.tau_prior[0] + 0.5 * params.K ** 2
 
-        b = params.tau_prior[1] + 0.5 * np.sum(np.square(params.V.flatten()))
+        b = params.tau_prior[1] + 0.5 * sum_of_squares(params.V)
 
-    params.tau = scipy.stats.gamma.rvs(a, scale=(1 / b))
+    params.tau = gamma_rvs(a, b)
 
     model.params = params
 
@@ -280,7 +598,7 @@ def update_tau(model):
 class DataDistribution(pgfa.models.base.AbstractDataDistribution):
 
     def __init__(self, annealing_power=1.0, symmetric=False):
-        self.annealing_power = annealing_power
+        super().__init__(annealing_power=annealing_power)
 
         self.symmetric = symmetric
 
@@ -322,26 +640,37 @@ class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
         # Gamma prior on $\alpha$
         a = params.alpha_prior[0]
         b = params.alpha_prior[1]
-        log_p += scipy.stats.gamma.logpdf(params.alpha, a, scale=(1 / b))
+        log_p += gamma_log_pdf(params.alpha, a, b)
 
         # Gamma prior on $\tau$
         a = params.tau_prior[0]
         b = params.tau_prior[1]
-        log_p += scipy.stats.gamma.logpdf(params.tau, a, scale=(1 / b))
+        log_p += gamma_log_pdf(params.tau, a, b)
+
+        K = params.K
 
         if self.symmetric:
-            log_p += np.sum(scipy.stats.norm.logpdf(
-                np.squeeze(params.V[np.triu_indices(params.K)]), 0, 1 / np.sqrt(params.tau)
-            ))
+            log_p += isotropic_normal_log_pdf(_triu_sum_of_squares(params.V), 0.5 * K * (K + 1), params.tau)
 
         else:
-            log_p += np.sum(scipy.stats.norm.logpdf(
-                params.V.flatten(), 0, 1 / np.sqrt(params.tau)
-            ))
+            log_p += isotropic_normal_log_pdf(sum_of_squares(params.V), K * K, params.tau)
 
         return log_p
 
 
+@numba.njit(cache=True)
+def _triu_sum_of_squares(V):
+    K = V.shape[0]
+
+    sum_sq = 0.0
+
+    for i in range(K):
+        for j in range(i, K):
+            sum_sq += V[i, j] ** 2
+
+    return sum_sq
+
+
 @numba.njit(cache=True)
 def _log_p_symmetric(X, V, Z):
     N = X.shape[0]
@@ -446,7 +775,7 @@ class PriorSingletonsUpdater(object):
 
         k_old = len(singleton_idxs)
 
-        k_new = scipy.stats.poisson.rvs(model.params.alpha / model.params.N)
+        k_new = poisson_rvs(model.params.alpha / model.params.N)
 
         if (k_new == 0) and (k_old == 0):
             return model.params
@@ -475,10 +804,10 @@ class PriorSingletonsUpdater(object):
 
         if model.symmetric:
             for i in range(num_non_singletons, K_new):
-                V_new[i, i] = scipy.stats.norm.rvs(0, std)
+                V_new[i, i] = normal_rvs(0, std)
 
                 for j in range(num_non_singletons):
-                    V_new[i, j] = scipy.stats.norm.rvs(0, std)
+                    V_new[i, j] = normal_rvs(0, std)
 
                     V_new[j, i] = V_new[i, j]
 
@@ -487,10 +816,10 @@ class PriorSingletonsUpdater(object):
         else:
             for i in range(num_non_singletons, K_new):
                 for j in range(K_new):
-                    V_new[i, j] = scipy.stats.norm.rvs(0, std)
+                    V_new[i, j] = normal_rvs(0, std)
 
                     if i != j:
-                        V_new[j, i] = scipy.stats.norm.rvs(0, std)
+                        V_new[j, i] = normal_rvs(0, std)
 
         for i in range(num_non_singletons):
             assert np.all(
@@ -1,30 +1,65 @@
+from collections import namedtuple
+
+import bisect
 import numba
 import numpy as np
 import scipy.linalg
-import scipy.stats
 
 from pgfa.math_utils import do_metropolis_hastings_accept_reject
+from pgfa.stats import (
+    gamma_log_pdf, gamma_rvs, isotropic_normal_log_pdf, matrix_normal_rvs, normal_rvs_array, poisson_rvs, sum_of_squares
+)
 
 import pgfa.models.base
 
 
-def get_model(data, K=None):
+def get_model(data, K=None, sufficient_statistics=False):
     if K is None:
         feat_alloc_dist = pgfa.feature_allocation_distributions.IndianBuffetProcessDistribution()
 
     else:
         feat_alloc_dist = pgfa.feature_allocation_distributions.BetaBernoulliFeatureAllocationDistribution(K)
 
-    return Model(data, feat_alloc_dist)
+    return Model(data, feat_alloc_dist, sufficient_statistics=sufficient_statistics)
 
 
-def simulate_data(params, prop_missing=0):
-    data_true = scipy.stats.matrix_normal.rvs(
-        mean=params.Z @ params.V,
-        rowcov=(1 / params.tau_x) * np.eye(params.N),
-        colcov=np.eye(params.D)
+def pack_data(data):
+    """ Build the missing data structure of a data set once so kernels do not need to check for NaNs.
+
+    Parameters
+    ----------
+    data: (ndarray) Array of shape (N, D) with missing values as NaN.
+
+    Returns
+    -------
+    packed: (PackedData) Data with missing values replaced by zero, a float mask of observed entries, the number of
+        observed entries in total and per row, and for each column the indices and values of its observed rows.
+    """
+    observed = ~np.isnan(data)
+
+    X = np.where(observed, data, 0.0)
+
+    col_rows = tuple(np.flatnonzero(observed[:, d]) for d in range(data.shape[1]))
+
+    col_X = tuple(X[rows, d] for d, rows in enumerate(col_rows))
+
+    return PackedData(
+        X,
+        observed.astype(np.float64),
+        int(np.sum(observed)),
+        np.sum(observed, axis=1).astype(np.int64),
+        col_rows,
+        col_X,
+        bool(np.all(observed))
     )
 
+
+PackedData = namedtuple('PackedData', ['X', 'mask', 'num_obs', 'row_num_obs', 'col_rows', 'col_X', 'complete'])
+
+
+def simulate_data(params, prop_missing=0):
+    data_true = matrix_normal_rvs(params.Z @ params.V, params.tau_x)
+
     mask = np.random.uniform(0, 1, size=data_true.shape) <= prop_missing
 
     data = data_true.copy()
@@ -41,11 +76,7 @@ def simulate_params(alpha=1, tau_v=1, tau_x=1, D=1, K=None, N=100):
 
     K = Z.shape[1]
 
-    V = scipy.stats.matrix_normal.rvs(
-        mean=np.zeros((K, D)),
-        rowcov=(1 / tau_v) * np.eye(K),
-        colcov=np.eye(D)
-    )
+    V = matrix_normal_rvs(np.zeros((K, D)), tau_v)
 
     return Parameters(alpha, np.ones(2), tau_v, np.ones(2), tau_x, np.ones(2), V, Z)
 
@@ -61,17 +92,22 @@ class Model(pgfa.models.base.AbstractModel):
 
         K = Z.shape[1]
 
-        V = scipy.stats.matrix_normal.rvs(
-            mean=np.zeros((K, D)),
-            rowcov=np.eye(K),
-            colcov=np.eye(D)
-        )
+        V = matrix_normal_rvs(np.zeros((K, D)), 1.0)
 
         return Parameters(1, np.ones(2), 1, np.ones(2), 1, np.ones(2), V, Z)
 
+    def __init__(self, data, feat_alloc_dist, params=None, sufficient_statistics=False):
+        self.sufficient_statistics = sufficient_statistics
+
+        super().__init__(data, feat_alloc_dist, params=params)
+
+        self.data_dist.get_packed_data(data)
+
     def _init_joint_dist(self, feat_alloc_dist):
         self.joint_dist = pgfa.models.base.JointDistribution(
-            DataDistribution(), feat_alloc_dist, ParametersDistribution()
+            DataDistribution(sufficient_statistics=self.sufficient_statistics),
+            feat_alloc_dist,
+            ParametersDistribution()
         )
 
 
@@ -146,30 +182,51 @@ def update_V(model):
     data = model.data
     params = model.params
 
+    # Tempering the likelihood scales the data precision
     t_v = params.tau_v
-    t_x = params.tau_x
+    t_x = model.data_dist.annealing_power * params.tau_x
+
+    suff_stats = model.data_dist.get_sufficient_statistics(data, params)
+
+    if suff_stats is not None:
+        model.params.V = _sample_V(suff_stats.ZtZ, suff_stats.ZtX, t_v, t_x)
+
+        return
+
+    x = model.data_dist.get_packed_data(data)
+
     Z = params.Z.astype(np.float64)
-    X = data
+
+    # Without missing data all dimensions share the same posterior precision
+    if x.complete:
+        model.params.V = _sample_V(Z.T @ Z, Z.T @ x.X, t_v, t_x)
+
+        return
 
     D = params.D
 
     V = np.zeros(params.V.shape)
 
     for d in range(D):
-        idxs = ~np.isnan(X[:, d])
+        Z_tmp = Z[x.col_rows[d]]
 
-        X_tmp = X[idxs, d]
+        V[:, d] = _sample_V(Z_tmp.T @ Z_tmp, Z_tmp.T @ x.col_X[d], t_v, t_x)
 
-        Z_tmp = Z[idxs]
+    model.params.V = V
 
-        M = Z_tmp.T @ Z_tmp + (t_v / t_x) * np.eye(params.K)
 
-        V[:, d] = scipy.stats.multivariate_normal.rvs(
-            scipy.linalg.solve(M, Z_tmp.T @ X_tmp, assume_a='pos'),
-            (1 / t_x) * scipy.linalg.inv(M)
-        )
+def _sample_V(ZtZ, ZtX, t_v, t_x):
+    """ Sample V, or a column of V, from the Gaussian conditional given Z^T Z and Z^T X over the observed rows.
+    """
+    M = ZtZ + (t_v / t_x) * np.eye(ZtZ.shape[0])
 
-    model.params.V = V
+    L = scipy.linalg.cholesky(M, lower=True)
+
+    mean = scipy.linalg.cho_solve((L, True), ZtX)
+
+    eps = normal_rvs_array(0, 1, mean.shape)
+
+    return mean + scipy.linalg.solve_triangular(L.T, eps) / np.sqrt(t_x)
 
 
 def update_tau_v(model):
@@ -179,9 +236,9 @@ def update_tau_v(model):
 
     a = params.tau_v_prior[0] + 0.5 * params.K * params.D
 
-    b = params.tau_v_prior[1] + 0.5 * np.sum(np.square(V))
+    b = params.tau_v_prior[1] + 0.5 * sum_of_squares(V)
 
-    params.tau_v = scipy.stats.gamma.rvs(a, scale=(1 / b))
+    params.tau_v = gamma_rvs(a, b)
 
     model.params = params
 
@@ -194,15 +251,27 @@ def update_tau_x(model):
     Z = params.Z
     X = data
 
-    idxs = ~np.isnan(X)
+    suff_stats = model.data_dist.get_sufficient_statistics(data, params)
+
+    if suff_stats is None:
+        x = model.data_dist.get_packed_data(X)
 
-    Y = X - Z @ V
+        num_obs = x.num_obs
 
-    a = params.tau_x_prior[0] + 0.5 * np.sum(idxs)
+        sum_sq = _get_residual_sum_of_squares(x, V, Z)
+
+    else:
+        num_obs = suff_stats.num_obs
 
-    b = params.tau_x_prior[1] + 0.5 * np.sum(np.square(Y[idxs]))
+        sum_sq = suff_stats.get_residual_sum_of_squares(V)
 
-    params.tau_x = scipy.stats.gamma.rvs(a, scale=(1 / b))
+    power = model.data_dist.annealing_power
+
+    a = params.tau_x_prior[0] + 0.5 * power * num_obs
+
+    b = params.tau_x_prior[1] + 0.5 * power * sum_sq
+
+    params.tau_x = gamma_rvs(a, b)
 
     model.params = params
 
@@ -211,26 +280,99 @@ def update_tau_x(model):
 # Densities and proposals
 # =========================================================================
 class DataDistribution(pgfa.models.base.AbstractDataDistribution):
+    """ Gaussian likelihood of the data given the linear features.
+
+    Parameters
+    ----------
+    annealing_power: (float) Power the likelihood is raised to.
+    sufficient_statistics: (bool) Whether to maintain `SufficientStatistics` so the updates of V and tau_x do not
+        touch the raw data. Requires data without missing values.
+    """
+
+    separable_rows = True
+
+    def __init__(self, annealing_power=1.0, sufficient_statistics=False):
+        super().__init__(annealing_power=annealing_power)
+
+        self._data = None
+
+        self._packed_data = None
+
+        if sufficient_statistics:
+            self.suff_stats = SufficientStatistics()
+
+        else:
+            self.suff_stats = None
+
+    def get_packed_data(self, data):
+        """ Get the data with its missing data structure, packing it the first time it is seen.
+
+        Note: Data is identified by the object so it must not be modified in place.
+        """
+        if data is not self._data:
+            self._data = data
+
+            self._packed_data = pack_data(data)
+
+        return self._packed_data
+
+    def get_sufficient_statistics(self, data, params):
+        """ Get the sufficient statistics brought up to date with Z or None if they are not maintained.
+        """
+        if self.suff_stats is None:
+            return None
+
+        self.suff_stats.update(data, params.Z)
+
+        return self.suff_stats
 
     def _log_p(self, data, params):
         t_x = params.tau_x
 
-        V = params.V
-        Z = params.Z.astype(np.float64)
-        X = data
+        x = self.get_packed_data(data)
 
-        idxs = ~np.isnan(X)
+        log_p = 0.5 * x.num_obs * (np.log(t_x) - np.log(2 * np.pi))
 
-        resid = X - Z @ V
+        log_p -= 0.5 * t_x * _get_residual_sum_of_squares(x, params.V, params.Z)
 
-        log_p = 0.5 * np.sum(idxs) * (np.log(t_x) - np.log(2 * np.pi))
+        return log_p
 
-        log_p -= 0.5 * t_x * np.sum(np.square(resid[idxs]))
+    def _log_p_all_rows(self, data, params):
+        t_x = params.tau_x
 
-        return log_p
+        x = self.get_packed_data(data)
+
+        resid = x.X - params.Z.astype(np.float64) @ params.V
+
+        if not x.complete:
+            resid *= x.mask
+
+        return 0.5 * x.row_num_obs * (np.log(t_x) - np.log(2 * np.pi)) - 0.5 * t_x * np.sum(np.square(resid), axis=1)
 
     def _log_p_row(self, data, params, row_idx):
-        return _log_p_row(params.tau_x, data[row_idx], params.Z[row_idx].astype(float), params.V)
+        x = self.get_packed_data(data)
+
+        return _log_p_row(
+            params.tau_x,
+            x.X[row_idx],
+            x.mask[row_idx],
+            x.row_num_obs[row_idx],
+            params.Z[row_idx].astype(float),
+            params.V
+        )
+
+    def _log_p_row_flips(self, data, params, row_idx, flip_cols):
+        x = self.get_packed_data(data)
+
+        return _log_p_row_flips(
+            params.tau_x,
+            x.X[row_idx],
+            x.mask[row_idx],
+            x.row_num_obs[row_idx],
+            params.Z[row_idx].astype(float),
+            params.V,
+            np.asarray(flip_cols, dtype=np.int64)
+        )
 
 
 class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
@@ -252,48 +394,235 @@ class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
         # Gamma prior on $\alpha$
         a = params.alpha_prior[0]
         b = params.alpha_prior[1]
-        log_p += scipy.stats.gamma.logpdf(alpha, a, scale=(1 / b))
+        log_p += gamma_log_pdf(alpha, a, b)
 
         # Gamma prior on $\tau_{a}$
         a = params.tau_v_prior[0]
         b = params.tau_v_prior[1]
-        log_p += scipy.stats.gamma.logpdf(t_v, a, scale=(1 / b))
+        log_p += gamma_log_pdf(t_v, a, b)
 
         # Gamma prior on $\tau_{x}$
         a = params.tau_x_prior[0]
         b = params.tau_x_prior[1]
-        log_p += scipy.stats.gamma.logpdf(t_x, a, scale=(1 / b))
+        log_p += gamma_log_pdf(t_x, a, b)
 
         # Prior on V
-        log_p += scipy.stats.matrix_normal.logpdf(
-            V,
-            mean=np.zeros((K, D)),
-            colcov=np.eye(D),
-            rowcov=(1 / t_v) * np.eye(K)
-        )
+        log_p += isotropic_normal_log_pdf(sum_of_squares(V), K * D, t_v)
 
         return log_p
 
 
+def _get_residual_sum_of_squares(x, V, Z):
+    resid = x.X - Z.astype(np.float64) @ V
+
+    if not x.complete:
+        resid *= x.mask
+
+    return sum_of_squares(resid)
+
+
 @numba.njit(cache=True)
-def _log_p_row(t_x, x, z, V):
+def _log_p_row(t_x, x, mask, num_obs, z, V):
+    """ Log likelihood of a row with missing values set to zero and masked out.
+    """
     D = V.shape[1]
 
-    log_p = 0
-
     m = z @ V
 
+    sum_sq = 0.0
+
     for d in range(D):
-        if np.isnan(x[d]):
-            continue
+        r = mask[d] * (x[d] - m[d])
+
+        sum_sq += r * r
+
+    return 0.5 * num_obs * (np.log(t_x) - np.log(2 * np.pi)) - 0.5 * t_x * sum_sq
+
+
+@numba.njit(cache=True)
+def _log_p_row_flips(t_x, x, mask, num_obs, z, V, flip_cols):
+    """ Log likelihood of a row along a path of single entry flips, updating the row mean by +/- V[k] at each step.
+    """
+    D = V.shape[1]
+
+    z = z.copy()
+
+    m = z @ V
+
+    log_p = np.zeros(len(flip_cols) + 1)
+
+    log_norm = 0.5 * num_obs * (np.log(t_x) - np.log(2 * np.pi))
+
+    for i in range(len(flip_cols) + 1):
+        if i > 0:
+            k = flip_cols[i - 1]
+
+            if z[k] == 0:
+                m += V[k]
+
+            else:
+                m -= V[k]
+
+            z[k] = 1 - z[k]
 
-        log_p += 0.5 * (np.log(t_x) - np.log(2 * np.pi))
+        sum_sq = 0.0
 
-        log_p -= 0.5 * t_x * np.square(x[d] - m[d])
+        for d in range(D):
+            r = mask[d] * (x[d] - m[d])
+
+            sum_sq += r * r
+
+        log_p[i] = log_norm - 0.5 * t_x * sum_sq
 
     return log_p
 
 
+class SufficientStatistics(object):
+    """ Sufficient statistics Z^T Z, Z^T X and ||X||^2 of the linear Gaussian likelihood.
+
+    The statistics are updated incrementally from the rows of Z which changed since the last update, at a cost of
+    O(K^2 + KD) per changed row. When the number of features changes the columns of Z are first matched in order to
+    equal columns of the previous Z. The statistics of matched columns are sliced out of the old ones and unmatched
+    columns start from zero, so new features are built from their nonzero rows. The statistics are recomputed from
+    scratch when the data or the number of rows changes.
+    """
+
+    def __init__(self):
+        self._data = None
+
+        self._Z = None
+
+        self.num_obs = 0
+
+        self.XtX = 0.0
+
+        self.ZtX = None
+
+        self.ZtZ = None
+
+    def get_residual_sum_of_squares(self, V):
+        """ Compute ||X - Z V||^2 without touching the data.
+        """
+        sum_sq = self.XtX - 2 * np.sum(V * self.ZtX) + np.sum(V * (self.ZtZ @ V))
+
+        # Guard against round off when the fit is close to exact
+        return max(sum_sq, 0.0)
+
+    def update(self, data, Z):
+        if data is not self._data:
+            if np.any(np.isnan(data)):
+                raise Exception('Sufficient statistics can not be used with missing data.')
+
+            self._data = data
+
+            self._Z = None
+
+            self.num_obs = data.size
+
+            self.XtX = sum_of_squares(data)
+
+        if (self._Z is None) or (self._Z.shape[0] != Z.shape[0]):
+            Z_float = Z.astype(np.float64)
+
+            self.ZtZ = Z_float.T @ Z_float
+
+            self.ZtX = Z_float.T @ data
+
+            self._Z = Z.astype(np.int8)
+
+        else:
+            Z = np.asarray(Z, dtype=np.int8)
+
+            if self._Z.shape[1] != Z.shape[1]:
+                self._match_columns(Z)
+
+            _update_sufficient_statistics(data, Z, self._Z, self.ZtX, self.ZtZ)
+
+    def _match_columns(self, Z):
+        """ Reorder the statistics and the stored Z to the columns of Z.
+
+        Features are appended at the end and removed without reordering the others, so each column of Z is matched to
+        the first equal column of the stored Z after the previous match. The statistics stay exact for any matching
+        since the rows which differ are updated afterwards.
+        """
+        old_idxs = {}
+
+        for i, col in enumerate(self._Z.T):
+            old_idxs.setdefault(col.tobytes(), []).append(i)
+
+        K = Z.shape[1]
+
+        idxs = np.full(K, -1)
+
+        pos = 0
+
+        for j, col in enumerate(Z.T):
+            candidates = old_idxs.get(col.tobytes(), [])
+
+            i = bisect.bisect_left(candidates, pos)
+
+            if i < len(candidates):
+                idxs[j] = candidates[i]
+
+                pos = idxs[j] + 1
+
+        matched = np.flatnonzero(idxs >= 0)
+
+        old = idxs[matched]
+
+        Z_old = np.zeros(Z.shape, dtype=np.int8)
+
+        Z_old[:, matched] = self._Z[:, old]
+
+        ZtZ = np.zeros((K, K))
+
+        ZtZ[np.ix_(matched, matched)] = self.ZtZ[np.ix_(old, old)]
+
+        ZtX = np.zeros((K, self.ZtX.shape[1]))
+
+        ZtX[matched] = self.ZtX[old]
+
+        self._Z = Z_old
+
+        self.ZtZ = ZtZ
+
+        self.ZtX = ZtX
+
+
+@numba.njit(cache=True)
+def _update_sufficient_statistics(X, Z, Z_old, ZtX, ZtZ):
+    """ Update Z^T X and Z^T Z in place for the rows where Z differs from Z_old, then copy those rows to Z_old.
+    """
+    D = X.shape[1]
+    K = Z.shape[1]
+    N = Z.shape[0]
+
+    for n in range(N):
+        changed = False
+
+        for k in range(K):
+            if Z[n, k] != Z_old[n, k]:
+                changed = True
+
+                break
+
+        if not changed:
+            continue
+
+        for k in range(K):
+            dz = Z[n, k] - Z_old[n, k]
+
+            if dz != 0:
+                for d in range(D):
+                    ZtX[k, d] += dz * X[n, d]
+
+            for l in range(K):
+                ZtZ[k, l] += Z[n, k] * Z[n, l] - Z_old[n, k] * Z_old[n, l]
+
+        for k in range(K):
+            Z_old[n, k] = Z[n, k]
+
+
 # =========================================================================
 # Singletons updaters
 # =========================================================================
@@ -308,7 +637,7 @@ class PriorSingletonsUpdater(object):
 
         k_old = len(self._get_singleton_idxs(model.params.Z, row_idx))
 
-        k_new = scipy.stats.poisson.rvs(alpha / N)
+        k_new = poisson_rvs(alpha / N)
 
         if (k_new == 0) and (k_old == 0):
             return model.params
@@ -319,8 +648,6 @@ class PriorSingletonsUpdater(object):
 
         K_new = len(non_singleton_idxs) + k_new
 
-        params_old = model.params.copy()
-
         params_new = model.params.copy()
 
         params_new.V = np.zeros((K_new, D))
@@ -328,11 +655,7 @@ class PriorSingletonsUpdater(object):
         params_new.V[:num_non_singletons] = model.params.V[non_singleton_idxs]
 
         if k_new > 0:
-            params_new.V[num_non_singletons:] = scipy.stats.matrix_normal.rvs(
-                mean=np.zeros((k_new, D)),
-                rowcov=(1 / tau_v) * np.eye(k_new),
-                colcov=np.eye(D)
-            )
+            params_new.V[num_non_singletons:] = matrix_normal_rvs(np.zeros((k_new, D)), tau_v)
 
         params_new.Z = np.zeros((N, K_new), dtype=np.int8)
 
@@ -342,14 +665,11 @@ class PriorSingletonsUpdater(object):
 
         log_p_new = model.data_dist.log_p_row(model.data, params_new, row_idx)
 
-        log_p_old = model.data_dist.log_p_row(model.data, model.params, row_idx)
+        log_p_old = model.data_dist.log_p_row_cached(model.data, model.params, row_idx)
 
         if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, 0, 0):
             model.params = params_new
 
-        else:
-            model.params = params_old
-
     def _get_column_counts(self, Z, row_idx):
         m = np.sum(Z, axis=0)
 
@@ -451,11 +771,8 @@ class CollapsedSingletonsUpdater(object):
 
             Z_new_tmp = Z_new[idxs]
 
-            M = Z_new_tmp.T @ Z_new_tmp + (t_v / t_x) * np.eye(k)
-
-            V_new[:, d] = scipy.stats.multivariate_normal.rvs(
-                scipy.linalg.solve(M, Z_new_tmp.T @ (X[idxs, d] - Z[idxs] @ V[:, d]), assume_a='pos'),
-                (1 / t_x) * scipy.linalg.inv(M)
+            V_new[:, d] = _sample_V(
+                Z_new_tmp.T @ Z_new_tmp, Z_new_tmp.T @ (X[idxs, d] - Z[idxs] @ V[:, d]), t_v, t_x
             )
 
         return V_new
@@ -1,12 +1,14 @@
 import numba
 import numpy as np
-import scipy.stats
 
-from pgfa.math_utils import log_beta, log_factorial, log_sum_exp
+from pgfa.math_utils import log_beta, log_binomial_coefficient, log_gamma, log_sum_exp, slice_sampler
+from pgfa.stats import gamma_log_pdf, gamma_log_pdf_sum, gamma_rvs, gamma_rvs_array
 
 import pgfa.models.base
 import pgfa.models.pyclone.param_updates as param_updates
 
+from .utils import get_phi_path, pack_data
+
 
 class Model(pgfa.models.base.AbstractModel):
 
@@ -22,11 +24,11 @@ class Model(pgfa.models.base.AbstractModel):
 
         precision_prior = np.array(param_updates.get_gamma_params(400, 1000))
 
-        precision = scipy.stats.gamma.rvs(precision_prior[0], scale=(1 / precision_prior[1]))
+        precision = gamma_rvs(precision_prior[0], precision_prior[1])
 
         V_prior = param_updates.get_gamma_params(100, 100)
 
-        V = scipy.stats.gamma.rvs(V_prior[0], scale=(1 / V_prior[1]), size=(K, D))
+        V = gamma_rvs_array(V_prior[0], V_prior[1], (K, D))
 
         return Parameters(1, np.ones(2), precision, precision_prior, V, V_prior, Z)
 
@@ -39,8 +41,7 @@ class Model(pgfa.models.base.AbstractModel):
 class ModelUpdater(pgfa.models.base.AbstractModelUpdater):
 
     def _update_model_params(self, model):
-        for _ in range(20):
-            param_updates.update_precision(model)
+        update_precision(model)
 
         for _ in range(4):
             f = np.random.choice([
@@ -50,10 +51,10 @@ class ModelUpdater(pgfa.models.base.AbstractModelUpdater):
                 param_updates.update_V_perm
             ])
 
-            f(model)
+            f(model, adaptor=self.mh_adaptor)
 
         for _ in range(20):
-            param_updates.update_V_random_grid_pairwise(model, num_points=5)
+            param_updates.update_V_random_grid_pairwise(model, num_points=5, adaptor=self.mh_adaptor)
 
 
 class Parameters(pgfa.models.base.AbstractParameters):
@@ -109,16 +110,164 @@ class Parameters(pgfa.models.base.AbstractParameters):
         )
 
 
+#=========================================================================
+# Updates
+#=========================================================================
+def update_precision(model, num_iters=1, width=1.0):
+    """ Slice sampling update of the beta-binomial precision on the log scale.
+
+    Only the beta-binomial terms depend on the precision. The genotype specific success probabilities are computed
+    once, so each evaluation of the conditional density is a single compiled pass over the data which skips the
+    binomial coefficients and the prior on V.
+
+    Note: The model parameters will be updated in place.
+
+    Parameters
+    ----------
+    model: pgfa.models.pyclone.beta_binomial.Model
+    num_iters: (int) Number of slice sampling iterations.
+    width: (float) Initial width of the slice bracket for the log precision.
+    """
+    params = model.params
+
+    x = model.data_dist.get_packed_data(model.data)
+
+    Phi = params.Z @ params.F
+
+    probs = _get_genotype_probs(x.cn, x.mu, x.log_pi, x.tumour_content, Phi)
+
+    a, b = params.precision_prior
+
+    annealing_power = model.data_dist.annealing_power
+
+    def log_p_func(log_precision):
+        precision = np.exp(log_precision)
+
+        log_p = annealing_power * _log_p_precision(x.b, x.d, x.log_pi, probs, precision)
+
+        # Gamma prior and Jacobian of the log transform
+        log_p += a * log_precision - b * precision
+
+        return log_p
+
+    log_precision = np.log(params.precision)
+
+    log_p = None
+
+    for _ in range(num_iters):
+        log_precision, log_p = slice_sampler(log_p_func, log_precision, log_p_x=log_p, width=width)
+
+    params.precision = float(np.exp(log_precision))
+
+
 #=========================================================================
 # Densities and proposals
 #=========================================================================
 class DataDistribution(pgfa.models.base.AbstractDataDistribution):
 
+    separable_rows = True
+
+    def __init__(self, annealing_power=1.0):
+        super().__init__(annealing_power=annealing_power)
+
+        self._data = None
+
+        self._packed_data = None
+
+    def get_packed_data(self, data):
+        """ Get the dense array representation of the data, packing it the first time it is seen.
+        """
+        if data is not self._data:
+            self._data = data
+
+            self._packed_data = pack_data(data)
+
+        return self._packed_data
+
+    def log_p_row_pair(self, data, params, row_idx, phi_0, phi_1):
+        """ Log likelihood of a row evaluated at two sets of cellular prevalences in a single compiled call.
+
+        Returns
+        -------
+        log_p: (ndarray) Array of length two with the log likelihood for `phi_0` and `phi_1`.
+        """
+        if self.stats is not None:
+            self.stats.count_call('log_p_row_pair')
+
+        x = self.get_packed_data(data)
+
+        log_p = _log_p_row_pair(
+            x.b[row_idx], x.d[row_idx], x.cn[row_idx], x.mu[row_idx], x.log_pi[row_idx], x.tumour_content[row_idx],
+            x.log_c[row_idx], phi_0, phi_1, params.precision
+        )
+
+        return self.annealing_power * log_p
+
+    def log_p_rows(self, data, params, row_idxs, Phi):
+        """ Log likelihood of a set of rows evaluated at given cellular prevalences in a single compiled call.
+
+        Parameters
+        ----------
+        row_idxs: (ndarray) Indices of rows to evaluate. May contain repeated values.
+        Phi: (ndarray) Cellular prevalences with one row for each entry of `row_idxs`.
+
+        Returns
+        -------
+        log_p: (ndarray) Log likelihood for each entry of `row_idxs`.
+        """
+        if self.stats is not None:
+            self.stats.count_call('log_p_rows')
+
+        x = self.get_packed_data(data)
+
+        log_p = _log_p_rows(
+            x.b,
+            x.d,
+            x.cn,
+            x.mu,
+            x.log_pi,
+            x.tumour_content,
+            x.log_c,
+            np.asarray(row_idxs, dtype=np.int64),
+            Phi,
+            params.precision
+        )
+
+        return self.annealing_power * log_p
+
     def _log_p(self, data, params):
-        return _log_p(data, params.precision, params.F, params.Z.astype(float))
+        return np.sum(self._log_p_all_rows(data, params))
+
+    def _log_p_all_rows(self, data, params):
+        x = self.get_packed_data(data)
+
+        row_idxs = np.arange(params.N)
+
+        Phi = params.Z.astype(np.float64) @ params.F
+
+        return _log_p_rows(x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, row_idxs, Phi, params.precision)
 
     def _log_p_row(self, data, params, row_idx):
-        return _log_p_row(data[row_idx], params.precision, params.F, params.Z[row_idx].astype(float))
+        x = self.get_packed_data(data)
+
+        row_idxs = np.array([row_idx], dtype=np.int64)
+
+        Phi = params.Z[row_idx:row_idx + 1].astype(np.float64) @ params.F
+
+        log_p = _log_p_rows(
+            x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, row_idxs, Phi, params.precision
+        )
+
+        return log_p[0]
+
+    def _log_p_row_flips(self, data, params, row_idx, flip_cols):
+        x = self.get_packed_data(data)
+
+        Phi = get_phi_path(params.Z[row_idx].astype(np.float64), params.F, np.asarray(flip_cols, dtype=np.int64))
+
+        row_idxs = np.full(len(Phi), row_idx, dtype=np.int64)
+
+        return _log_p_rows(x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, row_idxs, Phi, params.precision)
 
 
 class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
@@ -128,67 +277,147 @@ class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
 
         # Gamma prior on $\alpha$
         a, b = params.alpha_prior
-        log_p += scipy.stats.gamma.logpdf(params.alpha, a, scale=(1 / b))
+        log_p += gamma_log_pdf(params.alpha, a, b)
 
         # Gamma prior on $v_{k d}$
         a, b = params.V_prior
-        log_p += np.sum(scipy.stats.gamma.logpdf(params.V, a, scale=(1 / b)))
+        log_p += gamma_log_pdf_sum(params.V, a, b)
 
         # Gamma prior on precision
         a, b = params.precision_prior
-        log_p += scipy.stats.gamma.logpdf(params.precision, a, scale=(1 / b))
+        log_p += gamma_log_pdf(params.precision, a, b)
 
         return log_p
 
 
-def _log_p(X, precision, F, Z):
-    N = len(X)
+@numba.njit(cache=True)
+def _log_p_row_pair(b, d, cn, mu, log_pi, t, log_c, phi_0, phi_1, precision):
+    log_p = np.zeros(2)
 
-    log_p = 0
+    for s in range(len(phi_0)):
+        log_p[0] += _log_p_sample_packed(b[s], d[s], cn[s], mu[s], log_pi[s], t[s], log_c[s], phi_0[s], precision)
 
-    for n in range(N):
-        log_p += _log_p_row(X[n], precision, F, Z[n])
+        log_p[1] += _log_p_sample_packed(b[s], d[s], cn[s], mu[s], log_pi[s], t[s], log_c[s], phi_1[s], precision)
 
     return log_p
 
 
-def _log_p_row(x, precision, F, z):
-    log_p = 0
-
-    phi = z @ F
+@numba.njit(cache=True)
+def _log_p_rows(b, d, cn, mu, log_pi, t, log_c, row_idxs, Phi, precision):
+    log_p = np.zeros(len(row_idxs))
 
-    D = len(phi)
+    for i in range(len(row_idxs)):
+        n = row_idxs[i]
 
-    for d in range(D):
-        log_p += _log_p_sample(x.sample_data_points[d], phi[d], precision)
+        for s in range(Phi.shape[1]):
+            log_p[i] += _log_p_sample_packed(
+                b[n, s], d[n, s], cn[n, s], mu[n, s], log_pi[n, s], t[n, s], log_c[n, s], Phi[i, s], precision
+            )
 
     return log_p
 
 
-@numba.njit(cache=False)
-def _log_p_sample(x, phi, precision):
-    G = len(x.log_pi)
+@numba.njit(cache=True)
+def _log_p_sample_packed(b, d, cn, mu, log_pi, t, log_c, f, precision):
+    """ Log likelihood of one sample of a data point in the packed data representation, using a streaming log-sum-exp
+    over genotypes.
+
+    The binomial coefficient is shared by all genotypes so it is precomputed and added once.
+    """
+    max_log_p = -np.inf
+
+    total = 0.0
 
-    log_p = np.zeros(G)
+    for g in range(len(log_pi)):
+        if np.isinf(log_pi[g]):
+            continue
 
-    f = phi
+        norm = (1 - t) * cn[g, 0] + t * (1 - f) * cn[g, 1] + t * f * cn[g, 2]
 
-    t = x.tumour_content
+        prob = (1 - t) * cn[g, 0] * mu[g, 0] + t * (1 - f) * cn[g, 1] * mu[g, 1] + t * f * cn[g, 2] * mu[g, 2]
 
-    for g in range(len(x.log_pi)):
-        cn_n, cn_r, cn_v = x.cn[g]
+        prob /= norm
 
-        mu_n, mu_r, mu_v = x.mu[g]
+        log_p = log_pi[g] + _log_beta_binomial_kernel(d, b, prob, precision)
 
-        norm = (1 - t) * cn_n + t * (1 - f) * cn_r + t * f * cn_v
+        if np.isinf(log_p):
+            continue
 
-        prob = (1 - t) * cn_n * mu_n + t * (1 - f) * cn_r * mu_r + t * f * cn_v * mu_v
+        if log_p > max_log_p:
+            total = total * np.exp(max_log_p - log_p) + 1
 
-        prob /= norm
+            max_log_p = log_p
 
-        log_p[g] = x.log_pi[g] + log_beta_binomial_pdf(x.d, x.b, prob, precision)
+        else:
+            total += np.exp(log_p - max_log_p)
 
-    return log_sum_exp(log_p)
+    if total == 0:
+        return -np.inf
+
+    return np.log(total) + max_log_p + log_c
+
+
+@numba.njit(cache=True)
+def _get_genotype_probs(cn, mu, log_pi, t, Phi):
+    N, D, G = log_pi.shape
+
+    probs = np.zeros((N, D, G))
+
+    for n in range(N):
+        for s in range(D):
+            f = Phi[n, s]
+
+            t_s = t[n, s]
+
+            for g in range(G):
+                if np.isinf(log_pi[n, s, g]):
+                    continue
+
+                c = cn[n, s, g]
+
+                m = mu[n, s, g]
+
+                norm = (1 - t_s) * c[0] + t_s * (1 - f) * c[1] + t_s * f * c[2]
+
+                prob = (1 - t_s) * c[0] * m[0] + t_s * (1 - f) * c[1] * m[1] + t_s * f * c[2] * m[2]
+
+                probs[n, s, g] = prob / norm
+
+    return probs
+
+
+@numba.njit(cache=True)
+def _log_p_precision(b, d, log_pi, probs, precision):
+    """ Log likelihood up to terms which do not depend on the precision.
+    """
+    N, D, G = log_pi.shape
+
+    log_p = 0.0
+
+    log_p_g = np.zeros(G)
+
+    for n in range(N):
+        for s in range(D):
+            x = b[n, s]
+
+            y = d[n, s] - x
+
+            log_norm = log_gamma(precision) - log_gamma(precision + d[n, s])
+
+            for g in range(G):
+                if np.isinf(log_pi[n, s, g]):
+                    log_p_g[g] = -np.inf
+
+                    continue
+
+                a_g, b_g = get_beta_binomial_params(probs[n, s, g], precision)
+
+                log_p_g[g] = log_pi[n, s, g] + log_norm + \
+                    log_gamma(a_g + x) - log_gamma(a_g) + log_gamma(b_g + y) - log_gamma(b_g)
+
+            log_p += log_sum_exp(log_p_g)
+
+    return log_p
 
 
 @numba.njit(cache=True)
@@ -202,11 +431,13 @@ def get_beta_binomial_params(m, s):
 
 @numba.njit(cache=True)
 def log_beta_binomial_pdf(n, x, m, s):
-    a, b = get_beta_binomial_params(m, s)
-
-    return log_binomial_coefficient(n, x) + log_beta(a + x, b + n - x) - log_beta(a, b)
+    return log_binomial_coefficient(n, x) + _log_beta_binomial_kernel(n, x, m, s)
 
 
 @numba.njit(cache=True)
-def log_binomial_coefficient(n, x):
-    return log_factorial(n) - log_factorial(x) - log_factorial(n - x)
+def _log_beta_binomial_kernel(n, x, m, s):
+    """ Beta-binomial log pdf without the binomial coefficient.
+    """
+    a, b = get_beta_binomial_params(m, s)
+
+    return log_beta(a + x, b + n - x) - log_beta(a, b)
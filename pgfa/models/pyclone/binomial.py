@@ -1,13 +1,13 @@
 import numba
 import numpy as np
-import scipy.stats
 
-from pgfa.math_utils import log_binomial_coefficient, log_sum_exp
+from pgfa.math_utils import log_binomial_coefficient
+from pgfa.stats import gamma_log_pdf, gamma_log_pdf_sum, gamma_rvs_array
 
 import pgfa.models.base
 import pgfa.models.pyclone.param_updates as param_updates
 
-from .utils import get_sample_data_point, DataPoint
+from .utils import get_phi_path, get_sample_data_point, pack_data, DataPoint
 
 
 def get_model(data, K=None):
@@ -21,6 +21,8 @@ def get_model(data, K=None):
 
 
 def simulate_data(params, eps=1e-3):
+    import scipy.stats
+
     F = params.F
 
     data = []
@@ -74,6 +76,8 @@ def simulate_data(params, eps=1e-3):
 
 
 def simulate_params(D, N, K=None, alpha=1):
+    import scipy.stats
+
     feat_alloc_dist = pgfa.feature_allocation_distributions.get_feature_allocation_distribution(K=K)
 
     Z = feat_alloc_dist.rvs(alpha, N)
@@ -99,7 +103,7 @@ class Model(pgfa.models.base.AbstractModel):
 
         V_prior = param_updates.get_gamma_params(100, 100)
 
-        V = scipy.stats.gamma.rvs(V_prior[0], scale=(1 / V_prior[1]), size=(K, D))
+        V = gamma_rvs_array(V_prior[0], V_prior[1], (K, D))
 
         return Parameters(1, np.ones(2), V, V_prior, Z)
 
@@ -120,10 +124,10 @@ class ModelUpdater(pgfa.models.base.AbstractModelUpdater):
                 param_updates.update_V_perm
             ])
 
-            f(model)
+            f(model, adaptor=self.mh_adaptor)
 
         for _ in range(20):
-            param_updates.update_V_random_grid_pairwise(model, num_points=5)
+            param_updates.update_V_random_grid_pairwise(model, num_points=5, adaptor=self.mh_adaptor)
 
 
 class Parameters(pgfa.models.base.AbstractParameters):
@@ -176,11 +180,96 @@ class Parameters(pgfa.models.base.AbstractParameters):
 #=========================================================================
 class DataDistribution(pgfa.models.base.AbstractDataDistribution):
 
+    separable_rows = True
+
+    def __init__(self, annealing_power=1.0):
+        super().__init__(annealing_power=annealing_power)
+
+        self._data = None
+
+        self._packed_data = None
+
+    def get_packed_data(self, data):
+        """ Get the dense array representation of the data, packing it the first time it is seen.
+        """
+        if data is not self._data:
+            self._data = data
+
+            self._packed_data = pack_data(data)
+
+        return self._packed_data
+
+    def log_p_row_pair(self, data, params, row_idx, phi_0, phi_1):
+        """ Log likelihood of a row evaluated at two sets of cellular prevalences in a single compiled call.
+
+        Returns
+        -------
+        log_p: (ndarray) Array of length two with the log likelihood for `phi_0` and `phi_1`.
+        """
+        if self.stats is not None:
+            self.stats.count_call('log_p_row_pair')
+
+        x = self.get_packed_data(data)
+
+        log_p = _log_p_row_pair(
+            x.b[row_idx], x.d[row_idx], x.cn[row_idx], x.mu[row_idx], x.log_pi[row_idx], x.tumour_content[row_idx],
+            x.log_c[row_idx], phi_0, phi_1
+        )
+
+        return self.annealing_power * log_p
+
+    def log_p_rows(self, data, params, row_idxs, Phi):
+        """ Log likelihood of a set of rows evaluated at given cellular prevalences in a single compiled call.
+
+        Parameters
+        ----------
+        row_idxs: (ndarray) Indices of rows to evaluate. May contain repeated values.
+        Phi: (ndarray) Cellular prevalences with one row for each entry of `row_idxs`.
+
+        Returns
+        -------
+        log_p: (ndarray) Log likelihood for each entry of `row_idxs`.
+        """
+        if self.stats is not None:
+            self.stats.count_call('log_p_rows')
+
+        x = self.get_packed_data(data)
+
+        log_p = _log_p_rows(
+            x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, np.asarray(row_idxs, dtype=np.int64), Phi
+        )
+
+        return self.annealing_power * log_p
+
     def _log_p(self, data, params):
-        return _log_p(data, params.F, params.Z.astype(float))
+        return np.sum(self._log_p_all_rows(data, params))
+
+    def _log_p_all_rows(self, data, params):
+        x = self.get_packed_data(data)
+
+        row_idxs = np.arange(params.N)
+
+        Phi = params.Z.astype(np.float64) @ params.F
+
+        return _log_p_rows(x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, row_idxs, Phi)
 
     def _log_p_row(self, data, params, row_idx):
-        return _log_p_row(data[row_idx], params.F, params.Z[row_idx].astype(float))
+        x = self.get_packed_data(data)
+
+        row_idxs = np.array([row_idx], dtype=np.int64)
+
+        Phi = params.Z[row_idx:row_idx + 1].astype(np.float64) @ params.F
+
+        return _log_p_rows(x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, row_idxs, Phi)[0]
+
+    def _log_p_row_flips(self, data, params, row_idx, flip_cols):
+        x = self.get_packed_data(data)
+
+        Phi = get_phi_path(params.Z[row_idx].astype(np.float64), params.F, np.asarray(flip_cols, dtype=np.int64))
+
+        row_idxs = np.full(len(Phi), row_idx, dtype=np.int64)
+
+        return _log_p_rows(x.b, x.d, x.cn, x.mu, x.log_pi, x.tumour_content, x.log_c, row_idxs, Phi)
 
 
 class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
@@ -190,63 +279,80 @@ class ParametersDistribution(pgfa.models.base.AbstractParametersDistribution):
 
         # Gamma prior on $\alpha$
         a, b = params.alpha_prior
-        log_p += scipy.stats.gamma.logpdf(params.alpha, a, scale=(1 / b))
+        log_p += gamma_log_pdf(params.alpha, a, b)
 
         # Gamma prior on $v_{k d}$
         a, b = params.V_prior
-        log_p += np.sum(scipy.stats.gamma.logpdf(params.V, a, scale=(1 / b)))
+        log_p += gamma_log_pdf_sum(params.V, a, b)
 
         return log_p
 
 
-def _log_p(X, F, Z):
-    N = len(X)
+@numba.njit(cache=True)
+def _log_p_row_pair(b, d, cn, mu, log_pi, t, log_c, phi_0, phi_1):
+    log_p = np.zeros(2)
 
-    log_p = 0
+    for s in range(len(phi_0)):
+        log_p[0] += _log_p_sample_packed(b[s], d[s], cn[s], mu[s], log_pi[s], t[s], log_c[s], phi_0[s])
 
-    for n in range(N):
-        log_p += _log_p_row(X[n], F, Z[n])
+        log_p[1] += _log_p_sample_packed(b[s], d[s], cn[s], mu[s], log_pi[s], t[s], log_c[s], phi_1[s])
 
     return log_p
 
 
-def _log_p_row(x, F, z):
-    log_p = 0
-
-    phi = z @ F
+@numba.njit(cache=True)
+def _log_p_rows(b, d, cn, mu, log_pi, t, log_c, row_idxs, Phi):
+    log_p = np.zeros(len(row_idxs))
 
-    D = len(phi)
+    for i in range(len(row_idxs)):
+        n = row_idxs[i]
 
-    for d in range(D):
-        log_p += _log_p_sample(x.sample_data_points[d], phi[d])
+        for s in range(Phi.shape[1]):
+            log_p[i] += _log_p_sample_packed(
+                b[n, s], d[n, s], cn[n, s], mu[n, s], log_pi[n, s], t[n, s], log_c[n, s], Phi[i, s]
+            )
 
     return log_p
 
 
-@numba.njit(cache=False)
-def _log_p_sample(x, phi):
-    G = len(x.log_pi)
+@numba.njit(cache=True)
+def _log_p_sample_packed(b, d, cn, mu, log_pi, t, log_c, f):
+    """ Log likelihood of one sample of a data point in the packed data representation, using a streaming log-sum-exp
+    over genotypes.
+
+    The binomial coefficient is shared by all genotypes so it is precomputed and added once.
+    """
+    max_log_p = -np.inf
+
+    total = 0.0
+
+    for g in range(len(log_pi)):
+        if np.isinf(log_pi[g]):
+            continue
 
-    log_p = np.zeros(G)
+        norm = (1 - t) * cn[g, 0] + t * (1 - f) * cn[g, 1] + t * f * cn[g, 2]
 
-    f = phi
+        prob = (1 - t) * cn[g, 0] * mu[g, 0] + t * (1 - f) * cn[g, 1] * mu[g, 1] + t * f * cn[g, 2] * mu[g, 2]
 
-    t = x.tumour_content
+        prob /= norm
 
-    for g in range(len(x.log_pi)):
-        cn_n, cn_r, cn_v = x.cn[g]
+        log_p = log_pi[g] + _log_binomial_kernel(d, b, prob)
 
-        mu_n, mu_r, mu_v = x.mu[g]
+        if np.isinf(log_p):
+            continue
 
-        norm = (1 - t) * cn_n + t * (1 - f) * cn_r + t * f * cn_v
+        if log_p > max_log_p:
+            total = total * np.exp(max_log_p - log_p) + 1
 
-        prob = (1 - t) * cn_n * mu_n + t * (1 - f) * cn_r * mu_r + t * f * cn_v * mu_v
+            max_log_p = log_p
 
-        prob /= norm
+        else:
+            total += np.exp(log_p - max_log_p)
 
-        log_p[g] = x.log_pi[g] + log_binomial_pdf(x.d, x.b, prob)
+    if total == 0:
+        return -np.inf
 
-    return log_sum_exp(log_p)
+    return np.log(total) + max_log_p + log_c
 
 
 @numba.njit(cache=True)
@@ -267,3 +373,25 @@ def log_binomial_pdf(n, x, p):
 
     else:
         return log_binomial_coefficient(n, x) + x * np.log(p) + (n - x) * np.log1p(-p)
+
+
+@numba.njit(cache=True)
+def _log_binomial_kernel(n, x, p):
+    """ Binomial log pdf without the binomial coefficient.
+    """
+    if p == 0:
+        if x == 0:
+            return 0
+
+        else:
+            return -np.inf
+
+    elif p == 1:
+        if x == n:
+            return 0
+
+        else:
+            return -np.inf
+
+    else:
+        return x * np.log(p) + (n - x) * np.log1p(-p)
@@ -0,0 +1,67 @@
+import numpy as np
+
+from pgfa.math_utils import discrete_rvs_gumbel_trick
+from pgfa.updates.base import FeatureAllocationMatrixUpdater
+
+
+class RowCacheGibbsUpdater(FeatureAllocationMatrixUpdater):
+    """ Gibbs updater for the PyClone models which caches the normalised feature matrix F for the sweep.
+
+    The cellular prevalences of a row are updated incrementally by +/- F[k] as entries of Z are flipped and both states
+    of an entry are scored by a single compiled call to the data distribution.
+
+    Note: The data distribution must provide a `log_p_row_pair` method.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self._F = None
+
+        self._V = None
+
+    def update(self, model):
+        self._F = None
+
+        self._V = None
+
+        super().update(model)
+
+    def update_row(self, cols, data, dist, feat_probs, params, row_idx):
+        F = self._get_F(params)
+
+        z = params.Z[row_idx]
+
+        phi = z @ F
+
+        log_p = np.zeros(2)
+
+        for k in cols:
+            phi_0 = phi - z[k] * F[k]
+
+            phi_1 = phi_0 + F[k]
+
+            log_p[:] = dist.log_p_row_pair(data, params, row_idx, phi_0, phi_1)
+
+            log_p[0] += np.log1p(-feat_probs[k])
+
+            log_p[1] += np.log(feat_probs[k])
+
+            z[k] = discrete_rvs_gumbel_trick(log_p)
+
+            if z[k] == 1:
+                phi = phi_1
+
+            else:
+                phi = phi_0
+
+        return params
+
+    def _get_F(self, params):
+        # Singletons updaters assign a new V array when they change it, so identity is enough within a sweep
+        if params.V is not self._V:
+            self._F = params.F
+
+            self._V = params.V
+
+        return self._F
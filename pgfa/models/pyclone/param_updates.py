@@ -1,38 +1,19 @@
 import numpy as np
-import scipy.stats
 
+from pgfa.adaptation import get_scale, record
 from pgfa.math_utils import discrete_rvs, do_metropolis_hastings_accept_reject, log_normalize, log_sum_exp
+from pgfa.stats import gamma_log_pdf, gamma_rvs, normal_rvs_array
 
 
-def update_precision(model, variance=1):
-    old = model.params.precision
+def update_V(model, variance=1, adaptor=None):
+    """ Metropolis-Hastings update of each entry of V with a gamma proposal centred at the current value.
 
-    a_new, b_new = get_gamma_params(old, variance)
-
-    new = scipy.stats.gamma.rvs(a_new, scale=(1 / b_new))
-
-    a_old, b_old = get_gamma_params(new, variance)
-
-    model.params.precision = new
-
-    log_p_new = model.joint_dist.log_p(model.data, model.params)
-
-    log_q_new = scipy.stats.gamma.logpdf(new, a_new, scale=(1 / b_new))
-
-    model.params.precision = old
-
-    log_p_old = model.joint_dist.log_p(model.data, model.params)
-
-    log_q_old = scipy.stats.gamma.logpdf(old, a_old, scale=(1 / b_old))
-
-    if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old):
-        model.params.precision = new
-
-    else:
-        model.params.precision = old
-
-
-def update_V(model, variance=1):
+    Parameters
+    ----------
+    model: (Model) PyClone model.
+    variance: (float) Variance of the proposal before scaling by the adaptor.
+    adaptor: (MetropolisHastingsAdaptor) Tunes the proposal standard deviation separately for each sample.
+    """
     params = model.params.copy()
 
     a_prior, b_prior = model.params.V_prior
@@ -42,41 +23,50 @@ def update_V(model, variance=1):
     Ks = np.random.permutation(model.params.K)
 
     for d in Ds:
+        variance_d = variance * get_scale(adaptor, 'V', block=int(d)) ** 2
+
         for k in Ks:
             old = params.V[k, d]
 
-            a, b = get_gamma_params(old, variance)
+            a, b = get_gamma_params(old, variance_d)
 
-            new = scipy.stats.gamma.rvs(a, scale=(1 / b))
+            new = gamma_rvs(a, b)
 
             params.V[k, d] = new
 
             log_p_new = model.data_dist.log_p(model.data, params)
 
-            log_p_new += scipy.stats.gamma.logpdf(new, a_prior, scale=(1 / b_prior))
+            log_p_new += gamma_log_pdf(new, a_prior, b_prior)
 
-            log_q_new = scipy.stats.gamma.logpdf(new, a, scale=(1 / b))
+            log_q_new = gamma_log_pdf(new, a, b)
 
-            a, b = get_gamma_params(new, variance)
+            a, b = get_gamma_params(new, variance_d)
 
             params.V[k, d] = old
 
             log_p_old = model.data_dist.log_p(model.data, params)
 
-            log_p_old += scipy.stats.gamma.logpdf(old, a_prior, scale=(1 / b_prior))
+            log_p_old += gamma_log_pdf(old, a_prior, b_prior)
+
+            log_q_old = gamma_log_pdf(old, a, b)
 
-            log_q_old = scipy.stats.gamma.logpdf(old, a, scale=(1 / b))
+            accept = do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old)
 
-            if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old):
+            if accept:
                 params.V[k, d] = new
 
             else:
                 params.V[k, d] = old
 
+            record(adaptor, 'V', accept, block=int(d))
+
+    # V was modified in place
+    params.touch()
+
     model.params = params
 
 
-def update_V_perm(model):
+def update_V_perm(model, adaptor=None):
     params = model.params.copy()
 
     for d in np.random.permutation(model.params.D):
@@ -92,16 +82,23 @@ def update_V_perm(model):
 
         log_p_old = model.data_dist.log_p(model.data, params)
 
-        if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, 0, 0):
+        accept = do_metropolis_hastings_accept_reject(log_p_new, log_p_old, 0, 0)
+
+        if accept:
             params.V[:, d] = new
 
         else:
             params.V[:, d] = old
 
+        record(adaptor, 'V_perm', accept, target_accept_rate=None)
+
+    # V was modified in place
+    params.touch()
+
     model.params = params
 
 
-def update_V_random_grid_pairwise(model, num_points=10):
+def update_V_random_grid_pairwise(model, num_points=10, adaptor=None):
     if model.params.K < 2:
         return
 
@@ -115,11 +112,11 @@ def update_V_random_grid_pairwise(model, num_points=10):
 
     dim = 2 * D
 
-    e = scipy.stats.multivariate_normal.rvs(np.zeros(dim), np.eye(dim))
+    e = normal_rvs_array(0, 1, dim)
 
     e /= np.linalg.norm(e)
 
-    r = scipy.stats.gamma.rvs(1, 1)
+    r = get_scale(adaptor, 'V_random_grid_pairwise') * (1 + gamma_rvs(1, 1))
 
     grid = np.arange(1, num_points + 1)
 
@@ -152,16 +149,23 @@ def update_V_random_grid_pairwise(model, num_points=10):
 
         log_p_old[i] = model.joint_dist.log_p(model.data, params)
 
-    if do_metropolis_hastings_accept_reject(log_sum_exp(log_p_new), log_sum_exp(log_p_old), 0, 0):
+    accept = do_metropolis_hastings_accept_reject(log_sum_exp(log_p_new), log_sum_exp(log_p_old), 0, 0)
+
+    if accept:
         params.V[[ka, kb]] = new.reshape((2, D))
 
     else:
         params.V[[ka, kb]] = old.reshape((2, D))
 
+    record(adaptor, 'V_random_grid_pairwise', accept, target_accept_rate=0.234)
+
+    # V was modified in place
+    params.touch()
+
     model.params = params
 
 
-def update_V_random_grid(model, num_points=10):
+def update_V_random_grid(model, num_points=10, adaptor=None):
     if model.params.K < 2:
         return
 
@@ -173,11 +177,11 @@ def update_V_random_grid(model, num_points=10):
 
     dim = K * D
 
-    e = scipy.stats.multivariate_normal.rvs(np.zeros(dim), np.eye(dim))
+    e = normal_rvs_array(0, 1, dim)
 
     e /= np.linalg.norm(e)
 
-    r = scipy.stats.gamma.rvs(1, 1)
+    r = get_scale(adaptor, 'V_random_grid') * (1 + gamma_rvs(1, 1))
 
     grid = np.arange(1, num_points + 1)
 
@@ -203,18 +207,27 @@ def update_V_random_grid(model, num_points=10):
 
         log_p_old[i] = model.joint_dist.log_p(model.data, params)
 
-    if do_metropolis_hastings_accept_reject(log_sum_exp(log_p_new), log_sum_exp(log_p_old), 0, 0):
+    accept = do_metropolis_hastings_accept_reject(log_sum_exp(log_p_new), log_sum_exp(log_p_old), 0, 0)
+
+    if accept:
         params.V = new.reshape((K, D))
 
     else:
         params.V = old.reshape((K, D))
 
+    record(adaptor, 'V_random_grid', accept, target_accept_rate=0.234)
+
+    # V was modified in place
+    params.touch()
+
     model.params = params
 
 
-def update_V_block(model, variance=1):
+def update_V_block(model, variance=1, adaptor=None):
     params = model.params.copy()
 
+    variance = variance * get_scale(adaptor, 'V_block') ** 2
+
     a_prior, b_prior = model.params.V_prior
 
     for k in np.random.permutation(model.params.K):
@@ -233,17 +246,17 @@ def update_V_block(model, variance=1):
         for d in range(model.params.D):
             a, b = get_gamma_params(old[d], variance)
 
-            new[d] = scipy.stats.gamma.rvs(a, scale=(1 / b))
+            new[d] = gamma_rvs(a, b)
 
-            log_p_new += scipy.stats.gamma.logpdf(new[d], a_prior, scale=(1 / b_prior))
+            log_p_new += gamma_log_pdf(new[d], a_prior, b_prior)
 
-            log_q_new += scipy.stats.gamma.logpdf(new[d], a, scale=(1 / b))
+            log_q_new += gamma_log_pdf(new[d], a, b)
 
             a, b = get_gamma_params(new[d], variance)
 
-            log_p_old += scipy.stats.gamma.logpdf(old[d], a_prior, scale=(1 / b_prior))
+            log_p_old += gamma_log_pdf(old[d], a_prior, b_prior)
 
-            log_q_old += scipy.stats.gamma.logpdf(old[d], a, scale=(1 / b))
+            log_q_old += gamma_log_pdf(old[d], a, b)
 
         params.V[k] = new
 
@@ -253,21 +266,30 @@ def update_V_block(model, variance=1):
 
         log_p_old += model.data_dist.log_p(model.data, params)
 
-        if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old):
+        accept = do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old)
+
+        if accept:
             params.V[k] = new
 
         else:
             params.V[k] = old
 
+        record(adaptor, 'V_block', accept, target_accept_rate=0.234)
+
+    # V was modified in place
+    params.touch()
+
     model.params = params
 
 
-def update_V_block_dim(model, variance=1):
+def update_V_block_dim(model, variance=1, adaptor=None):
     params = model.params.copy()
 
     a_prior, b_prior = model.params.V_prior
 
     for d in np.random.permutation(model.params.D):
+        variance_d = variance * get_scale(adaptor, 'V_block_dim', block=int(d)) ** 2
+
         old = params.V[:, d].copy()
 
         new = np.zeros(params.K)
@@ -281,19 +303,19 @@ def update_V_block_dim(model, variance=1):
         log_q_old = 0
 
         for k in range(model.params.K):
-            a, b = get_gamma_params(old[k], variance)
+            a, b = get_gamma_params(old[k], variance_d)
 
-            new[k] = scipy.stats.gamma.rvs(a, scale=(1 / b))
+            new[k] = gamma_rvs(a, b)
 
-            log_p_new += scipy.stats.gamma.logpdf(new[k], a_prior, scale=(1 / b_prior))
+            log_p_new += gamma_log_pdf(new[k], a_prior, b_prior)
 
-            log_q_new += scipy.stats.gamma.logpdf(new[k], a, scale=(1 / b))
+            log_q_new += gamma_log_pdf(new[k], a, b)
 
-            a, b = get_gamma_params(new[k], variance)
+            a, b = get_gamma_params(new[k], variance_d)
 
-            log_p_old += scipy.stats.gamma.logpdf(old[k], a_prior, scale=(1 / b_prior))
+            log_p_old += gamma_log_pdf(old[k], a_prior, b_prior)
 
-            log_q_old += scipy.stats.gamma.logpdf(old[k], a, scale=(1 / b))
+            log_q_old += gamma_log_pdf(old[k], a, b)
 
         params.V[:, d] = new
 
@@ -303,12 +325,19 @@ def update_V_block_dim(model, variance=1):
 
         log_p_old += model.data_dist.log_p(model.data, params)
 
-        if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old):
+        accept = do_metropolis_hastings_accept_reject(log_p_new, log_p_old, log_q_new, log_q_old)
+
+        if accept:
             params.V[:, d] = new
 
         else:
             params.V[:, d] = old
 
+        record(adaptor, 'V_block_dim', accept, block=int(d), target_accept_rate=0.234)
+
+    # V was modified in place
+    params.touch()
+
     model.params = params
 
 
@@ -1,58 +1,113 @@
+import numba
 import numpy as np
-import scipy.stats
 
-from pgfa.math_utils import discrete_rvs, do_metropolis_hastings_accept_reject, log_normalize
+from pgfa.math_utils import do_metropolis_hastings_accept_reject, log_normalize
+from pgfa.stats import gamma_log_pdf_sum, gamma_rvs_array
 
 
 class PriorSingletonsUpdater(object):
+    """ Propose new singleton features for a row from the prior.
+
+    Rows other than `row_idx` have no entries in the singleton columns, so their cellular prevalences only change
+    through the column sums of V used to normalise F. The likelihood of the proposal is computed by rescaling the
+    unnormalised prevalences of each row, and the parameters are only modified if the proposal is accepted.
+    """
 
     def update_row(self, model, row_idx):
-        alpha = model.params.alpha
+        params = model.params
 
-        D = model.params.D
-        N = model.params.N
+        V = params.V
+        Z = params.Z
+
+        D = params.D
+        N = params.N
+
+        m = self._get_column_counts(Z, row_idx)
+
+        singleton_idxs = np.flatnonzero(m == 0)
 
-        k_old = len(self._get_singleton_idxs(model.params.Z, row_idx))
+        k_old = len(singleton_idxs)
 
-        k_new = scipy.stats.poisson.rvs(alpha / N)
+        k_new = np.random.poisson(params.alpha / N)
 
         if (k_new == 0) and (k_old == 0):
             return model.params
 
-        non_singleton_idxs = self._get_non_singleton_idxs(model.params.Z, row_idx)
+        a, b = params.V_prior
 
-        num_non_singletons = len(non_singleton_idxs)
+        V_singletons = gamma_rvs_array(a, b, (k_new, D))
 
-        K_new = len(non_singleton_idxs) + k_new
+        non_singleton_idxs = np.flatnonzero(m > 0)
 
-        params_old = model.params.copy()
+        U = Z[:, non_singleton_idxs] @ V[non_singleton_idxs]
 
-        params_new = model.params.copy()
+        V_sum_old = np.sum(V, axis=0)
 
-        params_new.V = np.zeros((K_new, D))
+        V_sum_new = np.sum(V[non_singleton_idxs], axis=0) + np.sum(V_singletons, axis=0)
 
-        params_new.V[:num_non_singletons] = model.params.V[non_singleton_idxs]
+        Phi_old = U / V_sum_old
 
-        if k_new > 0:
-            a, b = model.params.V_prior
+        Phi_old[row_idx] += (Z[row_idx, singleton_idxs] @ V[singleton_idxs]) / V_sum_old
 
-            params_new.V[num_non_singletons:] = scipy.stats.gamma.rvs(a, scale=(1 / b), size=(k_new, model.params.D))
+        Phi_new = U / V_sum_new
 
-        params_new.Z = np.zeros((N, K_new), dtype=np.int8)
+        Phi_new[row_idx] += np.sum(V_singletons, axis=0) / V_sum_new
 
-        params_new.Z[:, :num_non_singletons] = model.params.Z[:, non_singleton_idxs]
+        row_idxs = np.arange(N)
 
-        params_new.Z[row_idx, num_non_singletons:] = 1
+        log_p = model.data_dist.log_p_rows(
+            model.data, params, np.concatenate([row_idxs, row_idxs]), np.row_stack([Phi_old, Phi_new])
+        )
 
-        log_p_new = model.data_dist.log_p(model.data, params_new)
+        log_p_old = np.sum(log_p[:N])
 
-        log_p_old = model.data_dist.log_p(model.data, model.params)
+        log_p_new = np.sum(log_p[N:])
 
         if do_metropolis_hastings_accept_reject(log_p_new, log_p_old, 0, 0):
-            model.params = params_new
+            self._set_singletons(params, row_idx, singleton_idxs, V_singletons)
 
-        else:
-            model.params = params_old
+        return model.params
+
+    def _set_singletons(self, params, row_idx, singleton_idxs, V_singletons):
+        """ Replace the singleton columns of a row, reusing existing columns of Z where possible.
+
+        Note: A new V array is always assigned so caches keyed on the identity of V are invalidated.
+        """
+        k_old = len(singleton_idxs)
+
+        k_new = V_singletons.shape[0]
+
+        num_reused = min(k_old, k_new)
+
+        reused_idxs = singleton_idxs[:num_reused]
+
+        V = params.V.copy()
+
+        Z = params.Z
+
+        V[reused_idxs] = V_singletons[:num_reused]
+
+        Z[row_idx, reused_idxs] = 1
+
+        if k_old > k_new:
+            drop_idxs = singleton_idxs[num_reused:]
+
+            V = np.delete(V, drop_idxs, axis=0)
+
+            Z = np.delete(Z, drop_idxs, axis=1)
+
+        elif k_new > k_old:
+            Z_singletons = np.zeros((params.N, k_new - num_reused), dtype=Z.dtype)
+
+            Z_singletons[row_idx] = 1
+
+            V = np.row_stack([V, V_singletons[num_reused:]])
+
+            Z = np.column_stack([Z, Z_singletons])
+
+        params.V = V
+
+        params.Z = Z
 
     def _get_column_counts(self, Z, row_idx):
         m = np.sum(Z, axis=0)
@@ -61,231 +116,403 @@ class PriorSingletonsUpdater(object):
 
         return m
 
-    def _get_non_singleton_idxs(self, Z, row_idx):
-        m = self._get_column_counts(Z, row_idx)
-
-        return np.atleast_1d(np.squeeze(np.where(m > 0)))
 
-    def _get_singleton_idxs(self, Z, row_idx):
-        m = self._get_column_counts(Z, row_idx)
+class SplitMergeUpdater(object):
+    """ Restricted split merge updater for the PyClone models.
 
-        return np.atleast_1d(np.squeeze(np.where(m == 0)))
+    Splitting or merging a pair of features leaves the column sums of V unchanged, so F only changes in the affected
+    columns and only rows allocated to them change likelihood. Each proposal is scored from the likelihoods of the
+    affected rows in the three possible states (first feature, second feature, both).
 
+    Proposals which share no rows or features with earlier proposals in the batch are scored against the same state.
+    Their likelihoods are computed with one batched compiled call and Z and V are restructured once per batch. This is
+    equivalent to applying the proposals one after the other.
 
-class SplitMergeUpdater(object):
+    Parameters
+    ----------
+    annealing_factor: (float) Power applied to the proposal densities.
+    num_proposals: (int) Number of split merge proposals per call to `update`.
+    """
 
-    def __init__(self, annealing_factor=1):
+    def __init__(self, annealing_factor=1, num_proposals=1):
         self.annealing_factor = annealing_factor
 
+        self.num_proposals = num_proposals
+
     def update(self, model):
-        anchors = np.random.choice(model.params.N, replace=False, size=2)
+        N = model.params.N
+
+        batch = []
+
+        used_rows = np.zeros(N, dtype=bool)
+
+        for _ in range(self.num_proposals):
+            anchors = np.random.choice(N, replace=False, size=2)
+
+            if np.any(used_rows[anchors]):
+                self._update_batch(batch, model)
+
+                batch = []
+
+                used_rows[:] = False
+
+            Z = model.params.Z
+
+            if (np.sum(Z[anchors[0]]) == 0) or (np.sum(Z[anchors[1]]) == 0):
+                continue
+
+            features = self._select_features(anchors, Z)
+
+            active_rows = self._get_active_rows(features, Z)
+
+            if np.any(used_rows[active_rows]):
+                self._update_batch(batch, model)
+
+                batch = []
+
+                used_rows[:] = False
+
+                Z = model.params.Z
+
+                features = self._select_features(anchors, Z)
+
+                active_rows = self._get_active_rows(features, Z)
+
+            batch.append((anchors, features, active_rows))
+
+            used_rows[active_rows] = True
+
+        self._update_batch(batch, model)
+
+    def _get_active_rows(self, features, Z):
+        k_a, k_b = features
+
+        return np.flatnonzero((Z[:, k_a] == 1) | (Z[:, k_b] == 1))
+
+    def _select_features(self, anchors, Z):
+        # The reverse move selects the same pair with the same probability so the selection terms cancel
+        i, j = anchors
+
+        k_a = np.random.choice(np.flatnonzero(Z[i] == 1))
+
+        k_b = np.random.choice(np.flatnonzero(Z[j] == 1))
 
-        if (np.sum(model.params.Z[anchors[0]]) == 0) or ((np.sum(model.params.Z[anchors[1]]) == 0)):
+        return np.array([k_a, k_b])
+
+    def _update_batch(self, batch, model):
+        if len(batch) == 0:
             return
 
-        features, log_q_feature_fwd = self._select_features(anchors, model.params.Z)
+        params = model.params
 
-        if features[0] == features[1]:
-            V_new, Z_new, log_q_sm_fwd = self._propose_split(anchors, features, model, model.params.V, model.params.Z)
+        F = params.F
 
-            _, log_q_feature_rev = self._select_features(anchors, Z_new)
+        V = params.V
 
-            K_new = Z_new.shape[1]
+        Z = params.Z
 
-            _, _, log_q_sm_rev = self._propose_merge(anchors, np.array([K_new - 2, K_new - 1]), V_new, Z_new)
+        # Build the prevalences of the affected rows in the three states for every proposal
+        proposals = []
 
-        else:
-            V_new, Z_new, log_q_sm_fwd = self._propose_merge(anchors, features, model.params.V, model.params.Z)
+        row_idxs = []
 
-            _, log_q_feature_rev = self._select_features(anchors, Z_new)
+        Phi = []
 
-            K_new = Z_new.shape[1]
+        for anchors, features, active_rows in batch:
+            k_a, k_b = features
 
-            _, _, log_q_sm_rev = self._propose_split(anchors, np.array([K_new - 1, K_new - 1]), model, V_new, Z_new, Z_target=model.params.Z[:, features])
+            Z_active = Z[active_rows]
 
-        params_fwd = model.params.copy()
+            phi_base = Z_active @ F - Z_active[:, [k_a]] * F[k_a]
 
-        params_fwd.V = V_new
+            if k_a == k_b:
+                weight = np.random.random(params.D)
 
-        params_fwd.Z = Z_new
+                F_a = weight * F[k_a]
 
-        log_p_fwd = model.joint_dist.log_p(model.data, params_fwd)
+                F_b = (1 - weight) * F[k_a]
 
-        params_rev = model.params
+            else:
+                weight = None
 
-        log_p_rev = model.joint_dist.log_p(model.data, params_rev)
+                phi_base -= Z_active[:, [k_b]] * F[k_b]
 
-        if do_metropolis_hastings_accept_reject(log_p_fwd, log_p_rev, self.annealing_factor * (log_q_feature_fwd + log_q_sm_fwd), self.annealing_factor * (log_q_feature_rev + log_q_sm_rev)):
-            model.params = params_fwd
+                F_a = F[k_a]
 
-        else:
-            model.params = params_rev
+                F_b = F[k_b]
+
+            proposals.append((anchors, features, active_rows, weight))
+
+            row_idxs.extend([active_rows] * 3)
+
+            Phi.extend([phi_base + F_a, phi_base + F_b, phi_base + F_a + F_b])
+
+        log_lik = model.data_dist.log_p_rows(model.data, params, np.concatenate(row_idxs), np.row_stack(Phi))
+
+        # Accept or reject sequentially, deferring changes to the shape of Z and V until the end of the batch
+        m = np.sum(Z, axis=0)
+
+        alive = np.ones(params.K, dtype=bool)
+
+        new_V = []
+
+        new_Z = []
+
+        new_m = []
+
+        offset = 0
+
+        for anchors, features, active_rows, weight in proposals:
+            R = len(active_rows)
+
+            L = log_lik[offset:offset + 3 * R].reshape((3, R)).T
+
+            offset += 3 * R
+
+            if weight is None:
+                result = self._propose_merge(anchors, features, active_rows, L, alive, m, new_m, model)
+
+                if result is not None:
+                    k_a, k_b = features
+
+                    Z[active_rows, k_a] = 1
+
+                    V[k_a] += V[k_b]
+
+                    m[k_a] = R
+
+                    alive[k_b] = False
+
+            else:
+                result = self._propose_split(anchors, features, active_rows, weight, L, alive, m, new_m, model)
+
+                if result is not None:
+                    k_m = features[0]
+
+                    z_a, z_b = result
+
+                    v_m = V[k_m].copy()
+
+                    Z[active_rows, k_m] = z_a
+
+                    V[k_m] = weight * v_m
+
+                    m[k_m] = np.sum(z_a)
+
+                    z = np.zeros(params.N, dtype=Z.dtype)
+
+                    z[active_rows] = z_b
+
+                    new_Z.append(z)
+
+                    new_V.append((1 - weight) * v_m)
+
+                    new_m.append(np.sum(z_b))
+
+        if (len(new_Z) > 0) or (not np.all(alive)):
+            params.Z = np.column_stack([Z[:, alive]] + new_Z)
+
+            params.V = np.row_stack([V[alive]] + new_V)
+
+    def _propose_merge(self, anchors, features, active_rows, L, alive, m, new_m, model):
+        i, j = anchors
 
-    def _propose_merge(self, anchors, features, V, Z):
         k_a, k_b = features
 
-        _, D = V.shape
+        Z = model.params.Z
 
-        N, K = Z.shape
+        # The reverse split places anchor i in feature a only and anchor j in feature b only
+        if (Z[i, k_b] == 1) or (Z[j, k_a] == 1):
+            return None
 
-        V_new = np.zeros((K - 1, D), dtype=V.dtype)
+        states = 2 * Z[active_rows, k_a] * Z[active_rows, k_b] + Z[active_rows, k_b] * (1 - Z[active_rows, k_a])
 
-        Z_new = np.zeros((N, K - 1), dtype=Z.dtype)
+        states = states.astype(np.int64)
 
-        idx = 0
+        is_anchor = np.isin(active_rows, anchors)
 
-        for k in range(K):
-            if k in features:
-                continue
+        order = np.random.permutation(np.flatnonzero(~is_anchor))
 
-            V_new[idx] = V[k]
+        log_q_rev = _get_split_log_q(L[order], states[order], False)
 
-            Z_new[:, idx] = Z[:, k]
+        log_p_diff = np.sum(L[:, 2]) - np.sum(L[np.arange(len(active_rows)), states])
 
-            idx += 1
+        V = model.params.V
 
-        active_set = list(set(np.atleast_1d(np.squeeze(np.where(Z[:, k_a] == 1)))) | set(np.atleast_1d(np.squeeze(np.where(Z[:, k_b] == 1)))))
+        v_a = V[k_a]
 
-        Z_new[active_set, -1] = 1
+        v_b = V[k_b]
 
-        V_new[-1] = V[k_a] + V[k_b]
+        v_m = v_a + v_b
 
-        return V_new, Z_new, 0
+        log_p_diff += self._get_log_V_prior(model, [v_m]) - self._get_log_V_prior(model, [v_a, v_b])
 
-    def _propose_split(self, anchors, features, model, V, Z, Z_target=None):
-        k_m = features[0]
+        log_p_diff -= np.sum(np.log(v_m))
+
+        m_old = self._get_counts(alive, m, new_m)
+
+        m_new = m_old.copy()
 
+        m_new[np.sum(alive[:k_a])] = len(active_rows)
+
+        m_new = np.delete(m_new, np.sum(alive[:k_b]))
+
+        log_p_diff += self._get_log_feat_alloc_prior(model, m_new) - self._get_log_feat_alloc_prior(model, m_old)
+
+        log_q_rev = self.annealing_factor * log_q_rev + self._get_log_insert_prob(m_new)
+
+        if do_metropolis_hastings_accept_reject(log_p_diff, 0, 0, log_q_rev):
+            return True
+
+        else:
+            return None
+
+    def _propose_split(self, anchors, features, active_rows, weight, L, alive, m, new_m, model):
         i, j = anchors
 
-        _, D = V.shape
+        k_m = features[0]
 
-        N, K = Z.shape
+        R = len(active_rows)
 
-        V_new = np.zeros((K + 1, D), dtype=V.dtype)
+        states = np.zeros(R, dtype=np.int64)
 
-        Z_new = np.zeros((N, K + 1), dtype=Z.dtype)
+        is_anchor = np.isin(active_rows, anchors)
 
-        idx = 0
+        states[active_rows == i] = 0
 
-        for k in range(K):
-            if k in features:
-                continue
+        states[active_rows == j] = 1
 
-            V_new[idx] = V[k]
+        order = np.random.permutation(np.flatnonzero(~is_anchor))
 
-            Z_new[:, idx] = Z[:, k]
+        sampled_states = np.zeros(len(order), dtype=np.int64)
 
-            idx += 1
+        log_q_fwd = _get_split_log_q(L[order], sampled_states, True)
 
-        weight = np.random.random(D)
+        if np.isinf(log_q_fwd):
+            return None
 
-        V_new[-1] = weight * V[k_m]
+        states[order] = sampled_states
 
-        V_new[-2] = (1 - weight) * V[k_m]
+        log_p_diff = np.sum(L[np.arange(R), states]) - np.sum(L[:, 2])
 
-        Z_new[i, -1] = 1
+        v_m = model.params.V[k_m]
 
-        Z_new[j, -2] = 1
+        v_a = weight * v_m
 
-        active_set = list(np.squeeze(np.where(Z[:, k_m] == 1)))
+        v_b = (1 - weight) * v_m
 
-        active_set.remove(i)
+        log_p_diff += self._get_log_V_prior(model, [v_a, v_b]) - self._get_log_V_prior(model, [v_m])
 
-        active_set.remove(j)
+        log_p_diff += np.sum(np.log(v_m))
 
-        np.random.shuffle(active_set)
+        z_a = (states != 1).astype(np.int8)
 
-        log_q = 0
+        z_b = (states != 0).astype(np.int8)
 
-        log_p = np.zeros(3)
+        m_old = self._get_counts(alive, m, new_m)
 
-        params = model.params.copy()
+        m_new = np.concatenate([m_old, [np.sum(z_b)]])
 
-        params.V = V_new
+        m_new[np.sum(alive[:k_m])] = np.sum(z_a)
 
-        params.Z = Z_new
+        log_p_diff += self._get_log_feat_alloc_prior(model, m_new) - self._get_log_feat_alloc_prior(model, m_old)
 
-        N_prev = 2
+        log_q_fwd = self.annealing_factor * log_q_fwd + self._get_log_insert_prob(m_old)
 
-        for idx in active_set:  # + [i, j]:
-            if idx not in [i, j]:
-                N_prev += 1
+        if do_metropolis_hastings_accept_reject(log_p_diff, 0, log_q_fwd, 0):
+            return z_a, z_b
 
-            m_a = np.sum(Z_new[:, -1])
+        else:
+            return None
 
-            m_b = np.sum(Z_new[:, -2])
+    def _get_counts(self, alive, m, new_m):
+        return np.concatenate([m[alive], np.array(new_m, dtype=m.dtype)])
 
-            params.Z[idx, -1] = 1
+    def _get_log_feat_alloc_prior(self, model, m):
+        return model.feat_alloc_dist.log_p_counts(model.params.alpha, m, model.params.N)
 
-            params.Z[idx, -2] = 0
+    def _get_log_insert_prob(self, m):
+        """ Log probability of the position of the new feature of a split of a matrix with column counts m.
 
-            log_p[0] = np.log(m_a) + np.log(N_prev - m_b) + model.data_dist.log_p_row(model.data, params, idx)
+        The split appends the new feature, but the reverse merge can remove a feature at any position. The split is
+        scored as inserting the new feature at a uniformly chosen position among the K + 1 columns, which leaves the
+        column order exchangeable.
+        """
+        return -np.log(len(m) + 1)
 
-            params.Z[idx, -1] = 0
+    def _get_log_V_prior(self, model, rows):
+        a, b = model.params.V_prior
 
-            params.Z[idx, -2] = 1
+        return np.sum([gamma_log_pdf_sum(row, a, b) for row in rows])
 
-            log_p[1] = np.log(N_prev - m_a) + np.log(m_b) + model.data_dist.log_p_row(model.data, params, idx)
 
-            params.Z[idx, -1] = 1
+@numba.njit(cache=True)
+def _get_split_log_q(log_lik, states, sample):
+    """ Sequentially allocate the non-anchor rows of a split and compute the log proposal density.
 
-            params.Z[idx, -2] = 1
+    Parameters
+    ----------
+    log_lik: (ndarray) Log likelihood of each row in allocation order in states first feature, second feature, both.
+    states: (ndarray) States of the rows. Overwritten with sampled states if `sample` is True.
+    sample: (bool) Whether to sample states or compute the density of the given ones.
 
-            log_p[2] = np.log(m_a) + np.log(m_b) + model.data_dist.log_p_row(model.data, params, idx)
+    Returns
+    -------
+    log_q: (float) Log proposal density, -inf if some row has zero likelihood in all states.
+    """
+    m_a = 1
 
-            log_p = log_normalize(log_p)
+    m_b = 1
 
-            if Z_target is None:
-                state = discrete_rvs(np.exp(log_p))
+    N_prev = 2
 
-            else:
-                if np.all(Z_target[idx] == np.array([1, 0])):
-                    state = 0
+    log_q = 0
 
-                elif np.all(Z_target[idx] == np.array([0, 1])):
-                    state = 1
+    log_p = np.zeros(3)
 
-                elif np.all(Z_target[idx] == np.array([1, 1])):
-                    state = 2
+    for r in range(log_lik.shape[0]):
+        N_prev += 1
 
-                else:
-                    raise Exception('Invalid')
+        log_p[0] = np.log(m_a) + np.log(N_prev - m_b) + log_lik[r, 0]
 
-            if state == 0:
-                Z_new[idx, -1] = 1
+        log_p[1] = np.log(N_prev - m_a) + np.log(m_b) + log_lik[r, 1]
 
-                Z_new[idx, -2] = 0
+        log_p[2] = np.log(m_a) + np.log(m_b) + log_lik[r, 2]
 
-            elif state == 1:
-                Z_new[idx, -1] = 0
+        if np.all(np.isinf(log_p)):
+            return -np.inf
 
-                Z_new[idx, -2] = 1
+        log_p = log_normalize(log_p)
 
-            elif state == 2:
-                Z_new[idx, -1] = 1
+        if sample:
+            states[r] = _inverse_cdf_rvs(np.exp(log_p))
 
-                Z_new[idx, -2] = 1
+        state = states[r]
 
-            else:
-                raise Exception('Invalid state')
+        log_q += log_p[state]
 
-            log_q += log_p[state]
+        if state != 1:
+            m_a += 1
 
-        assert Z_new is params.Z
+        if state != 0:
+            m_b += 1
 
-        return V_new, Z_new, log_q
+    return log_q
 
-    def _select_features(self, anchors, Z):
-        i, j = anchors
 
-        log_q = 0
+@numba.njit(cache=True)
+def _inverse_cdf_rvs(p):
+    """ Sample from a small normalised discrete distribution without the rounding checks of np.random.multinomial.
+    """
+    u = np.random.random()
 
-        k_a = np.random.choice(np.where(Z[i] == 1)[0])
+    idx = 0
 
-        log_q -= np.log(np.sum(Z[i]))
+    total = p[0]
 
-        k_b = np.random.choice(np.where(Z[j] == 1)[0])
+    while (u > total) and (idx < len(p) - 1):
+        idx += 1
 
-        log_q -= np.log(np.sum(Z[j]))
+        total += p[idx]
 
-        return np.array([k_a, k_b]), log_q
+    return idx
@@ -1,7 +1,9 @@
+from collections import namedtuple
+
 import numba
 import numpy as np
 
-from pgfa.math_utils import log_normalize
+from pgfa.math_utils import log_factorial, log_normalize
 
 
 def get_sample_data_point(a, b, cn_major, cn_minor, cn_normal=2, error_rate=1e-3, tumour_content=1.0):
@@ -31,30 +33,111 @@ def get_sample_data_point(a, b, cn_major, cn_minor, cn_normal=2, error_rate=1e-3
 
         log_pi.append(0)
 
-    cn = np.array(cn, dtype=np.int)
+    cn = np.array(cn, dtype=np.int64)
 
-    mu = np.array(mu, dtype=np.float)
+    mu = np.array(mu, dtype=np.float64)
 
     log_pi = log_normalize(np.array(log_pi, dtype=np.float64))
 
     return SampleDataPoint(int(a), int(b), cn, mu, log_pi, tumour_content)
 
 
+def pack_data(data):
+    """ Pack a list of DataPoint objects into dense arrays which can be passed to compiled kernels.
+
+    Genotypes are padded to the largest number of genotypes in the data set. Padded genotypes have a prior weight of
+    -inf so they do not contribute to the likelihood.
+
+    Parameters
+    ----------
+    data: (list) List of DataPoint objects.
+
+    Returns
+    -------
+    packed: (PackedData) Arrays of shape (N, D), (N, D, G), (N, D, G, 3) indexed by data point, sample and genotype.
+        Includes the log binomial coefficients `log_c` of the read counts, which do not depend on the genotype.
+    """
+    N = len(data)
+
+    D = len(data[0].sample_data_points)
+
+    G = max([len(x.log_pi) for data_point in data for x in data_point.sample_data_points])
+
+    b = np.zeros((N, D), dtype=np.int64)
+
+    d = np.zeros((N, D), dtype=np.int64)
+
+    cn = np.zeros((N, D, G, 3), dtype=np.int64)
+
+    mu = np.zeros((N, D, G, 3), dtype=np.float64)
+
+    log_pi = -np.inf * np.ones((N, D, G), dtype=np.float64)
+
+    tumour_content = np.zeros((N, D), dtype=np.float64)
+
+    for n, data_point in enumerate(data):
+        for s, x in enumerate(data_point.sample_data_points):
+            G_x = len(x.log_pi)
+
+            b[n, s] = x.b
+
+            d[n, s] = x.d
+
+            cn[n, s, :G_x] = x.cn
+
+            mu[n, s, :G_x] = x.mu
+
+            log_pi[n, s, :G_x] = x.log_pi
+
+            tumour_content[n, s] = x.tumour_content
+
+    log_c = log_factorial(d) - log_factorial(b) - log_factorial(d - b)
+
+    return PackedData(b, d, cn, mu, log_pi, tumour_content, log_c)
+
+
+PackedData = namedtuple('PackedData', ['b', 'd', 'cn', 'mu', 'log_pi', 'tumour_content', 'log_c'])
+
+
+@numba.njit(cache=True)
+def get_phi_path(z, F, flip_cols):
+    """ Cellular prevalences of a row along a path where one entry of the row is flipped at each step.
+
+    Returns
+    -------
+    Phi: (ndarray) Array with one row for the current state and one for the state after each flip.
+    """
+    z = z.copy()
+
+    Phi = np.zeros((len(flip_cols) + 1, F.shape[1]))
+
+    Phi[0] = z @ F
+
+    for i in range(len(flip_cols)):
+        k = flip_cols[i]
+
+        if z[k] == 0:
+            Phi[i + 1] = Phi[i] + F[k]
+
+        else:
+            Phi[i + 1] = Phi[i] - F[k]
+
+        z[k] = 1 - z[k]
+
+    return Phi
+
+
 class DataPoint(object):
 
     def __init__(self, sample_data_points):
         self.sample_data_points = sample_data_points
 
 
-@numba.experimental.jitclass([
-    ('b', numba.int64),
-    ('d', numba.int64),
-    ('cn', numba.int64[:, :]),
-    ('mu', numba.float64[:, :]),
-    ('log_pi', numba.float64[:]),
-    ('tumour_content', numba.float64)
-])
 class SampleDataPoint(object):
+    """ Read counts and genotype prior of a data point in one sample.
+
+    Note: Compiled code works on the dense arrays from `pack_data`, so this is a plain class which can be pickled.
+    """
 
     def __init__(self, a, b, cn, mu, log_pi, tumour_content=1.0):
         self.b = b
@@ -1,4 +1,3 @@
-import h5py
 import json
 import numpy as np
 
@@ -6,6 +5,8 @@ import numpy as np
 class TraceReader(object):
 
     def __init__(self, file_name):
+        import h5py
+
         self._fh = h5py.File(file_name, 'r')
 
         self._trace_shape_attrs = {}
@@ -66,9 +67,34 @@ class TraceReader(object):
     def N(self):
         return self._fh['N'][()]
 
+    @property
+    def update_stats(self):
+        """ Profiling stats written with the last row of the trace or None if profiling was not enabled.
+
+        Note: Only the most recent snapshot is stored, see `TraceWriter.write_row`.
+        """
+        if 'update_stats' not in self._fh.attrs:
+            return None
+
+        return json.loads(self._fh.attrs['update_stats'])
+
     def close(self):
         self._fh.close()
 
+    def get_scalar_traces(self):
+        """ Get the traces of all scalar quantities, such as log_p, K, time and scalar parameters, as 1d arrays.
+        """
+        traces = {}
+
+        for name in self._fh.keys():
+            if name in ['data', 'iter', 'D', 'N']:
+                continue
+
+            if name in ['K', 'log_p', 'time'] or len(self._trace_shape_attrs[name]) == 0:
+                traces[name] = self._fh[name][:self.num_iters]
+
+        return traces
+
     def get_iter_trace(self, idx):
         row = {}
 
@@ -103,8 +129,32 @@ class TraceReader(object):
 
 
 class TraceWriter(object):
+    """ Write the trace of a model to an HDF5 file.
+
+    Parameters
+    ----------
+    file_name: (str) Path of trace file.
+    model: (AbstractModel) Model to trace.
+    append: (bool) Whether to continue an existing trace file, for example when resuming from a checkpoint.
+    num_iters: (int) When appending, the number of rows to keep. Rows written after a checkpoint was taken are
+        overwritten. Defaults to all rows in the file.
+    """
+
+    def __init__(self, file_name, model, append=False, num_iters=None):
+        import h5py
+
+        if append:
+            self._fh = h5py.File(file_name, 'r+')
+
+            if num_iters is None:
+                num_iters = self._fh['iter'][()] + 1
+
+            self._iter = num_iters
+
+            self._max_size = self._fh['K'].shape[0]
+
+            return
 
-    def __init__(self, file_name, model):
         self._fh = h5py.File(file_name, 'w')
 
         self._iter = 0
@@ -166,11 +216,24 @@ class TraceWriter(object):
     def close(self):
         self._fh.close()
 
-    def write_row(self, model, time):
+    def write_row(self, model, time, stats=None):
+        """ Write the current state of the model.
+
+        Parameters
+        ----------
+        model: (AbstractModel) Model to write.
+        time: (float) Sampling time.
+        stats: (UpdateStats) Profiling stats from `AbstractModelUpdater.enable_profiling`.
+
+        Note: Only a single snapshot of the stats is kept in the file and each write replaces the previous one. The
+        stats are cumulative so the last snapshot covers the whole run, including runs resumed from a checkpoint as the
+        stats object is saved with the model updater. If profiling is enabled with a new stats object after resuming,
+        the snapshot only covers the updates since then.
+        """
         self._resize_if_needed()
 
         self._fh['iter'][()] = self._iter
-        
+
         self._fh['log_p'][self._iter] = model.log_p
 
         self._fh['time'][self._iter] = time
@@ -185,6 +248,9 @@ class TraceWriter(object):
 
             self._fh[name][self._iter] = p
 
+        if stats is not None:
+            self._fh.attrs['update_stats'] = json.dumps(stats.to_dict())
+
         self._iter += 1
 
     def _get_trace_shape(self, shape):
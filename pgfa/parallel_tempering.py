@@ -0,0 +1,336 @@
+import copy
+import multiprocessing
+import numpy as np
+import traceback
+
+from pgfa.utils import set_seed
+
+
+class ParallelTemperingUpdater(object):
+    """ Parallel tempering over the annealing power of the data distribution.
+
+    Chain i targets the joint distribution with the data log likelihood raised to powers[i], where powers[0] = 1 is the
+    distribution of interest. Each chain runs in its own worker process. After every round of updates swaps between
+    neighbouring chains are proposed using the untempered data log likelihood cached by each chain. Powers are swapped
+    between chains rather than states so a swap only needs the log likelihood and power of each chain. The state of the
+    cold chain is copied to the model every `sync_every` rounds and when `sync` is called, which is the only time
+    parameters are sent between processes.
+
+    If a worker raises an exception or exits the exception is raised in this process and all workers are stopped.
+
+    For the first `adapt_iters` rounds the gaps between neighbouring temperatures (1 / power) are tuned by
+    Robbins-Monro towards `target_swap_rate`. The ladder is frozen afterwards.
+
+    Note: The model updater must respect `model.data_dist.annealing_power` in all of its moves.
+
+    Parameters
+    ----------
+    model_updater: (pgfa.models.base.AbstractModelUpdater) Updater used by every chain.
+    num_chains: (int) Number of chains in the ladder.
+    powers: (array_like) Initial powers, strictly decreasing from 1. Defaults to a geometric ladder from 1 to
+        `min_power`.
+    min_power: (float) Power of the hottest chain in the default ladder.
+    adapt_iters: (int) Number of rounds during which the ladder is adapted.
+    target_swap_rate: (float) Target acceptance rate of swaps between neighbouring chains.
+    num_updates: (int) Number of model updates of each chain between swaps.
+    parallel: (bool) Whether to run each chain in a worker process. Otherwise chains are run in turn in this process.
+    sync_every: (int) Number of rounds between copies of the cold chain state to the model. Set this to the thinning
+        interval if the model is only read every few rounds.
+
+    Reference: Miasojedow, Moulines and Vihola. An adaptive parallel tempering algorithm (2013)
+    """
+
+    def __init__(
+            self,
+            model_updater,
+            num_chains=4,
+            powers=None,
+            min_power=0.01,
+            adapt_iters=1000,
+            target_swap_rate=0.234,
+            num_updates=1,
+            parallel=True,
+            sync_every=1):
+
+        if powers is None:
+            powers = np.geomspace(1, min_power, num_chains)
+
+        powers = np.array(powers, dtype=np.float64)
+
+        if (powers[0] != 1) or np.any(np.diff(powers) >= 0) or (powers[-1] <= 0):
+            raise Exception('Powers must be strictly decreasing from 1 and positive.')
+
+        self.model_updater = model_updater
+
+        self.powers = powers
+
+        self.adapt_iters = adapt_iters
+
+        self.target_swap_rate = target_swap_rate
+
+        self.num_updates = num_updates
+
+        self.parallel = parallel
+
+        self.sync_every = sync_every
+
+        self.iter = 0
+
+        self.num_swaps_accepted = np.zeros(self.num_chains - 1, dtype=np.int64)
+
+        self.num_swaps_proposed = np.zeros(self.num_chains - 1, dtype=np.int64)
+
+        self._chains = None
+
+        self._ladder = np.arange(self.num_chains)
+
+        self._log_p = np.zeros(self.num_chains)
+
+        self._log_gaps = np.log(np.diff(1 / self.powers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def num_chains(self):
+        return len(self.powers)
+
+    @property
+    def swap_rates(self):
+        """ Acceptance rate of swaps between chains at neighbouring positions in the ladder.
+        """
+        return self.num_swaps_accepted / np.maximum(self.num_swaps_proposed, 1)
+
+    def close(self):
+        if self._chains is not None:
+            for chain in self._chains:
+                chain.close()
+
+        self._chains = None
+
+    def sync(self, model):
+        """ Copy the state of the cold chain to the model.
+        """
+        if self._chains is not None:
+            model.params = self._call(lambda: self._chains[self._ladder[0]].get_params())
+
+    def update(self, model):
+        """ Update every chain, propose swaps and copy the state of the cold chain to the model every `sync_every`
+        rounds.
+
+        Note: The chains are initialised from the model on the first call. Later changes to `model.params` made outside
+        of this updater are ignored.
+        """
+        if self._chains is None:
+            self._init_chains(model)
+
+        self._call(self._update_chains)
+
+        accept_probs = self._swap()
+
+        if self.iter < self.adapt_iters:
+            self._adapt(accept_probs)
+
+        self.iter += 1
+
+        if (self.iter % self.sync_every) == 0:
+            self.sync(model)
+
+    def _adapt(self, accept_probs):
+        gamma = (self.iter + 1) ** (-0.6)
+
+        self._log_gaps += gamma * (accept_probs - self.target_swap_rate)
+
+        temperatures = 1 + np.concatenate([[0], np.cumsum(np.exp(self._log_gaps))])
+
+        self.powers = 1 / temperatures
+
+    def _call(self, func):
+        """ Call a function which communicates with the chains and stop all chains if it fails.
+        """
+        try:
+            return func()
+
+        except BaseException:
+            for chain in self._chains:
+                chain.terminate()
+
+            self._chains = None
+
+            raise
+
+    def _init_chains(self, model):
+        seeds = np.random.randint(0, 2 ** 31 - 1, size=self.num_chains)
+
+        if self.parallel:
+            ctx = multiprocessing.get_context('fork')
+
+            self._chains = [_WorkerChain(ctx, model, self.model_updater, seed) for seed in seeds]
+
+        else:
+            self._chains = [_LocalChain(model, self.model_updater) for _ in seeds]
+
+    def _swap(self):
+        accept_probs = np.zeros(self.num_chains - 1)
+
+        for pos in range(self.num_chains - 1):
+            i = self._ladder[pos]
+
+            j = self._ladder[pos + 1]
+
+            log_r = (self.powers[pos] - self.powers[pos + 1]) * (self._log_p[j] - self._log_p[i])
+
+            if np.isnan(log_r):
+                accept_probs[pos] = 0
+
+            else:
+                accept_probs[pos] = np.exp(min(0, log_r))
+
+            self.num_swaps_proposed[pos] += 1
+
+            if np.random.random() < accept_probs[pos]:
+                self._ladder[pos] = j
+
+                self._ladder[pos + 1] = i
+
+                self.num_swaps_accepted[pos] += 1
+
+        return accept_probs
+
+    def _update_chains(self):
+        for pos, chain_idx in enumerate(self._ladder):
+            self._chains[chain_idx].start_update(self.powers[pos], self.num_updates)
+
+        for chain_idx, chain in enumerate(self._chains):
+            self._log_p[chain_idx] = chain.finish_update()
+
+
+class _LocalChain(object):
+
+    def __init__(self, model, model_updater):
+        # Chains share the data
+        self.model, self.model_updater = copy.deepcopy((model, model_updater), memo={id(model.data): model.data})
+
+        self._log_p = None
+
+    def close(self):
+        pass
+
+    def finish_update(self):
+        return self._log_p
+
+    def get_params(self):
+        return self.model.params.copy()
+
+    def start_update(self, power, num_updates):
+        self._log_p = _update_chain(self.model, self.model_updater, power, num_updates)
+
+    def terminate(self):
+        pass
+
+
+class _WorkerChain(object):
+
+    def __init__(self, ctx, model, model_updater, seed, poll_interval=1.0):
+        self.poll_interval = poll_interval
+
+        self._conn, child_conn = ctx.Pipe()
+
+        # The model is inherited by the forked worker so it does not need to be pickled
+        self._process = ctx.Process(target=_run_worker, args=(child_conn, model, model_updater, seed), daemon=True)
+
+        self._process.start()
+
+        child_conn.close()
+
+    def close(self):
+        self._send(('stop',))
+
+        self._process.join(self.poll_interval)
+
+        self.terminate()
+
+    def finish_update(self):
+        return self._recv()
+
+    def get_params(self):
+        self._send(('get_params',))
+
+        return self._recv()
+
+    def start_update(self, power, num_updates):
+        self._send(('update', power, num_updates))
+
+    def terminate(self):
+        if self._process.is_alive():
+            self._process.terminate()
+
+        self._process.join()
+
+        self._conn.close()
+
+    def _recv(self):
+        """ Wait for the reply of the worker and raise if the worker failed or exited.
+        """
+        while not self._conn.poll(self.poll_interval):
+            if not self._process.is_alive():
+                break
+
+        try:
+            status, value = self._conn.recv()
+
+        except EOFError:
+            self._process.join(self.poll_interval)
+
+            raise Exception('Worker process exited with code {}.'.format(self._process.exitcode))
+
+        if status == 'error':
+            raise Exception('Worker process raised an exception:\n{}'.format(value))
+
+        return value
+
+    def _send(self, msg):
+        # If the worker has exited the reason is reported by the next call to _recv
+        try:
+            self._conn.send(msg)
+
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def _run_worker(conn, model, model_updater, seed):
+    set_seed(seed)
+
+    while True:
+        msg = conn.recv()
+
+        try:
+            if msg[0] == 'update':
+                conn.send(('ok', _update_chain(model, model_updater, msg[1], msg[2])))
+
+            elif msg[0] == 'get_params':
+                conn.send(('ok', model.params))
+
+            elif msg[0] == 'stop':
+                break
+
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+            break
+
+    conn.close()
+
+
+def _update_chain(model, model_updater, power, num_updates):
+    """ Update a chain at the given power and return the untempered data log likelihood.
+    """
+    model.data_dist.annealing_power = power
+
+    for _ in range(num_updates):
+        model_updater.update(model)
+
+    return model.data_dist.log_p_cached(model.data, model.params) / power
@@ -0,0 +1,113 @@
+""" Opt-in instrumentation of the model and feature allocation updaters.
+
+Profiling is enabled with `AbstractModelUpdater.enable_profiling`, which attaches an `UpdateStats` object to the
+updaters and the data distribution of the model. When it is disabled the updaters only check an attribute for None.
+"""
+import numpy as np
+import time
+
+PHASES = ('feat_alloc', 'singletons', 'params', 'alpha')
+
+
+class UpdateStats(object):
+    """ Time spent and likelihood evaluations made in each phase of a model update.
+
+    Phases are feature allocation row updates (feat_alloc), singletons updates (singletons), model specific parameter
+    updates (params) and alpha updates (alpha). Likelihood evaluations made outside of an update, for example when
+    writing a trace, are counted under `other`.
+
+    Parameters
+    ----------
+    row_time_bins: (array_like) Edges of the row update latency histogram in seconds. Defaults to four bins per decade
+        from 1us to 1s.
+    """
+
+    def __init__(self, row_time_bins=None):
+        if row_time_bins is None:
+            row_time_bins = np.logspace(-6, 0, 25)
+
+        self.row_time_bins = np.asarray(row_time_bins, dtype=np.float64)
+
+        self.reset()
+
+    def reset(self):
+        self.num_iters = 0
+
+        self.num_rows = 0
+
+        self.phase = None
+
+        self.time = dict((x, 0.0) for x in PHASES)
+
+        self.num_calls = dict((x, {}) for x in PHASES + ('other',))
+
+        # One bin below the first edge and one above the last
+        self.row_time_counts = np.zeros(len(self.row_time_bins) + 1, dtype=np.int64)
+
+        self.num_particles = None
+
+        self.max_particles = 0
+
+    def add_row_time(self, t):
+        self.num_rows += 1
+
+        self.row_time_counts[np.searchsorted(self.row_time_bins, t)] += 1
+
+    def add_time(self, phase, t):
+        self.time[phase] += t
+
+    def count_call(self, name):
+        counts = self.num_calls[self.phase or 'other']
+
+        counts[name] = counts.get(name, 0) + 1
+
+    def set_particles(self, num_particles, max_particles):
+        self.num_particles = num_particles
+
+        self.max_particles = max(self.max_particles, max_particles)
+
+    def to_dict(self):
+        """ Stats as a dictionary of plain Python types suitable for JSON.
+        """
+        return {
+            'num_iters': self.num_iters,
+            'num_rows': self.num_rows,
+            'time': dict(self.time),
+            'num_calls': dict((k, dict(v)) for k, v in self.num_calls.items()),
+            'row_time_bins': self.row_time_bins.tolist(),
+            'row_time_counts': self.row_time_counts.tolist(),
+            'num_particles': self.num_particles,
+            'max_particles': int(self.max_particles)
+        }
+
+
+class PhaseTimer(object):
+    """ Context manager which attributes elapsed time and likelihood calls to a phase of an `UpdateStats` object.
+
+    Does nothing if stats is None.
+    """
+
+    def __init__(self, stats, phase):
+        self.stats = stats
+
+        self.phase = phase
+
+        self._start = None
+
+        self._prev_phase = None
+
+    def __enter__(self):
+        if self.stats is not None:
+            self._prev_phase = self.stats.phase
+
+            self.stats.phase = self.phase
+
+            self._start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *args):
+        if self.stats is not None:
+            self.stats.add_time(self.phase, time.perf_counter() - self._start)
+
+            self.stats.phase = self._prev_phase
@@ -0,0 +1,281 @@
+""" Compiled densities and samplers for the distributions used by the updates.
+
+These avoid the argument checking and frozen distribution construction of scipy.stats, which dominates the cost of
+scalar calls. Gamma distributions use the shape / rate parameterisation used by the priors throughout pgfa. Normal
+distributions use the standard deviation as in scipy.stats.
+
+Densities are ufuncs so they accept scalars or arrays. Samplers return a scalar and the `_array` variants return an
+array of the given shape. Random numbers are drawn from the numba random state, see `pgfa.utils.set_seed`.
+"""
+import math
+import numba
+import numpy as np
+
+LOG_2_PI = math.log(2 * math.pi)
+
+
+# =========================================================================
+# Gamma
+# =========================================================================
+@numba.vectorize([numba.float64(numba.float64, numba.float64, numba.float64)], cache=True)
+def gamma_log_pdf(x, a, b):
+    if x < 0:
+        return -np.inf
+
+    elif x == 0:
+        if a < 1:
+            return np.inf
+
+        elif a == 1:
+            return math.log(b)
+
+        else:
+            return -np.inf
+
+    return a * math.log(b) - math.lgamma(a) + (a - 1) * math.log(x) - b * x
+
+
+@numba.njit(cache=True)
+def gamma_log_pdf_sum(X, a, b):
+    """ Sum of the gamma log densities of the entries of X without allocating a temporary array.
+    """
+    log_p = 0.0
+
+    for x in X.flat:
+        log_p += gamma_log_pdf(x, a, b)
+
+    return log_p
+
+
+@numba.njit(cache=True)
+def gamma_rvs(a, b):
+    return np.random.gamma(a, 1 / b)
+
+
+@numba.njit(cache=True)
+def gamma_rvs_array(a, b, size):
+    return np.random.gamma(a, 1 / b, size)
+
+
+# =========================================================================
+# Normal
+# =========================================================================
+@numba.vectorize([numba.float64(numba.float64, numba.float64, numba.float64)], cache=True)
+def normal_log_pdf(x, mean, std):
+    return -0.5 * LOG_2_PI - math.log(std) - 0.5 * ((x - mean) / std) ** 2
+
+
+@numba.njit(cache=True)
+def normal_rvs(mean, std):
+    return np.random.normal(mean, std)
+
+
+@numba.njit(cache=True)
+def normal_rvs_array(mean, std, size):
+    return np.random.normal(mean, std, size)
+
+
+@numba.njit(cache=True)
+def isotropic_normal_log_pdf(sum_sq, size, precision):
+    """ Joint log density of `size` independent zero mean normals with the given precision from their sum of squares.
+    """
+    return 0.5 * size * (math.log(precision) - LOG_2_PI) - 0.5 * precision * sum_sq
+
+
+# =========================================================================
+# Matrix normal
+# =========================================================================
+@numba.njit(cache=True)
+def matrix_normal_log_pdf(X, M, precision):
+    """ Log density of a matrix normal with row covariance (1 / precision) * I and identity column covariance.
+    """
+    sum_sq = 0.0
+
+    for x, m in zip(X.flat, M.flat):
+        sum_sq += (x - m) ** 2
+
+    return isotropic_normal_log_pdf(sum_sq, X.size, precision)
+
+
+@numba.njit(cache=True)
+def matrix_normal_rvs(M, precision):
+    """ Sample from a matrix normal with row covariance (1 / precision) * I and identity column covariance.
+    """
+    return M + np.random.normal(0, 1 / math.sqrt(precision), M.shape)
+
+
+# =========================================================================
+# Poisson
+# =========================================================================
+@numba.vectorize([numba.float64(numba.float64, numba.float64)], cache=True)
+def poisson_log_pmf(x, mu):
+    if (x < 0) or (x != math.floor(x)):
+        return -np.inf
+
+    elif mu == 0:
+        if x == 0:
+            return 0.0
+
+        else:
+            return -np.inf
+
+    return x * math.log(mu) - mu - math.lgamma(x + 1)
+
+
+@numba.njit(cache=True)
+def poisson_rvs(mu):
+    return np.random.poisson(mu)
+
+
+# =========================================================================
+# Polya-Gamma
+# =========================================================================
+# Truncation point of the alternating series sampler, see Polson, Scott and Windle (2013)
+PG_TRUNCATION = 0.64
+
+
+@numba.njit(cache=True)
+def polya_gamma_rvs(c):
+    """ Draw from the Polya-Gamma distribution PG(1, c) with the exact sampler of Polson, Scott and Windle (2013).
+
+    Reference: Polson, Scott and Windle. Bayesian inference for logistic models using Polya-Gamma latent variables.
+    JASA (2013)
+    """
+    z = 0.5 * abs(c)
+
+    f_z = math.pi ** 2 / 8 + 0.5 * z ** 2
+
+    p_exp = _polya_gamma_exp_mass(z, f_z)
+
+    while True:
+        # Proposal is an exponential right of the truncation point and an inverse Gaussian left of it
+        if np.random.random() < p_exp:
+            x = PG_TRUNCATION + np.random.exponential() / f_z
+
+        else:
+            x = _truncated_inverse_gaussian_rvs(z)
+
+        s = _polya_gamma_series_coef(0, x)
+
+        y = np.random.random() * s
+
+        n = 0
+
+        while True:
+            n += 1
+
+            if n % 2 == 1:
+                s -= _polya_gamma_series_coef(n, x)
+
+                if y <= s:
+                    return 0.25 * x
+
+            else:
+                s += _polya_gamma_series_coef(n, x)
+
+                if y > s:
+                    break
+
+
+@numba.njit(cache=True)
+def polya_gamma_rvs_array(c):
+    """ Draw from PG(1, c_i) for each entry of c.
+    """
+    x = np.zeros(c.shape)
+
+    for i in range(c.size):
+        x.flat[i] = polya_gamma_rvs(c.flat[i])
+
+    return x
+
+
+@numba.njit(cache=True)
+def _polya_gamma_exp_mass(z, f_z):
+    t = PG_TRUNCATION
+
+    b = math.sqrt(1 / t) * (t * z - 1)
+
+    a = -math.sqrt(1 / t) * (t * z + 1)
+
+    x_0 = math.log(f_z) + f_z * t
+
+    x_b = x_0 - z + _normal_log_cdf(b)
+
+    x_a = x_0 + z + _normal_log_cdf(a)
+
+    q_div_p = 4 / math.pi * (math.exp(x_b) + math.exp(x_a))
+
+    return 1 / (1 + q_div_p)
+
+
+@numba.njit(cache=True)
+def _polya_gamma_series_coef(n, x):
+    k = (n + 0.5) * math.pi
+
+    if x > PG_TRUNCATION:
+        return k * math.exp(-0.5 * k ** 2 * x)
+
+    elif x > 0:
+        return math.exp(-1.5 * (math.log(0.5 * math.pi) + math.log(x)) + math.log(k) - 2 * (n + 0.5) ** 2 / x)
+
+    return 0.0
+
+
+@numba.njit(cache=True)
+def _truncated_inverse_gaussian_rvs(z):
+    """ Draw from the inverse Gaussian with mean 1 / z and shape 1 truncated to (0, PG_TRUNCATION).
+    """
+    t = PG_TRUNCATION
+
+    x = t + 1
+
+    if 1 / t > z:
+        # Mean is right of the truncation point so use rejection from the truncated inverse chi-square
+        alpha = 0.0
+
+        while np.random.random() > alpha:
+            e_1 = np.random.exponential()
+
+            e_2 = np.random.exponential()
+
+            while e_1 ** 2 > 2 * e_2 / t:
+                e_1 = np.random.exponential()
+
+                e_2 = np.random.exponential()
+
+            x = t / (1 + t * e_1) ** 2
+
+            alpha = math.exp(-0.5 * z ** 2 * x)
+
+    else:
+        mu = 1 / z
+
+        while x > t:
+            y = np.random.normal() ** 2
+
+            mu_y = mu * y
+
+            x = mu + 0.5 * mu * mu_y - 0.5 * mu * math.sqrt(4 * mu_y + mu_y ** 2)
+
+            if np.random.random() > mu / (mu + x):
+                x = mu ** 2 / x
+
+    return x
+
+
+@numba.njit(cache=True)
+def _normal_log_cdf(x):
+    return math.log(0.5 * math.erfc(-x / math.sqrt(2)))
+
+
+# =========================================================================
+# Sufficient statistics
+# =========================================================================
+@numba.njit(cache=True)
+def sum_of_squares(X):
+    sum_sq = 0.0
+
+    for x in X.flat:
+        sum_sq += x * x
+
+    return sum_sq
@@ -5,15 +5,15 @@ Created on 25 Jan 2017
 '''
 import numpy as np
 
+import pgfa.models.base
 
-class MockDataDistribution(object):
-    def __init__(self):
-        pass
 
-    def log_p(self, data, params):
+class MockDataDistribution(pgfa.models.base.AbstractDataDistribution):
+
+    def _log_p(self, data, params):
         return 0
 
-    def log_p_row(self, data, params, row_idx):
+    def _log_p_row(self, data, params, row_idx):
         return 0
 
 
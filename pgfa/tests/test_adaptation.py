@@ -0,0 +1,171 @@
+import unittest
+
+import numpy as np
+
+from pgfa.adaptation import MetropolisHastingsAdaptor
+from pgfa.updates import AdaptiveMixtureUpdater, GibbsUpdater
+from pgfa.updates.mixture import get_hamming_distance
+from pgfa.utils import get_feat_alloc_updater
+
+import pgfa.models.lfrm as lfrm
+import pgfa.models.linear_gaussian as lg
+
+
+class Test(unittest.TestCase):
+
+    def test_robbins_monro(self):
+        """ Acceptance probability exp(-scale) has acceptance rate 0.44 at scale -log(0.44).
+        """
+        adaptor = MetropolisHastingsAdaptor(num_adapt_iters=1)
+
+        for _ in range(20000):
+            accept = np.random.random() < np.exp(-adaptor.get_scale('x'))
+
+            adaptor.record('x', accept, target_accept_rate=0.44)
+
+        self.assertAlmostEqual(adaptor.get_scale('x'), -np.log(0.44), delta=0.05)
+
+    def test_freeze(self):
+        adaptor = MetropolisHastingsAdaptor(num_adapt_iters=2)
+
+        for i in range(4):
+            scale = adaptor.get_scale('x', block=0)
+
+            for _ in range(10):
+                adaptor.record('x', False, block=0)
+
+            if i < 2:
+                self.assertLess(adaptor.get_scale('x', block=0), scale)
+
+            else:
+                self.assertEqual(adaptor.get_scale('x', block=0), scale)
+
+            adaptor.next_iter()
+
+        # Counts are reset when the scales are frozen
+        self.assertEqual(adaptor.get_stats()[('x', 0)]['num_proposals'], 20)
+
+        self.assertEqual(adaptor.get_stats()[('x', 0)]['accept_rate'], 0)
+
+    def test_model_updater(self):
+        params = lfrm.simulate_params(20, K=3)
+
+        data, _ = lfrm.simulate_data(params)
+
+        for V_update, move, num_proposals in [('hmc', 'V_hmc', 5), ('mh', 'V', 5 * 9)]:
+            model = lfrm.get_model(data, K=3)
+
+            adaptor = MetropolisHastingsAdaptor(num_adapt_iters=5)
+
+            model_updater = lfrm.ModelUpdater(GibbsUpdater(), mh_adaptor=adaptor, V_update=V_update)
+
+            for _ in range(10):
+                model_updater.update(model)
+
+            stats = adaptor.get_stats()
+
+            self.assertEqual(set(stats.keys()), {(move, None)})
+
+            self.assertEqual(stats[(move, None)]['num_proposals'], num_proposals)
+
+            self.assertIn(move, adaptor.format_stats())
+
+    def test_hamming_distance(self):
+        Z = np.random.randint(0, 2, size=(20, 4))
+
+        # Reordered and removed features only count the entries of unmatched features
+        self.assertEqual(get_hamming_distance(Z, Z[:, ::-1]), 0)
+
+        self.assertEqual(get_hamming_distance(Z, Z[:, [3, 1]]), np.sum(Z[:, [0, 2]]))
+
+        Z_new = Z.copy()
+
+        Z_new[0] = 1 - Z_new[0]
+
+        self.assertEqual(get_hamming_distance(Z, Z_new[:, [1, 0, 2, 3]]), 4)
+
+    def test_adaptive_mixture(self):
+        updater = AdaptiveMixtureUpdater(
+            {'flip': FlipUpdater(), 'none': NoOpUpdater()}, num_adapt_iters=10, min_prob=0.1
+        )
+
+        params = lg.simulate_params(D=2, K=2, N=10)
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.get_model(data, K=2)
+
+        for _ in range(10):
+            updater.update(model)
+
+        self.assertTrue(np.allclose(updater.probs, [0.9, 0.1]))
+
+        self.assertEqual(updater.get_stats()['flip']['distance'], updater.get_stats()['flip']['num_updates'])
+
+        # Probabilities and measurements are frozen after adaptation
+        num_updates = updater.num_updates.copy()
+
+        for _ in range(10):
+            updater.update(model)
+
+        self.assertTrue(np.all(updater.num_updates == num_updates))
+
+        self.assertTrue(np.allclose(updater.probs, [0.9, 0.1]))
+
+    def test_adaptive_feat_alloc_updater(self):
+        params = lg.simulate_params(D=2, K=2, N=20)
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.get_model(data, K=2)
+
+        feat_alloc_updater = get_feat_alloc_updater(updater='adaptive', updater_kwargs={'num_adapt_iters': 12})
+
+        model_updater = lg.ModelUpdater(feat_alloc_updater)
+
+        for _ in range(12):
+            model_updater.update(model)
+
+        self.assertEqual(set(feat_alloc_updater.get_stats().keys()), {'dpf', 'g', 'pg', 'rg'})
+
+        self.assertTrue(np.all(feat_alloc_updater.num_updates >= 2))
+
+        self.assertAlmostEqual(np.sum(feat_alloc_updater.probs), 1)
+
+
+    def test_adaptive_annealing(self):
+        """ Sub-updaters follow the annealing schedule of the mixture however often they are chosen.
+        """
+        params = lg.simulate_params(D=2, K=2, N=10)
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.get_model(data, K=2)
+
+        feat_alloc_updater = get_feat_alloc_updater(
+            annealing_iters=2, annealing_steps=5, updater='adaptive', updater_kwargs={'num_adapt_iters': 4}
+        )
+
+        for i in range(12):
+            feat_alloc_updater.update(model)
+
+            iters = [x.iter for x in feat_alloc_updater.feat_alloc_updaters.values()]
+
+            self.assertEqual(max(iters), i + 1)
+
+
+class FlipUpdater(object):
+
+    def update(self, model):
+        model.params.Z[0, 0] = 1 - model.params.Z[0, 0]
+
+
+class NoOpUpdater(object):
+
+    def update(self, model):
+        pass
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+
+import numba
+import numpy as np
+
+from pgfa.checkpoint import Checkpointer, load_checkpoint
+from pgfa.models.trace import TraceReader, TraceWriter
+from pgfa.utils import get_feat_alloc_updater, get_numba_rng_state, set_numba_rng_state, set_seed
+
+import pgfa.models.linear_gaussian as lg
+
+
+@numba.njit
+def _random_draws(n):
+    # Uniform and normal draws so the cached normal variate is included
+    x = np.zeros(2 * n)
+
+    for i in range(n):
+        x[2 * i] = np.random.random()
+
+        x[2 * i + 1] = np.random.normal()
+
+    return x
+
+
+class Test(unittest.TestCase):
+
+    def test_numba_rng_state(self):
+        """ Check the layout of the numba random state read by `get_numba_rng_state` for this version of numba.
+        """
+        set_seed(0)
+
+        _random_draws(1)
+
+        rng_state = get_numba_rng_state()
+
+        x = _random_draws(3)
+
+        set_seed(1)
+
+        set_numba_rng_state(rng_state)
+
+        np.testing.assert_array_equal(_random_draws(3), x)
+
+    def test_resume(self):
+        for updater in ['dpf', 'g', 'pg']:
+            set_seed(0)
+
+            params = lg.simulate_params(D=2, N=20)
+
+            data, _ = lg.simulate_data(params, prop_missing=0.1)
+
+            model = lg.get_model(data)
+
+            feat_alloc_updater = get_feat_alloc_updater(
+                annealing_iters=2,
+                annealing_steps=5,
+                updater=updater,
+                updater_kwargs={'singletons_updater': lg.PriorSingletonsUpdater()}
+            )
+
+            model_updater = lg.ModelUpdater(feat_alloc_updater)
+
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                file_name = os.path.join(tmp_dir, 'chain.ckpt')
+
+                checkpointer = Checkpointer(file_name, interval=5)
+
+                trace = []
+
+                for i in range(15):
+                    model_updater.update(model)
+
+                    trace.append(model.log_p)
+
+                    if i < 5:
+                        checkpointer.update(model, model_updater, i + 1)
+
+                # Change the random state to check it is restored
+                set_seed(1)
+
+                checkpoint = load_checkpoint(file_name)
+
+            self.assertEqual(checkpoint.iter, 5)
+
+            resumed_trace = trace[:5]
+
+            for _ in range(10):
+                checkpoint.model_updater.update(checkpoint.model)
+
+                resumed_trace.append(checkpoint.model.log_p)
+
+            self.assertEqual(trace, resumed_trace, msg=updater)
+
+    def test_trace_append(self):
+        params = lg.simulate_params(D=2, K=2, N=10)
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.get_model(data, K=2)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'trace.h5')
+
+            with TraceWriter(file_name, model) as writer:
+                for i in range(15):
+                    writer.write_row(model, i)
+
+            with TraceWriter(file_name, model, append=True, num_iters=12) as writer:
+                for i in range(12, 30):
+                    writer.write_row(model, i)
+
+            with TraceReader(file_name) as reader:
+                time = reader.get_scalar_traces()['time']
+
+        np.testing.assert_array_equal(time, np.arange(30))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
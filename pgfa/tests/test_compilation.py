@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+from pgfa.utils import get_numba_rng_state, set_seed
+
+import pgfa
+
+
+class Test(unittest.TestCase):
+
+    def test_rng_state_restored(self):
+        set_seed(0)
+
+        np_rng_state = np.random.get_state()
+
+        numba_rng_state = get_numba_rng_state()
+
+        summary = pgfa.compile_all()
+
+        self.assertGreater(summary['num_kernels'], 0)
+
+        self.assertTrue(np.all(np.random.get_state()[1] == np_rng_state[1]))
+
+        self.assertEqual(get_numba_rng_state(), numba_rng_state)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pgfa.models.trace import TraceWriter
+from pgfa.updates import GibbsUpdater
+
+import pgfa.diagnostics
+import pgfa.models.linear_gaussian as lg
+
+
+class Test(unittest.TestCase):
+
+    def test_ess(self):
+        for phi in [0, 0.5, 0.9]:
+            x = self._simulate_ar(phi, 4, 10000)
+
+            ess_true = x.size * (1 - phi) / (1 + phi)
+
+            self.assertLess(abs(pgfa.diagnostics.get_ess(x) / ess_true - 1), 0.2)
+
+    def test_rhat(self):
+        x = self._simulate_ar(0.5, 4, 1000)
+
+        self.assertLess(pgfa.diagnostics.get_rhat(x), 1.05)
+
+        x[0] += 5
+
+        self.assertGreater(pgfa.diagnostics.get_rhat(x), 1.1)
+
+    def test_compare_trace_files(self):
+        params = lg.simulate_params(D=2, K=2, N=20)
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.get_model(data, K=2)
+
+        model_updater = lg.ModelUpdater(GibbsUpdater())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'trace.h5')
+
+            with TraceWriter(file_name, model) as writer:
+                for i in range(50):
+                    model_updater.update(model)
+
+                    writer.write_row(model, i + 1)
+
+            report = pgfa.diagnostics.compare_trace_files({'g': [file_name]}, burnin=10)
+
+        names = set(r['name'] for r in report)
+
+        self.assertEqual(names, {'log_p', 'K', 'alpha', 'tau_v', 'tau_x'})
+
+        for r in report:
+            self.assertAlmostEqual(r['ess_per_sec'], r['ess'] / 40)
+
+    def _simulate_ar(self, phi, num_chains, num_iters):
+        x = np.zeros((num_chains, num_iters))
+
+        for i in range(1, num_iters):
+            x[:, i] = phi * x[:, i - 1] + np.random.normal(size=num_chains)
+
+        return x
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
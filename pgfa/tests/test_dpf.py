@@ -0,0 +1,96 @@
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from pgfa.math_utils import log_normalize
+from pgfa.profiling import UpdateStats
+from pgfa.updates import DiscreteParticleFilterUpdater
+from pgfa.updates.discrete_particle_filter import fearnhead_clifford_resampling, get_fearnhead_clifford_threshold
+from pgfa.utils import set_seed
+
+import pgfa.models.linear_gaussian as lg
+
+
+class Test(unittest.TestCase):
+
+    def test_threshold(self):
+        for _ in range(100):
+            M = np.random.randint(3, 50)
+
+            N = np.random.randint(1, M)
+
+            log_W = log_normalize(np.random.normal(0, 3, size=M))
+
+            log_l = get_fearnhead_clifford_threshold(log_W, N)
+
+            self.assertAlmostEqual(np.sum(np.minimum(np.exp(log_W - log_l), 1)), N)
+
+    def test_resampling(self):
+        log_W = log_normalize(np.random.normal(0, 2, size=10))
+
+        for conditional in [False, True]:
+            for _ in range(100):
+                idxs, _ = fearnhead_clifford_resampling(log_W, 4, conditional)
+
+                self.assertEqual(len(idxs), 4)
+
+                self.assertEqual(len(np.unique(idxs)), 4)
+
+                if conditional:
+                    self.assertEqual(idxs[0], 0)
+
+    def test_parent_log_lik_reuse(self):
+        """ Reusing the likelihood of the parent gives the same sampled rows with fewer likelihood evaluations.
+        """
+        set_seed(0)
+
+        params = lg.simulate_params(D=3, K=4, N=20)
+
+        data, _ = lg.simulate_data(params)
+
+        for conditional_update in [True, False]:
+            for test_path in ['conditional', 'ones', 'zeros']:
+                Zs = []
+
+                num_calls = []
+
+                for reuse in [True, False]:
+                    model = lg.get_model(data, K=4)
+
+                    model.params = params.copy()
+
+                    updater = DiscreteParticleFilterUpdater(
+                        conditional_update=conditional_update, num_particles=5, test_path=test_path
+                    )
+
+                    stats = UpdateStats()
+
+                    updater.stats = stats
+
+                    model.data_dist.stats = stats
+
+                    set_seed(1)
+
+                    if reuse:
+                        updater.update(model)
+
+                    else:
+                        with mock.patch.object(updater.row_updater, '_get_parent_log_lik', return_value=None):
+                            updater.update(model)
+
+                    Zs.append(model.params.Z.copy())
+
+                    num_calls.append(stats.num_calls['feat_alloc']['log_p_row'])
+
+                self.assertTrue(np.any(Zs[0] != params.Z))
+
+                np.testing.assert_array_equal(Zs[0], Zs[1])
+
+                self.assertLess(num_calls[0], num_calls[1])
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -95,6 +95,134 @@ class Test(unittest.TestCase):
 
             self.assertGreater(result.pvalue, 1e-2)
 
+    def test_V_hmc_update(self):
+        num_replicates = 10
+        num_samples = 100
+        num_updates = 1
+
+        ranks = np.zeros((num_replicates, 2))
+
+        feat_alloc_dist = fa.BetaBernoulliFeatureAllocationDistribution(4)
+
+        for r in range(num_replicates):
+            data, params = self._simulate(4, 2)
+
+            model = lfrm.Model(data, feat_alloc_dist, params=params.copy(), symmetric=False)
+
+            trace = np.zeros((num_samples, 2))
+
+            idx = 0
+
+            for i in range(num_samples * num_updates):
+                lfrm.update_V_hmc(model)
+
+                if i % num_updates == 0:
+                    trace[idx, 0] = np.mean(model.params.V)
+
+                    trace[idx, 1] = np.var(model.params.V)
+
+                    idx += 1
+
+            ranks[r, 0] = np.sum(trace[:, 0] < np.mean(params.V))
+
+            ranks[r, 1] = np.sum(trace[:, 1] < np.var(params.V))
+
+        for i in range(2):
+            x, _ = np.histogram(ranks[:, i], np.arange(0, 101))
+
+            result = scipy.stats.chisquare(x)
+
+            self.assertGreater(result.pvalue, 1e-2)
+
+    def test_V_pg_update(self):
+        num_replicates = 10
+        num_samples = 100
+        num_updates = 1
+
+        ranks = np.zeros((num_replicates, 2))
+
+        feat_alloc_dist = fa.BetaBernoulliFeatureAllocationDistribution(4)
+
+        for r in range(num_replicates):
+            data, params = self._simulate(4, 2)
+
+            model = lfrm.Model(data, feat_alloc_dist, params=params.copy(), symmetric=False)
+
+            trace = np.zeros((num_samples, 2))
+
+            idx = 0
+
+            for i in range(num_samples * num_updates):
+                lfrm.update_V_pg(model)
+
+                if i % num_updates == 0:
+                    trace[idx, 0] = np.mean(model.params.V)
+
+                    trace[idx, 1] = np.var(model.params.V)
+
+                    idx += 1
+
+            ranks[r, 0] = np.sum(trace[:, 0] < np.mean(params.V))
+
+            ranks[r, 1] = np.sum(trace[:, 1] < np.var(params.V))
+
+        for i in range(2):
+            x, _ = np.histogram(ranks[:, i], np.arange(0, 101))
+
+            result = scipy.stats.chisquare(x)
+
+            self.assertGreater(result.pvalue, 1e-2)
+
+    def test_V_hmc_gradient(self):
+        for symmetric in [False, True]:
+            data, params = self._simulate(3, 20)
+
+            if symmetric:
+                params.V = np.triu(params.V) + np.triu(params.V, 1).T
+
+            data[0, 1] = np.nan
+
+            X, mask = lfrm._get_observed_data(data, symmetric)
+
+            Z = params.Z.astype(np.float64)
+
+            if symmetric:
+                free_idxs = np.triu_indices(3)
+
+            else:
+                free_idxs = tuple(np.indices((3, 3)).reshape(2, -1))
+
+            def f(x):
+                V = lfrm._get_V(x, free_idxs, 3, symmetric)
+
+                return lfrm._log_p_grad_V(X, mask, V, Z, params.tau, 1.0, free_idxs, symmetric)
+
+            x = params.V[free_idxs]
+
+            log_p, grad = f(x)
+
+            model = lfrm.Model(data, None, params=params.copy(), symmetric=symmetric)
+
+            # Matches the model log density up to a constant
+            y = x + np.random.normal(0, 0.1, size=x.shape)
+
+            log_p_old = model.data_dist.log_p(data, params) + model.params_dist.log_p(params)
+
+            params.V = lfrm._get_V(y, free_idxs, 3, symmetric)
+
+            log_p_new = model.data_dist.log_p(data, params) + model.params_dist.log_p(params)
+
+            self.assertAlmostEqual(f(y)[0] - log_p, log_p_new - log_p_old)
+
+            eps = 1e-6
+
+            for i in range(len(x)):
+                e = np.zeros(len(x))
+
+                e[i] = eps
+
+                self.assertAlmostEqual((f(x + e)[0] - f(x - e)[0]) / (2 * eps), grad[i], places=4)
+
     def _log_p_true(self, data, params):
         log_p = 0
 
@@ -3,6 +3,9 @@ import unittest
 import numpy as np
 import scipy.stats
 
+from pgfa.models.base import RowLikelihoodCache
+from pgfa.profiling import UpdateStats
+
 import pgfa.models.linear_gaussian as lg
 import pgfa.feature_allocation_distributions as fa
 
@@ -36,6 +39,158 @@ class Test(unittest.TestCase):
 
             self.assertAlmostEqual(log_p_test, log_p_true)
 
+    def test_log_p_missing(self):
+        dist = lg.DataDistribution()
+
+        for _ in range(10):
+            data, params = self._simulate(10, 4, 100)
+
+            data[np.random.random(data.shape) < 0.3] = np.nan
+
+            idxs = ~np.isnan(data)
+
+            log_p_true = np.sum(
+                scipy.stats.norm.logpdf(data[idxs], (params.Z @ params.V)[idxs], 1 / np.sqrt(params.tau_x))
+            )
+
+            self.assertAlmostEqual(dist.log_p(data, params), log_p_true)
+
+            log_p_test = 0
+
+            for row_idx in range(params.N):
+                log_p_test += dist.log_p_row(data, params, row_idx)
+
+            self.assertAlmostEqual(log_p_test, log_p_true)
+
+    def test_log_p_row_flips(self):
+        dist = lg.DataDistribution()
+
+        for _ in range(10):
+            data, params = self._simulate(10, 4, 100)
+
+            data[np.random.random(data.shape) < 0.3] = np.nan
+
+            row_idx = np.random.randint(params.N)
+
+            flip_cols = np.random.randint(params.K, size=10)
+
+            log_p_test = dist.log_p_row_flips(data, params, row_idx, flip_cols)
+
+            self.assertAlmostEqual(log_p_test[0], dist.log_p_row(data, params, row_idx))
+
+            for i, k in enumerate(flip_cols):
+                params.Z[row_idx, k] = 1 - params.Z[row_idx, k]
+
+                self.assertAlmostEqual(log_p_test[i + 1], dist.log_p_row(data, params, row_idx))
+
+    def test_log_p_cached(self):
+        dist = lg.DataDistribution()
+
+        data, params = self._simulate(10, 4, 100)
+
+        for _ in range(100):
+            row_idx = np.random.randint(params.N)
+
+            params.Z[row_idx] = np.random.randint(0, 2, size=params.K)
+
+            if np.random.random() < 0.1:
+                params.tau_x = scipy.stats.gamma.rvs(1)
+
+            self.assertAlmostEqual(dist.log_p_row_cached(data, params, row_idx), dist.log_p_row(data, params, row_idx))
+
+            self.assertAlmostEqual(dist.log_p_cached(data, params), dist.log_p(data, params))
+
+    def test_log_p_cached_bulk(self):
+        dist = lg.DataDistribution()
+
+        dist.stats = UpdateStats()
+
+        data, params = self._simulate(10, 4, 100)
+
+        calls = dist.stats.num_calls['other']
+
+        # All rows are stale after a parameter update so they are refilled with a single call
+        params.tau_x = scipy.stats.gamma.rvs(1)
+
+        self.assertAlmostEqual(dist.log_p_cached(data, params), dist.log_p(data, params))
+
+        self.assertEqual(calls.get('log_p_all_rows'), 1)
+
+        self.assertNotIn('log_p_row', calls)
+
+        params.Z[0] = 1 - params.Z[0]
+
+        self.assertAlmostEqual(dist.log_p_cached(data, params), dist.log_p(data, params))
+
+        self.assertEqual(calls.get('log_p_all_rows'), 1)
+
+        self.assertEqual(calls.get('log_p_row'), 1)
+
+    def test_row_cache_infinite(self):
+        data, params = self._simulate(10, 4, 100)
+
+        cache = RowLikelihoodCache()
+
+        cache.set_all_rows(data, params, 1.0, np.zeros(params.N))
+
+        cache.set_row(data, params, 1.0, 0, -np.inf)
+
+        self.assertEqual(cache.log_p, -np.inf)
+
+        cache.set_row(data, params, 1.0, 0, -1.0)
+
+        self.assertEqual(cache.log_p, -1.0)
+
+    def test_sufficient_statistics(self):
+        dist = lg.DataDistribution(sufficient_statistics=True)
+
+        data, params = self._simulate(10, 4, 100)
+
+        for _ in range(100):
+            row_idx = np.random.randint(params.N)
+
+            params.Z[row_idx] = np.random.randint(0, 2, size=params.K)
+
+            suff_stats = dist.get_sufficient_statistics(data, params)
+
+            Z = params.Z.astype(float)
+
+            np.testing.assert_allclose(suff_stats.ZtZ, Z.T @ Z)
+
+            np.testing.assert_allclose(suff_stats.ZtX, Z.T @ data)
+
+            self.assertAlmostEqual(
+                suff_stats.get_residual_sum_of_squares(params.V), np.sum(np.square(data - Z @ params.V))
+            )
+
+    def test_sufficient_statistics_num_features(self):
+        dist = lg.DataDistribution(sufficient_statistics=True)
+
+        data, params = self._simulate(10, 4, 100)
+
+        for _ in range(100):
+            row_idx = np.random.randint(params.N)
+
+            if (params.K > 1) and (np.random.random() < 0.5):
+                k = np.random.randint(params.K)
+
+                params.Z = np.delete(params.Z, k, axis=1)
+
+            else:
+                params.Z = np.column_stack([params.Z, np.zeros(params.N, dtype=params.Z.dtype)])
+
+                params.Z[row_idx, -1] = 1
+
+            params.Z[row_idx] = np.random.randint(0, 2, size=params.K)
+
+            suff_stats = dist.get_sufficient_statistics(data, params)
+
+            Z = params.Z.astype(float)
+
+            np.testing.assert_allclose(suff_stats.ZtZ, Z.T @ Z)
+
+            np.testing.assert_allclose(suff_stats.ZtX, Z.T @ data)
+
     def test_alpha_update(self):
         num_replicates = 100
         num_samples = 100
@@ -50,8 +205,6 @@ class Test(unittest.TestCase):
 
             model = lg.Model(data, feat_alloc_dist, params=params.copy())
 
-            model.params.alpha_prior = np.array([0.1, 0.1])
-
             trace = []
 
             for i in range(num_samples * num_updates):
@@ -84,8 +237,6 @@ class Test(unittest.TestCase):
 
             model = lg.Model(data, feat_alloc_dist, params=params.copy())
 
-            model.params.alpha_prior = np.array([0.1, 0.1])
-
             trace = []
 
             for i in range(num_samples * num_updates):
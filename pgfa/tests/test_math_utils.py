@@ -0,0 +1,99 @@
+import math
+import unittest
+
+import numpy as np
+import scipy.stats
+
+from pgfa.math_utils import (
+    LOG_FACTORIAL_TABLE_MAX_SIZE, ffa_rvs, get_log_factorial_table, ibp_rvs, log_factorial, log_factorial_lookup,
+    slice_sampler
+)
+from pgfa.utils import set_seed
+
+
+class Test(unittest.TestCase):
+
+    def test_ffa_rvs(self):
+        """ Column sums of the finite model are Beta-Binomial.
+        """
+        a, b, K, N = 2.0, 3.0, 3, 5
+
+        m = np.concatenate([np.sum(ffa_rvs(a, b, K, N), axis=0) for _ in range(5000)])
+
+        freqs = np.bincount(m, minlength=N + 1) / len(m)
+
+        np.testing.assert_allclose(freqs, scipy.stats.betabinom.pmf(np.arange(N + 1), N, a, b), atol=0.02)
+
+    def test_ibp_rvs(self):
+        """ Each row has Poisson(alpha) features and the expected number of features is alpha * H_N.
+        """
+        alpha, N = 2.0, 10
+
+        Zs = [ibp_rvs(alpha, N) for _ in range(5000)]
+
+        self.assertAlmostEqual(np.mean([np.sum(Z, axis=1) for Z in Zs]), alpha, delta=0.1)
+
+        self.assertAlmostEqual(np.mean([Z.shape[1] for Z in Zs]), alpha * np.sum(1 / np.arange(1, N + 1)), delta=0.2)
+
+        for Z in Zs:
+            self.assertTrue(np.all(np.sum(Z, axis=0) > 0))
+
+    def test_log_factorial(self):
+        x = np.concatenate([
+            np.arange(100),
+            np.random.randint(100, LOG_FACTORIAL_TABLE_MAX_SIZE, size=100),
+            LOG_FACTORIAL_TABLE_MAX_SIZE + np.arange(10)
+        ])
+
+        log_p = log_factorial(x)
+
+        for x_i, log_p_i in zip(x, log_p):
+            self.assertAlmostEqual(log_p_i, math.lgamma(x_i + 1), delta=1e-9 * max(1, abs(log_p_i)))
+
+            self.assertAlmostEqual(log_factorial(int(x_i)), math.lgamma(x_i + 1), delta=1e-9 * max(1, abs(log_p_i)))
+
+    def test_log_factorial_lookup(self):
+        table = get_log_factorial_table(100)
+
+        for x in [0, 1, 50, len(table) - 1, len(table), 10 * len(table), 2.5, 10.25]:
+            self.assertAlmostEqual(log_factorial_lookup(table, x), math.lgamma(x + 1), delta=1e-9 * math.lgamma(x + 2))
+
+    def test_log_factorial_non_integer(self):
+        for x in [0.5, 2.5, 10.25]:
+            self.assertAlmostEqual(log_factorial(x), math.lgamma(x + 1))
+
+    def test_slice_sampler(self):
+        """ Samples from a normal target have the right mean, variance and quantiles.
+        """
+        set_seed(0)
+
+        loc, scale = 1.0, 2.0
+
+        def log_p_func(x):
+            return scipy.stats.norm.logpdf(x, loc, scale)
+
+        x = 0.0
+
+        log_p_x = None
+
+        trace = []
+
+        for _ in range(20000):
+            x, log_p_x = slice_sampler(log_p_func, x, log_p_x=log_p_x)
+
+            trace.append(x)
+
+        trace = np.array(trace)
+
+        self.assertAlmostEqual(np.mean(trace), loc, delta=0.1)
+
+        self.assertAlmostEqual(np.var(trace), scale ** 2, delta=0.3)
+
+        for q in [0.1, 0.5, 0.9]:
+            self.assertAlmostEqual(np.mean(trace < scipy.stats.norm.ppf(q, loc, scale)), q, delta=0.03)
+
+        self.assertAlmostEqual(log_p_x, log_p_func(x))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import unittest
+
+import numpy as np
+
+from pgfa.parallel_tempering import ParallelTemperingUpdater
+from pgfa.utils import get_feat_alloc_updater, set_seed
+
+import pgfa.models.linear_gaussian as lg
+
+
+class FailingUpdater(object):
+
+    def update(self, model):
+        raise Exception('Failed update')
+
+
+class ExitingUpdater(object):
+
+    def update(self, model):
+        os._exit(3)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        set_seed(0)
+
+        params = lg.simulate_params(D=3, K=2, N=20)
+
+        self.data, _ = lg.simulate_data(params)
+
+    def test_local(self):
+        self._test_rounds(parallel=False)
+
+    def test_workers(self):
+        self._test_rounds(parallel=True)
+
+    def test_worker_error(self):
+        model = lg.get_model(self.data, K=2)
+
+        with ParallelTemperingUpdater(FailingUpdater(), num_chains=2, parallel=True) as updater:
+            with self.assertRaisesRegex(Exception, 'Failed update'):
+                updater.update(model)
+
+            self.assertIsNone(updater._chains)
+
+    def test_worker_exit(self):
+        model = lg.get_model(self.data, K=2)
+
+        with ParallelTemperingUpdater(ExitingUpdater(), num_chains=2, parallel=True) as updater:
+            with self.assertRaisesRegex(Exception, 'exited with code 3'):
+                updater.update(model)
+
+            self.assertIsNone(updater._chains)
+
+    def test_sync_every(self):
+        model = lg.get_model(self.data, K=2)
+
+        params = model.params
+
+        model_updater = lg.ModelUpdater(get_feat_alloc_updater())
+
+        with ParallelTemperingUpdater(model_updater, num_chains=2, parallel=True, sync_every=3) as updater:
+            for _ in range(2):
+                updater.update(model)
+
+            self.assertIs(model.params, params)
+
+            updater.update(model)
+
+            self.assertIsNot(model.params, params)
+
+    def _test_rounds(self, parallel):
+        model = lg.get_model(self.data, K=2)
+
+        model_updater = lg.ModelUpdater(get_feat_alloc_updater())
+
+        with ParallelTemperingUpdater(model_updater, num_chains=3, min_power=0.1, parallel=parallel) as updater:
+            for _ in range(20):
+                updater.update(model)
+
+                K = model.params.K
+
+                self.assertEqual(model.params.Z.shape, (20, K))
+
+                self.assertEqual(model.params.V.shape, (K, 3))
+
+                self.assertTrue(np.all(np.isin(model.params.Z, [0, 1])))
+
+                self.assertTrue(np.all(np.isfinite(updater._log_gaps)))
+
+                self.assertEqual(updater.powers[0], 1)
+
+            self.assertGreater(updater.num_swaps_accepted.sum(), 0)
+
+            self.assertTrue(np.isfinite(model.log_p))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from pgfa.feature_allocation_distributions import IndianBuffetProcessDistribution
+from pgfa.models.trace import TraceReader, TraceWriter
+from pgfa.updates import GibbsUpdater, ParticleGibbsUpdater
+
+import pgfa.models.linear_gaussian as lg
+
+
+class Test(unittest.TestCase):
+
+    def test_disabled(self):
+        model, model_updater = self._get_model(GibbsUpdater())
+
+        model_updater.update(model)
+
+        self.assertIsNone(model_updater.stats)
+
+        self.assertIsNone(model.data_dist.stats)
+
+    def test_phases(self):
+        params = lg.simulate_params(D=2, K=2, N=10)
+
+        # Start with every feature shared so rows always have entries to update
+        params.Z[:] = 1
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.Model(data, IndianBuffetProcessDistribution(), params=params)
+
+        model_updater = lg.ModelUpdater(GibbsUpdater(singletons_updater=lg.PriorSingletonsUpdater()))
+
+        stats = model_updater.enable_profiling(model)
+
+        for _ in range(3):
+            model_updater.update(model)
+
+        self.assertEqual(stats.num_iters, 3)
+
+        self.assertEqual(stats.num_rows, 3 * model.params.N)
+
+        self.assertEqual(stats.row_time_counts.sum(), stats.num_rows)
+
+        for phase in ['feat_alloc', 'singletons', 'params', 'alpha']:
+            self.assertGreater(stats.time[phase], 0)
+
+        self.assertGreater(stats.num_calls['feat_alloc']['log_p_row'], 0)
+
+        model_updater.disable_profiling(model)
+
+        model_updater.update(model)
+
+        self.assertEqual(stats.num_iters, 3)
+
+    def test_particles(self):
+        model, model_updater = self._get_model(ParticleGibbsUpdater(num_particles=5))
+
+        stats = model_updater.enable_profiling(model)
+
+        model_updater.update(model)
+
+        self.assertEqual(stats.num_particles, 5)
+
+    def test_trace(self):
+        model, model_updater = self._get_model(GibbsUpdater())
+
+        stats = model_updater.enable_profiling(model)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'trace.h5')
+
+            with TraceWriter(file_name, model) as writer:
+                for i in range(2):
+                    model_updater.update(model)
+
+                    writer.write_row(model, i + 1, stats=stats)
+
+            with TraceReader(file_name) as reader:
+                self.assertEqual(reader.update_stats['num_iters'], 2)
+
+    def _get_model(self, feat_alloc_updater):
+        params = lg.simulate_params(D=2, K=2, N=10)
+
+        data, _ = lg.simulate_data(params)
+
+        model = lg.get_model(data, K=2)
+
+        return model, lg.ModelUpdater(feat_alloc_updater)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
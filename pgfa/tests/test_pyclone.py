@@ -0,0 +1,473 @@
+import itertools
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from pgfa.feature_allocation_distributions import (
+    BetaBernoulliFeatureAllocationDistribution, IndianBuffetProcessDistribution
+)
+from pgfa.models.pyclone.feat_alloc_updates import RowCacheGibbsUpdater
+from pgfa.models.pyclone.singletons_updates import PriorSingletonsUpdater, SplitMergeUpdater, _get_split_log_q
+from pgfa.stats import gamma_rvs_array
+from pgfa.updates import GibbsUpdater
+from pgfa.utils import set_seed
+
+import pgfa.models.pyclone.beta_binomial as beta_binomial
+import pgfa.models.pyclone.binomial as binomial
+import pgfa.models.pyclone.singletons_updates as singletons_updates
+
+
+class Test(unittest.TestCase):
+
+    def test_log_p_row_pair(self):
+        for module in [binomial, beta_binomial]:
+            for _ in range(10):
+                data, params = self._simulate(3, 4, 20, module=module)
+
+                dist = module.DataDistribution()
+
+                F = params.F
+
+                for row_idx in range(params.N):
+                    k = np.random.randint(params.K)
+
+                    Z_0 = params.Z.copy()
+
+                    Z_0[row_idx, k] = 0
+
+                    Z_1 = params.Z.copy()
+
+                    Z_1[row_idx, k] = 1
+
+                    log_p_test = dist.log_p_row_pair(data, params, row_idx, Z_0[row_idx] @ F, Z_1[row_idx] @ F)
+
+                    params.Z = Z_0
+
+                    self.assertAlmostEqual(log_p_test[0], dist.log_p_row(data, params, row_idx))
+
+                    params.Z = Z_1
+
+                    self.assertAlmostEqual(log_p_test[1], dist.log_p_row(data, params, row_idx))
+
+    def test_log_p_rows(self):
+        for module in [binomial, beta_binomial]:
+            for _ in range(10):
+                data, params = self._simulate(3, 4, 20, module=module)
+
+                dist = module.DataDistribution()
+
+                row_idxs = np.random.randint(params.N, size=10)
+
+                log_p_test = dist.log_p_rows(data, params, row_idxs, params.Z[row_idxs] @ params.F)
+
+                for i, row_idx in enumerate(row_idxs):
+                    self.assertAlmostEqual(log_p_test[i], dist.log_p_row(data, params, row_idx))
+
+    def test_log_p_row_flips(self):
+        for module in [binomial, beta_binomial]:
+            for _ in range(10):
+                data, params = self._simulate(3, 4, 20, module=module)
+
+                dist = module.DataDistribution()
+
+                row_idx = np.random.randint(params.N)
+
+                flip_cols = np.random.randint(params.K, size=10)
+
+                log_p_test = dist.log_p_row_flips(data, params, row_idx, flip_cols)
+
+                self.assertAlmostEqual(log_p_test[0], dist.log_p_row(data, params, row_idx))
+
+                for i, k in enumerate(flip_cols):
+                    params.Z[row_idx, k] = 1 - params.Z[row_idx, k]
+
+                    self.assertAlmostEqual(log_p_test[i + 1], dist.log_p_row(data, params, row_idx))
+
+    def test_log_p_precision(self):
+        """ Differences of the precision conditional used by the slice sampler match differences of the density of the
+        data and prior on the log scale.
+        """
+        data, _ = self._simulate(3, 4, 20)
+
+        model = beta_binomial.Model(data, BetaBernoulliFeatureAllocationDistribution(4))
+
+        params = model.params
+
+        x = model.data_dist.get_packed_data(data)
+
+        probs = beta_binomial._get_genotype_probs(x.cn, x.mu, x.log_pi, x.tumour_content, params.Z @ params.F)
+
+        a, b = params.precision_prior
+
+        log_p = []
+
+        log_p_test = []
+
+        for precision in [1.0, 10.0, 100.0, 1000.0]:
+            params.precision = precision
+
+            # Jacobian of the log transform
+            log_p.append(
+                model.data_dist.log_p(data, params) + model.joint_dist.params_dist.log_p(params) + np.log(precision)
+            )
+
+            log_p_test.append(
+                beta_binomial._log_p_precision(x.b, x.d, x.log_pi, probs, precision) +
+                a * np.log(precision) - b * precision
+            )
+
+        np.testing.assert_allclose(np.diff(log_p_test), np.diff(log_p), rtol=1e-6)
+
+    def test_row_cache_gibbs_matches_gibbs(self):
+        data, params = self._simulate(3, 4, 20)
+
+        params.Z = np.random.randint(0, 2, size=params.Z.shape)
+
+        Zs = []
+
+        for updater in [GibbsUpdater(), RowCacheGibbsUpdater()]:
+            model = binomial.Model(data, BetaBernoulliFeatureAllocationDistribution(4), params=params.copy())
+
+            set_seed(1)
+
+            for _ in range(5):
+                updater.update(model)
+
+            Zs.append(model.params.Z.copy())
+
+        self.assertTrue(np.any(Zs[0] != params.Z))
+
+        np.testing.assert_array_equal(Zs[0], Zs[1])
+
+    def test_row_cache_gibbs_invalidation(self):
+        data, params = self._simulate(3, 4, 20)
+
+        model = binomial.Model(data, BetaBernoulliFeatureAllocationDistribution(4), params=params)
+
+        updater = RowCacheGibbsUpdater()
+
+        updater.update(model)
+
+        np.testing.assert_array_equal(updater._get_F(model.params), model.params.F)
+
+        model.params.V = np.random.gamma(1, 1, size=model.params.V.shape)
+
+        np.testing.assert_array_equal(updater._get_F(model.params), model.params.F)
+
+    def test_prior_singletons_matches_copy(self):
+        """ Accepted and rejected moves give the same states and acceptance ratios as a move on copies of the
+        parameters.
+        """
+        set_seed(0)
+
+        data, params = self._simulate_singletons(3, 4, 10)
+
+        updater = PriorSingletonsUpdater()
+
+        for row_idx in range(params.N):
+            m = np.sum(params.Z, axis=0) - params.Z[row_idx]
+
+            k_old = np.sum(m == 0)
+
+            for k_new in [0, 1, 2]:
+                for accept in [True, False]:
+                    model = binomial.Model(data, BetaBernoulliFeatureAllocationDistribution(4), params=params.copy())
+
+                    V_singletons = gamma_rvs_array(1, 1, (k_new, params.D))
+
+                    params_test, log_ratio_test = self._update_singletons_by_copy(model, row_idx, V_singletons)
+
+                    if not accept:
+                        params_test = model.params.copy()
+
+                    log_ratios = []
+
+                    def accept_func(log_p_new, log_p_old, log_q_new, log_q_old):
+                        log_ratios.append(log_p_new - log_p_old)
+
+                        return accept
+
+                    with mock.patch('numpy.random.poisson', return_value=k_new), \
+                            mock.patch.object(singletons_updates, 'gamma_rvs_array', return_value=V_singletons), \
+                            mock.patch.object(singletons_updates, 'do_metropolis_hastings_accept_reject', accept_func):
+
+                        self.assertIs(updater.update_row(model, row_idx), model.params)
+
+                    self._assert_same_features(model.params, params_test)
+
+                    # Nothing is proposed if the row has no singletons and none are drawn
+                    if (k_new == 0) and (k_old == 0):
+                        self.assertEqual(len(log_ratios), 0)
+
+                    else:
+                        self.assertEqual(len(log_ratios), 1)
+
+                        self.assertAlmostEqual(log_ratios[0], log_ratio_test)
+
+    def test_set_singletons(self):
+        """ The prevalences after replacing the singletons of a row are rescaled by the new column sums of V.
+        """
+        set_seed(0)
+
+        _, params = self._simulate_singletons(3, 4, 10)
+
+        row_idx = 0
+
+        m = np.sum(params.Z, axis=0) - params.Z[row_idx]
+
+        singleton_idxs = np.flatnonzero(m == 0)
+
+        non_singleton_idxs = np.flatnonzero(m > 0)
+
+        self.assertGreater(len(singleton_idxs), 0)
+
+        for k_new in range(4):
+            params_test = params.copy()
+
+            V_singletons = gamma_rvs_array(1, 1, (k_new, params.D))
+
+            PriorSingletonsUpdater()._set_singletons(params_test, row_idx, singleton_idxs, V_singletons)
+
+            V_sum = np.sum(params.V[non_singleton_idxs], axis=0) + np.sum(V_singletons, axis=0)
+
+            Phi = params.Z[:, non_singleton_idxs] @ params.V[non_singleton_idxs] / V_sum
+
+            Phi[row_idx] += np.sum(V_singletons, axis=0) / V_sum
+
+            np.testing.assert_allclose(params_test.Z @ params_test.F, Phi)
+
+            m_test = np.sum(params_test.Z, axis=0) - params_test.Z[row_idx]
+
+            self.assertEqual(np.sum(m_test == 0), k_new)
+
+            self.assertEqual(params_test.V.shape, (len(non_singleton_idxs) + k_new, params.D))
+
+    def test_split_log_q(self):
+        """ States sampled by the split proposal have the density computed for given states.
+        """
+        set_seed(0)
+
+        R = 3
+
+        log_lik = np.random.normal(0, 1, size=(R, 3))
+
+        log_q = {}
+
+        for states in itertools.product(range(3), repeat=R):
+            log_q[states] = _get_split_log_q(log_lik, np.array(states, dtype=np.int64), False)
+
+        self.assertAlmostEqual(np.sum(np.exp(list(log_q.values()))), 1)
+
+        num_samples = 20000
+
+        counts = dict.fromkeys(log_q, 0)
+
+        for _ in range(num_samples):
+            states = np.zeros(R, dtype=np.int64)
+
+            log_q_sample = _get_split_log_q(log_lik, states, True)
+
+            self.assertAlmostEqual(log_q_sample, log_q[tuple(states)])
+
+            counts[tuple(states)] += 1
+
+        for key in log_q:
+            self.assertAlmostEqual(counts[key] / num_samples, np.exp(log_q[key]), delta=0.01)
+
+    def test_split_merge_invariance(self):
+        """ Starting from the posterior of a tiny model the distribution of the state is unchanged by the updater.
+
+        The posterior is represented by draws from the prior weighted by the tempered likelihood, and the weighted means
+        of summaries of the state before and after the update are compared.
+        """
+        set_seed(0)
+
+        data, _ = self._simulate(1, 2, 3)
+
+        feat_alloc_dist = IndianBuffetProcessDistribution()
+
+        model = binomial.Model(data, feat_alloc_dist)
+
+        model.data_dist.annealing_power = 0.01
+
+        updater = SplitMergeUpdater(num_proposals=10)
+
+        log_w = []
+
+        stats = []
+
+        for _ in range(3000):
+            Z = feat_alloc_dist.rvs(1, 3)
+
+            V = gamma_rvs_array(1, 1, (Z.shape[1], 1))
+
+            model.params = binomial.Parameters(1, np.ones(2), V, np.ones(2), Z)
+
+            log_w.append(model.data_dist.log_p(data, model.params))
+
+            stats_old = self._get_split_merge_stats(model.params)
+
+            updater.update(model)
+
+            stats.append((stats_old, self._get_split_merge_stats(model.params)))
+
+        w = np.exp(np.array(log_w) - np.max(log_w))
+
+        w /= np.sum(w)
+
+        stats = np.array(stats)
+
+        diff = stats[:, 1] - stats[:, 0]
+
+        self.assertTrue(np.any(diff[:, 0] != 0))
+
+        mean = w @ diff
+
+        std_error = np.sqrt((w ** 2) @ ((diff - mean) ** 2))
+
+        for i in range(len(mean)):
+            self.assertAlmostEqual(mean[i], 0, delta=4 * std_error[i])
+
+    def test_split_merge_batch_targets(self):
+        """ The changes of the log target computed for a batch of proposals add up to the change of the joint density
+        when the proposals are applied one after the other.
+        """
+        set_seed(0)
+
+        data, params = self._simulate(3, 4, 40)
+
+        model = binomial.Model(data, IndianBuffetProcessDistribution(), params=params)
+
+        updater = RecordingSplitMergeUpdater(num_proposals=20)
+
+        with mock.patch('pgfa.models.pyclone.singletons_updates.do_metropolis_hastings_accept_reject', updater.accept):
+            for _ in range(5):
+                updater.update(model)
+
+        self.assertTrue(any(len(log_p_diffs) > 1 for log_p_diffs, _ in updater.batches))
+
+        for log_p_diffs, log_p_diff in updater.batches:
+            self.assertAlmostEqual(np.sum(log_p_diffs), log_p_diff, delta=1e-6 * max(1, abs(log_p_diff)))
+
+    def _assert_same_features(self, params, params_test):
+        """ Check two parameters have the same features up to the order of the columns.
+        """
+        def get_features(params):
+            return sorted(tuple(params.Z[:, k]) + tuple(params.V[k]) for k in range(params.K))
+
+        self.assertEqual(params.K, params_test.K)
+
+        np.testing.assert_allclose(np.array(get_features(params)), np.array(get_features(params_test)))
+
+        np.testing.assert_allclose(params.Z @ params.F, params_test.Z @ params_test.F)
+
+    def _get_split_merge_stats(self, params):
+        return [params.K, np.sum(params.Z), np.sum(np.log(params.V))]
+
+    def _simulate(self, D, K, N, module=binomial):
+        params = binomial.simulate_params(D, N, K=K)
+
+        data = binomial.simulate_data(params)
+
+        if module is beta_binomial:
+            params = beta_binomial.Parameters(
+                params.alpha, params.alpha_prior, 100.0, np.ones(2), params.V, params.V_prior, params.Z
+            )
+
+        return data, params
+
+    def _simulate_singletons(self, D, K, N):
+        """ Simulate data from parameters where the first row has two singleton features.
+        """
+        params = binomial.simulate_params(D, N, K=K)
+
+        z = np.zeros((N, 2), dtype=params.Z.dtype)
+
+        z[0] = 1
+
+        params.Z = np.column_stack([params.Z, z])
+
+        params.V = np.row_stack([params.V, gamma_rvs_array(1, 1, (2, D))])
+
+        data = binomial.simulate_data(params)
+
+        return data, params
+
+    def _update_singletons_by_copy(self, model, row_idx, V_singletons):
+        """ Replace the singletons of a row on a copy of the parameters and compute the log likelihood ratio from the
+        full data.
+        """
+        params = model.params
+
+        m = np.sum(params.Z, axis=0) - params.Z[row_idx]
+
+        non_singleton_idxs = np.flatnonzero(m > 0)
+
+        params_new = params.copy()
+
+        z = np.zeros((params.N, V_singletons.shape[0]), dtype=params.Z.dtype)
+
+        z[row_idx] = 1
+
+        params_new.Z = np.column_stack([params.Z[:, non_singleton_idxs], z])
+
+        params_new.V = np.row_stack([params.V[non_singleton_idxs], V_singletons])
+
+        log_ratio = model.data_dist.log_p(model.data, params_new) - model.data_dist.log_p(model.data, params)
+
+        return params_new, log_ratio
+
+
+class RecordingSplitMergeUpdater(SplitMergeUpdater):
+    """ Split merge updater which accepts every valid proposal and records the changes of the log target it computes.
+
+    The Jacobian of the split is part of the acceptance ratio but not of the target, so it is removed from the recorded
+    changes.
+    """
+
+    def __init__(self, num_proposals=1):
+        super().__init__(num_proposals=num_proposals)
+
+        self.batches = []
+
+        self._log_jacobian = 0
+
+        self._log_p_diffs = []
+
+    def accept(self, log_p_new, log_p_old, log_q_new, log_q_old):
+        self._log_p_diffs.append(log_p_new - log_p_old - self._log_jacobian)
+
+        return True
+
+    def _update_batch(self, batch, model):
+        if len(batch) == 0:
+            return
+
+        log_p_old = model.joint_dist.log_p(model.data, model.params)
+
+        self._log_p_diffs = []
+
+        super()._update_batch(batch, model)
+
+        log_p_new = model.joint_dist.log_p(model.data, model.params)
+
+        self.batches.append((self._log_p_diffs, log_p_new - log_p_old))
+
+    def _propose_merge(self, anchors, features, active_rows, L, alive, m, new_m, model):
+        k_a, k_b = features
+
+        self._log_jacobian = -np.sum(np.log(model.params.V[k_a] + model.params.V[k_b]))
+
+        return super()._propose_merge(anchors, features, active_rows, L, alive, m, new_m, model)
+
+    def _propose_split(self, anchors, features, active_rows, weight, L, alive, m, new_m, model):
+        self._log_jacobian = np.sum(np.log(model.params.V[features[0]]))
+
+        return super()._propose_split(anchors, features, active_rows, weight, L, alive, m, new_m, model)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
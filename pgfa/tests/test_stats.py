@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+import scipy.stats
+
+import pgfa.stats
+
+
+class Test(unittest.TestCase):
+
+    def test_gamma_log_pdf(self):
+        for _ in range(100):
+            x, a, b = np.random.gamma(1, 1, size=3)
+
+            self.assertAlmostEqual(pgfa.stats.gamma_log_pdf(x, a, b), scipy.stats.gamma.logpdf(x, a, scale=(1 / b)))
+
+    def test_matrix_normal_log_pdf(self):
+        for _ in range(100):
+            K, D = np.random.randint(1, 5, size=2)
+
+            precision = np.random.gamma(1, 1)
+
+            X = np.random.normal(size=(K, D))
+
+            M = np.random.normal(size=(K, D))
+
+            log_p_true = scipy.stats.matrix_normal.logpdf(
+                X, mean=M, rowcov=(1 / precision) * np.eye(K), colcov=np.eye(D)
+            )
+
+            self.assertAlmostEqual(pgfa.stats.matrix_normal_log_pdf(X, M, precision), log_p_true)
+
+    def test_normal_log_pdf(self):
+        for _ in range(100):
+            x, mean = np.random.normal(size=2)
+
+            std = np.random.gamma(1, 1)
+
+            self.assertAlmostEqual(pgfa.stats.normal_log_pdf(x, mean, std), scipy.stats.norm.logpdf(x, mean, std))
+
+    def test_polya_gamma_rvs(self):
+        for c in [0, 0.5, 2, 10]:
+            x = pgfa.stats.polya_gamma_rvs_array(np.full(100000, float(c)))
+
+            if c == 0:
+                mean = 1 / 4
+
+                var = 1 / 24
+
+            else:
+                mean = np.tanh(c / 2) / (2 * c)
+
+                var = (np.sinh(c) - c) / (4 * c ** 3 * np.cosh(c / 2) ** 2)
+
+            self.assertAlmostEqual(np.mean(x) / mean, 1, delta=0.02)
+
+            self.assertAlmostEqual(np.var(x) / var, 1, delta=0.05)
+
+    def test_poisson_log_pmf(self):
+        for _ in range(100):
+            mu = np.random.gamma(1, 1)
+
+            x = np.random.poisson(mu)
+
+            self.assertAlmostEqual(pgfa.stats.poisson_log_pmf(x, mu), scipy.stats.poisson.logpmf(x, mu))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -1,5 +1,5 @@
 from .discrete_particle_filter import DiscreteParticleFilterUpdater
 from .gibbs import GibbsUpdater
-from .mixture import GibbsMixtureUpdater
+from .mixture import AdaptiveMixtureUpdater, GibbsMixtureUpdater
 from .particle_gibbs import ParticleGibbsUpdater
 from .row_gibbs import RowGibbsUpdater
@@ -1,7 +1,10 @@
 import numpy as np
+import time
 
 
 class FeatureAllocationMatrixUpdater(object):
+    # Set by `AbstractModelUpdater.enable_profiling`
+    stats = None
 
     def __init__(self, annealing_schedule=None, singletons_updater=None):
         self.annealing_schedule = annealing_schedule
@@ -13,12 +16,21 @@ class FeatureAllocationMatrixUpdater(object):
     def update(self, model):
         self.iter += 1
 
+        annealing_power = model.data_dist.annealing_power
+
         if self.annealing_schedule is not None:
-            model.data_dist.annealing_power = self.annealing_schedule(self.iter)
+            model.data_dist.annealing_power = annealing_power * self.annealing_schedule(self.iter)
+
+        stats = self.stats
 
         num_rows = model.params.Z.shape[0]
 
         for row_idx in np.random.permutation(num_rows):
+            if stats is not None:
+                stats.phase = 'feat_alloc'
+
+                t_0 = time.perf_counter()
+
             cols = model.feat_alloc_dist.get_update_cols(model.params, row_idx)
 
             if len(cols) > 0:
@@ -26,10 +38,33 @@ class FeatureAllocationMatrixUpdater(object):
 
                 model.params = self.update_row(cols, model.data, model.data_dist, feat_probs, model.params, row_idx)
 
+            if stats is not None:
+                t_1 = time.perf_counter()
+
+                stats.add_time('feat_alloc', t_1 - t_0)
+
+                stats.add_row_time(t_1 - t_0)
+
             if self.singletons_updater is not None:
+                if stats is not None:
+                    stats.phase = 'singletons'
+
                 self.singletons_updater.update_row(model, row_idx)
 
-        model.data_dist.annealing_power = 1.0
+                if stats is not None:
+                    stats.add_time('singletons', time.perf_counter() - t_1)
+
+        if stats is not None:
+            stats.phase = None
+
+            row_updater = getattr(self, 'row_updater', None)
+
+            if row_updater is not None:
+                stats.set_particles(
+                    row_updater.num_particles, getattr(row_updater, 'max_particles', row_updater.num_particles)
+                )
+
+        model.data_dist.annealing_power = annealing_power
 
     def update_row(self, cols, data, dist, feat_probs, params, row_idx):
         raise NotImplementedError
@@ -1,9 +1,7 @@
 import numba
 import numpy as np
-import scipy.optimize
 
 from pgfa.data_structures import Particle, ParticleSwarm
-from pgfa.math_utils import log_sum_exp
 from pgfa.updates.base import FeatureAllocationMatrixUpdater
 
 
@@ -106,7 +104,17 @@ class AbstractDiscreteParticleFilterRowUpdater(FeatureAllocationMatrixUpdater):
 
         return annealing_factor
 
-    def _get_new_particle(self, annealing_factor, col, data, dist, log_feat_probs, params, parent, row_idx, value):
+    def _get_new_particle(
+            self, annealing_factor, col, data, dist, log_feat_probs, params, parent, row_idx, value, log_lik=None):
+        """ Extend a particle by setting `col` to `value`.
+
+        If `log_lik` is given it is used as the log likelihood of the row instead of evaluating the data distribution.
+
+        Returns
+        -------
+        particle: (Particle) New particle.
+        log_lik: (float) Log likelihood of the row without annealing.
+        """
         if parent is None:
             parent_log_p = 0
 
@@ -121,11 +129,25 @@ class AbstractDiscreteParticleFilterRowUpdater(FeatureAllocationMatrixUpdater):
 
         prior = log_feat_probs[value, col]
 
-        log_p = annealing_factor * dist.log_p_row(data, params, row_idx)
+        if log_lik is None:
+            log_lik = dist.log_p_row(data, params, row_idx)
+
+        log_p = annealing_factor * log_lik
 
         log_w = _get_log_w(log_p, parent_log_p, prior)
 
-        return Particle(log_p, log_w, parent, parent_path + [value])
+        return Particle(log_p, log_w, parent, parent_path + [value]), log_lik
+
+    def _get_parent_log_lik(self, log_liks, parent, value, test_value):
+        """ Get the log likelihood of the parent if extending it by `value` leaves the row unchanged, otherwise None.
+
+        Columns after the current one are set to the test path, so the child which takes the test path value has the
+        same row as its parent and does not need to be scored again.
+        """
+        if (parent is None) or (value != test_value):
+            return None
+
+        return log_liks[id(parent)]
 
 
 class DiscreteParticleFilterRowUpdater(AbstractDiscreteParticleFilterRowUpdater):
@@ -146,6 +168,9 @@ class DiscreteParticleFilterRowUpdater(AbstractDiscreteParticleFilterRowUpdater)
 
         params.Z[row_idx, cols] = test_path
 
+        # Unannealed log likelihood of the row for each particle in the swarm, keyed by particle id
+        log_liks = {}
+
         for t in range(T):
             if swarm.num_particles > self.num_particles:
                 swarm = self._resample(swarm)
@@ -156,39 +181,37 @@ class DiscreteParticleFilterRowUpdater(AbstractDiscreteParticleFilterRowUpdater)
 
             col = cols[t]
 
+            new_log_liks = {}
+
             for log_W, parent_particle in zip(swarm.log_weights, swarm.particles):
                 if parent_particle is not None:
                     params.Z[row_idx, cols[:t]] = parent_particle.path
 
                 for s in [0, 1]:
-                    particle = self._get_new_particle(
-                        annealing_factor, col, data, dist, log_feat_probs, params, parent_particle, row_idx, s
+                    particle, log_lik = self._get_new_particle(
+                        annealing_factor, col, data, dist, log_feat_probs, params, parent_particle, row_idx, s,
+                        log_lik=self._get_parent_log_lik(log_liks, parent_particle, s, test_path[t])
                     )
 
+                    new_log_liks[id(particle)] = log_lik
+
                     new_swarm.add_particle(log_W + particle.log_w, particle)
 
             swarm = new_swarm
 
+            log_liks = new_log_liks
+
         params.Z[row_idx, cols] = swarm.sample().path
 
         return params
 
     def _resample(self, swarm):
-        log_W = swarm.log_weights
-
-        log_W[np.isneginf(log_W)] = -1e10
-
-        log_l = scipy.optimize.bisect(_resample_opt_func, log_W.min(), 1000, args=(np.log(self.num_particles), log_W))
+        idxs, log_W = fearnhead_clifford_resampling(swarm.log_weights, self.num_particles, False)
 
         new_swarm = ParticleSwarm()
 
-        for i in range(swarm.num_particles):
-            if log_W[i] >= log_l:
-                new_swarm.add_particle(log_W[i], swarm[i])
-
-            else:
-                if bernoulli_rvs_log(log_W[i] - log_l):
-                    new_swarm.add_particle(log_l, swarm[i])
+        for i, log_w in zip(idxs, log_W):
+            new_swarm.add_particle(log_w, swarm[i])
 
         return new_swarm
 
@@ -208,6 +231,9 @@ class ConditionalDiscreteParticleFilterRowUpdater(AbstractDiscreteParticleFilter
 
         swarm.add_particle(0, None)
 
+        # Unannealed log likelihood of the row for each particle in the swarm, keyed by particle id
+        log_liks = {}
+
         for t in range(T):
             if swarm.num_particles > self.num_particles:
                 swarm = self._resample(swarm)
@@ -220,18 +246,25 @@ class ConditionalDiscreteParticleFilterRowUpdater(AbstractDiscreteParticleFilter
 
             states = [conditional_path[t], 1 - conditional_path[t]]
 
+            new_log_liks = {}
+
             for log_W, parent_particle in zip(swarm.log_weights, swarm.particles):
                 if parent_particle is not None:
                     params.Z[row_idx, cols[:t]] = parent_particle.path
 
                 for s in states:
-                    particle = self._get_new_particle(
-                        annealing_factor, col, data, dist, log_feat_probs, params, parent_particle, row_idx, s
+                    particle, log_lik = self._get_new_particle(
+                        annealing_factor, col, data, dist, log_feat_probs, params, parent_particle, row_idx, s,
+                        log_lik=self._get_parent_log_lik(log_liks, parent_particle, s, test_path[t])
                     )
 
+                    new_log_liks[id(particle)] = log_lik
+
                     new_swarm.add_particle(log_W + particle.log_w, particle)
 
             swarm = new_swarm
+
+            log_liks = new_log_liks
             
             if swarm.num_particles > self.max_particles:
                 self.max_particles = swarm.num_particles
@@ -243,38 +276,112 @@ class ConditionalDiscreteParticleFilterRowUpdater(AbstractDiscreteParticleFilter
         return params
 
     def _resample(self, swarm):
-        log_W = swarm.log_weights
+        idxs, log_W = fearnhead_clifford_resampling(swarm.log_weights, self.num_particles, True)
 
-        log_W[np.isneginf(log_W)] = -1e10
+        new_swarm = ParticleSwarm()
 
-        log_l = scipy.optimize.bisect(_resample_opt_func, log_W.min(), 1000, args=(np.log(self.num_particles), log_W))
+        for i, log_w in zip(idxs, log_W):
+            new_swarm.add_particle(log_w, swarm[i])
 
-        new_swarm = ParticleSwarm()
+        return new_swarm
+
+
+@numba.njit(cache=True)
+def fearnhead_clifford_resampling(log_W, num_particles, conditional):
+    """ Resample a discrete particle swarm down to at most `num_particles` particles without duplicating particles.
+
+    Particles with weight above the threshold l are kept with their weight. The remaining particles are selected by
+    stratified sampling with probability W / l and given weight l.
+
+    Parameters
+    ----------
+    log_W: (ndarray) Normalised log weights of the particles.
+    num_particles: (int) Expected number of particles after resampling.
+    conditional: (bool) Whether the first particle is the conditional path, which is always kept.
+
+    Returns
+    -------
+    idxs: (ndarray) Indices of the kept particles in increasing order.
+    log_W: (ndarray) Log weights of the kept particles.
+
+    Reference: Fearnhead and Clifford, On-line inference for hidden Markov models via particle filters (2003)
+    """
+    M = len(log_W)
 
-        if log_W[0] >= log_l:
-            new_swarm.add_particle(log_W[0], swarm[0])
+    log_l = get_fearnhead_clifford_threshold(log_W, num_particles)
+
+    if log_l == -np.inf:
+        return np.arange(M), log_W.copy()
+
+    # Weights relative to the threshold, so residual particles are selected with probability W / l
+    u_max = 1.0
+
+    if conditional and (log_W[0] < log_l):
+        # Stratified sampling conditioned on the first particle being selected
+        u_max = np.exp(log_W[0] - log_l)
+
+    u = u_max * np.random.random()
+
+    idxs = np.zeros(M, dtype=np.int64)
+
+    new_log_W = np.zeros(M)
+
+    num_kept = 0
+
+    total = 0.0
+
+    for i in range(M):
+        if log_W[i] >= log_l:
+            idxs[num_kept] = i
+
+            new_log_W[num_kept] = log_W[i]
+
+            num_kept += 1
 
         else:
-            new_swarm.add_particle(log_l, swarm[0])
+            total += np.exp(log_W[i] - log_l)
 
-        for i in range(1, swarm.num_particles):
-            if log_W[i] >= log_l:
-                new_swarm.add_particle(log_W[i], swarm[i])
+            if (total > u) or (conditional and (i == 0)):
+                idxs[num_kept] = i
 
-            else:
-                if bernoulli_rvs_log(log_W[i] - log_l):
-                    new_swarm.add_particle(log_l, swarm[i])
+                new_log_W[num_kept] = log_l
 
-        return new_swarm
+                num_kept += 1
+
+                u += 1
+
+    return idxs[:num_kept], new_log_W[:num_kept]
 
 
 @numba.njit(cache=True)
-def bernoulli_rvs_log(log_p):
-    if np.log(np.random.random()) < log_p:
-        return True
+def get_fearnhead_clifford_threshold(log_W, num_particles):
+    """ Compute the threshold l solving sum_i min(W_i / l, 1) = num_particles exactly by sorting the weights.
 
-    else:
-        return False
+    Returns -inf if there are no more than `num_particles` particles with non-zero weight, in which case all particles
+    are kept.
+    """
+    max_log_W = np.max(log_W)
+
+    if max_log_W == -np.inf:
+        return -np.inf
+
+    W = np.sort(np.exp(log_W - max_log_W))[::-1]
+
+    if np.sum(W > 0) <= num_particles:
+        return -np.inf
+
+    # Sum of the weights of all but the k largest particles
+    tail = np.cumsum(W[::-1])[::-1]
+
+    for k in range(num_particles - 1):
+        # Threshold if exactly the k largest particles are kept deterministically
+        l = tail[k] / (num_particles - k)
+
+        if W[k] <= l:
+            return np.log(l) + max_log_W
+
+    # With more than num_particles non-zero weights the k = num_particles - 1 solution always holds
+    return np.log(tail[num_particles - 1]) + max_log_W
 
 
 @numba.jit(cache=True)
@@ -291,12 +398,3 @@ def _get_log_w(log_p, parent_log_p, prior):
         log_w = prior + log_p - parent_log_p
 
     return log_w
-
-
-@numba.njit(cache=True)
-def _resample_opt_func(x, log_N, log_W):
-    y = log_W - x
-
-    y[y >= 0] = 0
-
-    return log_sum_exp(y) - log_N
@@ -10,17 +10,28 @@ class GibbsUpdater(FeatureAllocationMatrixUpdater):
     def update_row(self, cols, data, dist, feat_probs, params, row_idx):
         log_p = np.zeros(2)
 
+        log_lik = np.zeros(2)
+
+        # Log likelihood of the current state of the row, so only the flipped state is evaluated for each entry
+        log_lik_row = dist.log_p_row_cached(data, params, row_idx)
+
         for k in cols:
-            params.Z[row_idx, k] = 0
+            z_old = params.Z[row_idx, k]
+
+            params.Z[row_idx, k] = 1 - z_old
 
-            log_p[0] = np.log1p(-feat_probs[k])
-            log_p[0] += dist.log_p_row(data, params, row_idx)
+            log_lik[z_old] = log_lik_row
 
-            params.Z[row_idx, k] = 1
+            log_lik[1 - z_old] = dist.log_p_row(data, params, row_idx)
 
-            log_p[1] = np.log(feat_probs[k])
-            log_p[1] += dist.log_p_row(data, params, row_idx)
+            log_p[0] = np.log1p(-feat_probs[k]) + log_lik[0]
+
+            log_p[1] = np.log(feat_probs[k]) + log_lik[1]
 
             params.Z[row_idx, k] = discrete_rvs_gumbel_trick(log_p)
 
+            log_lik_row = log_lik[params.Z[row_idx, k]]
+
+        dist.cache_row(data, params, row_idx, log_lik_row)
+
         return params
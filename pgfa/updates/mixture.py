@@ -1,6 +1,11 @@
-from pgfa.math_utils import bernoulli_rvs
+import numpy as np
+import time
+
+from pgfa.math_utils import bernoulli_rvs, discrete_rvs
 from pgfa.updates.gibbs import GibbsUpdater
 
+import pgfa.utils
+
 
 class GibbsMixtureUpdater(object):
 
@@ -14,9 +19,188 @@ class GibbsMixtureUpdater(object):
 
         self.gibbs_prob = gibbs_prob
 
+    @property
+    def stats(self):
+        return self.other_updater.stats
+
+    @stats.setter
+    def stats(self, value):
+        self.gibbs_updater.stats = value
+
+        self.other_updater.stats = value
+
     def update(self, model):
         if bernoulli_rvs(self.gibbs_prob) == 1:
             self.gibbs_updater.update(model)
 
         else:
             self.other_updater.update(model)
+
+
+class AdaptiveMixtureUpdater(object):
+    """ Mixture of feature allocation updaters whose selection probabilities are tuned by measured efficiency.
+
+    Each update applies one updater chosen at random. For each updater the wall time of its updates and the number of
+    entries of Z it changed (Hamming distance) are recorded. During the first `num_adapt_iters` updates the selection
+    probabilities are set proportional to the distance moved per second. Afterwards they are frozen, so the chain is a
+    fixed mixture of valid kernels.
+
+    The iteration counter of the chosen updater is set to the number of mixture updates before it is applied, so
+    annealing schedules advance with the mixture rather than with the number of times each updater was chosen.
+
+    Parameters
+    ----------
+    feat_alloc_updaters: (dict) Map from label to feature allocation updater, for example {'g': GibbsUpdater(), 'pg':
+        ParticleGibbsUpdater(num_particles=20)}.
+    num_adapt_iters: (int) Number of updates during which the selection probabilities are adapted.
+    min_prob: (float) Lower bound on the selection probability of each updater, so that poorly performing updaters
+        are still measured and are still used after adaptation.
+    min_updates: (int) Number of updates of each updater, applied in turn, before adaptation starts.
+    """
+
+    def __init__(self, feat_alloc_updaters, num_adapt_iters=100, min_prob=0.05, min_updates=2):
+        if len(feat_alloc_updaters) * min_prob > 1:
+            raise Exception('Minimum probability is too large for the number of updaters.')
+
+        self.feat_alloc_updaters = feat_alloc_updaters
+
+        self.num_adapt_iters = num_adapt_iters
+
+        self.min_prob = min_prob
+
+        self.min_updates = min_updates
+
+        self.iter = 0
+
+        self.labels = list(feat_alloc_updaters.keys())
+
+        num_updaters = len(self.labels)
+
+        self.probs = np.ones(num_updaters) / num_updaters
+
+        self.num_updates = np.zeros(num_updaters, dtype=np.int64)
+
+        self.time = np.zeros(num_updaters)
+
+        self.distance = np.zeros(num_updaters)
+
+    @property
+    def adapting(self):
+        return self.iter < self.num_adapt_iters
+
+    @property
+    def efficiency(self):
+        """ Entries of Z changed per second of each updater.
+        """
+        return self.distance / np.maximum(self.time, 1e-12)
+
+    @property
+    def stats(self):
+        return self.feat_alloc_updaters[self.labels[0]].stats
+
+    @stats.setter
+    def stats(self, value):
+        for updater in self.feat_alloc_updaters.values():
+            updater.stats = value
+
+    def get_stats(self):
+        """ Measurements and selection probability of each updater.
+
+        Returns
+        -------
+        stats: (dict) Map from label to a dictionary with the number of updates, total time, total Hamming distance,
+            distance per second and selection probability.
+        """
+        stats = {}
+
+        for i, label in enumerate(self.labels):
+            stats[label] = {
+                'num_updates': int(self.num_updates[i]),
+                'time': self.time[i],
+                'distance': self.distance[i],
+                'efficiency': self.efficiency[i],
+                'prob': self.probs[i]
+            }
+
+        return stats
+
+    def format_stats(self):
+        """ Format the stats of each updater as a text table sorted by efficiency.
+        """
+        rows = [['updater', 'num_updates', 'time', 'distance', 'distance_per_sec', 'prob']]
+
+        for label, s in sorted(self.get_stats().items(), key=lambda x: -x[1]['efficiency']):
+            rows.append([
+                str(label),
+                str(s['num_updates']),
+                '{:.3f}'.format(s['time']),
+                '{:.0f}'.format(s['distance']),
+                '{:.1f}'.format(s['efficiency']),
+                '{:.3f}'.format(s['prob'])
+            ])
+
+        return pgfa.utils.format_table(rows)
+
+    def update(self, model):
+        if self.adapting and np.min(self.num_updates) < self.min_updates:
+            idx = np.argmin(self.num_updates)
+
+        else:
+            idx = discrete_rvs(self.probs)
+
+        feat_alloc_updater = self.feat_alloc_updaters[self.labels[idx]]
+
+        feat_alloc_updater.iter = self.iter
+
+        Z_old = model.params.Z.copy()
+
+        t_0 = time.perf_counter()
+
+        feat_alloc_updater.update(model)
+
+        t = time.perf_counter() - t_0
+
+        if self.adapting:
+            self.num_updates[idx] += 1
+
+            self.time[idx] += t
+
+            self.distance[idx] += get_hamming_distance(Z_old, model.params.Z)
+
+            if np.min(self.num_updates) >= self.min_updates:
+                self._adapt()
+
+        self.iter += 1
+
+    def _adapt(self):
+        efficiency = self.efficiency
+
+        if np.sum(efficiency) == 0:
+            return
+
+        num_updaters = len(self.labels)
+
+        self.probs = self.min_prob + (1 - num_updaters * self.min_prob) * efficiency / np.sum(efficiency)
+
+
+def get_hamming_distance(Z_old, Z_new):
+    """ Number of entries which differ between two feature allocation matrices after matching their columns.
+
+    Features are unordered, so the columns are matched to minimise the distance. Matrices with different numbers of
+    features are padded with zero columns, so unmatched features count their nonzero entries.
+    """
+    K = max(Z_old.shape[1], Z_new.shape[1])
+
+    Z_old = np.pad(Z_old, ((0, 0), (0, K - Z_old.shape[1]))).astype(np.int64)
+
+    Z_new = np.pad(Z_new, ((0, 0), (0, K - Z_new.shape[1]))).astype(np.int64)
+
+    # Imported here so importing the updaters does not load scipy
+    import scipy.optimize
+
+    # Number of rows where column i of Z_old and column j of Z_new differ
+    cost = Z_old.T @ (1 - Z_new) + (1 - Z_old).T @ Z_new
+
+    row_idxs, col_idxs = scipy.optimize.linear_sum_assignment(cost)
+
+    return int(np.sum(cost[row_idxs, col_idxs]))
@@ -1,11 +1,16 @@
-import itertools
+import numba
 import numpy as np
 
-from pgfa.math_utils import discrete_rvs_gumbel_trick, log_normalize
+from pgfa.math_utils import discrete_rvs_gumbel_trick
 from pgfa.updates.base import FeatureAllocationMatrixUpdater
 
 
 class RowGibbsUpdater(FeatureAllocationMatrixUpdater):
+    """ Jointly update a block of entries of a row by enumerating all 2^max_cols configurations.
+
+    Configurations are visited in Gray code order so consecutive configurations differ by one entry, which lets the data
+    distribution compute the likelihood incrementally via `log_p_row_flips`.
+    """
 
     def __init__(self, max_cols=None, **kwargs):
         super().__init__(**kwargs)
@@ -23,40 +28,63 @@ class RowGibbsUpdater(FeatureAllocationMatrixUpdater):
 
         update_cols = np.random.choice(cols, replace=False, size=max_cols)
 
-        Zs = np.tile(params.Z[row_idx], (2 ** max_cols, 1))
+        flips = get_gray_code_flips(max_cols)
+
+        # The walk starts from the configuration with all updated entries off
+        params.Z[row_idx, update_cols] = 0
+
+        log_p = dist.log_p_row_flips(data, params, row_idx, update_cols[flips])
+
+        log_p += _get_log_prior_path(np.log(feat_probs[update_cols]), np.log1p(-feat_probs[update_cols]), flips)
+
+        idx = discrete_rvs_gumbel_trick(log_p)
+
+        params.Z[row_idx, update_cols] = get_gray_code(idx, max_cols)
+
+        return params
+
+
+def get_gray_code(idx, num_bits):
+    """ Bits of the configuration visited at step `idx` of the walk from `get_gray_code_flips`.
+    """
+    return ((idx ^ (idx >> 1)) >> np.arange(num_bits)) & 1
+
 
-        Zs[:, update_cols] = list(map(np.array, itertools.product([0, 1], repeat=max_cols)))
+@numba.njit(cache=True)
+def get_gray_code_flips(num_bits):
+    """ Bit flipped at each step of a walk through all 2^num_bits configurations in reflected binary Gray code order.
+    """
+    flips = np.zeros(2 ** num_bits - 1, dtype=np.int64)
 
-        Zs = np.array(Zs, dtype=np.int)
+    for i in range(1, 2 ** num_bits):
+        # Step i flips the lowest set bit of i
+        j = 0
 
-        return do_row_gibbs_update(
-            cols,
-            data,
-            dist,
-            feat_probs,
-            params,
-            row_idx,
-            Zs
-        )
+        while ((i >> j) & 1) == 0:
+            j += 1
 
+        flips[i - 1] = j
 
-def do_row_gibbs_update(cols, data, dist, feat_probs, params, row_idx, Zs):
-    log_p1 = np.log(feat_probs[cols])
+    return flips
 
-    log_p0 = np.log(1 - feat_probs[cols])
 
-    log_p = np.zeros(len(Zs))
+@numba.njit(cache=True)
+def _get_log_prior_path(log_p1, log_p0, flips):
+    z = np.zeros(len(log_p1), dtype=np.int64)
 
-    for idx in range(len(Zs)):
-        params.Z[row_idx] = Zs[idx]
+    log_p = np.zeros(len(flips) + 1)
 
-        log_p[idx] = np.sum(Zs[idx, cols] * log_p1) + np.sum((1 - Zs[idx, cols]) * log_p0) + \
-            dist.log_p_row(data, params, row_idx)
+    log_p[0] = np.sum(log_p0)
 
-    log_p = log_normalize(log_p)
+    for i in range(len(flips)):
+        z[flips[i]] = 1 - z[flips[i]]
 
-    idx = discrete_rvs_gumbel_trick(log_p)
+        # Summed from scratch rather than incrementally so probabilities of zero or one do not produce nan
+        for j in range(len(z)):
+            if z[j] == 1:
+                log_p[i + 1] += log_p1[j]
 
-    params.Z[row_idx] = Zs[idx]
+            else:
+                log_p[i + 1] += log_p0[j]
 
-    return params
+    return log_p
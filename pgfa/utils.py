@@ -1,11 +1,46 @@
+import ctypes
 import numba
 import numpy as np
 import time
 
+from numba import _helperlib
+
 import pgfa.updates
 
 
 def get_feat_alloc_updater(annealing_iters=1, annealing_steps=1, mixture_prob=0.0, updater='g', updater_kwargs={}):
+    """ Build a feature allocation updater.
+
+    Parameters
+    ----------
+    annealing_iters: (int) Number of iterations between increases of the annealing power.
+    annealing_steps: (int) Number of increases of the annealing power before it reaches 1.
+    mixture_prob: (float) If positive the updater is mixed with Gibbs updates with this probability.
+    updater: (str) One of 'dpf', 'g', 'pg' and 'rg', 'rcg' for the PyClone `RowCacheGibbsUpdater`, or 'adaptive' for
+        an `AdaptiveMixtureUpdater` over 'dpf', 'g', 'pg' and 'rg' with their default settings.
+    updater_kwargs: (dict) Keyword arguments of the updater. For 'adaptive' the singletons_updater is passed to each
+        updater and the remaining arguments to `AdaptiveMixtureUpdater`.
+    """
+    if updater == 'adaptive':
+        if mixture_prob > 0:
+            raise Exception('Gibbs mixtures are not supported for the adaptive updater.')
+
+        updater_kwargs = dict(updater_kwargs)
+
+        singletons_updater = updater_kwargs.pop('singletons_updater', None)
+
+        feat_alloc_updaters = {}
+
+        for x in ['dpf', 'g', 'pg', 'rg']:
+            feat_alloc_updaters[x] = get_feat_alloc_updater(
+                annealing_iters=annealing_iters,
+                annealing_steps=annealing_steps,
+                updater=x,
+                updater_kwargs={'singletons_updater': singletons_updater}
+            )
+
+        return pgfa.updates.AdaptiveMixtureUpdater(feat_alloc_updaters, **updater_kwargs)
+
     if updater == 'dpf':
         feat_alloc_updater = pgfa.updates.DiscreteParticleFilterUpdater(**updater_kwargs)
 
@@ -18,13 +53,15 @@ def get_feat_alloc_updater(annealing_iters=1, annealing_steps=1, mixture_prob=0.
     elif updater == 'rg':
         feat_alloc_updater = pgfa.updates.RowGibbsUpdater(**updater_kwargs)
 
+    elif updater == 'rcg':
+        from pgfa.models.pyclone.feat_alloc_updates import RowCacheGibbsUpdater
+
+        feat_alloc_updater = RowCacheGibbsUpdater(**updater_kwargs)
+
     else:
         raise Exception('Unrecognized feature allocation updater: {}'.format(updater))
 
-    feat_alloc_updater.annealing_schedule = lambda x: min(
-        (((x + annealing_iters) // annealing_iters) / annealing_steps),
-        1.0
-    )
+    feat_alloc_updater.annealing_schedule = AnnealingSchedule(annealing_iters, annealing_steps)
 
     if mixture_prob > 0:
         feat_alloc_updater = pgfa.updates.GibbsMixtureUpdater(feat_alloc_updater, gibbs_prob=mixture_prob)
@@ -32,6 +69,21 @@ def get_feat_alloc_updater(annealing_iters=1, annealing_steps=1, mixture_prob=0.
     return feat_alloc_updater
 
 
+class AnnealingSchedule(object):
+    """ Step the annealing power up every `annealing_iters` iterations, reaching 1 after `annealing_steps` steps.
+
+    This is a class rather than a closure so updaters using it can be checkpointed.
+    """
+
+    def __init__(self, annealing_iters=1, annealing_steps=1):
+        self.annealing_iters = annealing_iters
+
+        self.annealing_steps = annealing_steps
+
+    def __call__(self, x):
+        return min(((x + self.annealing_iters) // self.annealing_iters) / self.annealing_steps, 1.0)
+
+
 def set_seed(seed):
     if seed is not None:
         np.random.seed(seed)
@@ -39,12 +91,56 @@ def set_seed(seed):
         set_numba_seed(seed)
 
 
-@numba.jit
+@numba.njit(cache=True)
 def set_numba_seed(seed):
     np.random.seed(seed)
 
 
-@numba.njit
+class _NumbaRandomState(ctypes.Structure):
+    """ Layout of the thread local random state used by compiled functions, see rnd_state_t in numba/_random.c.
+
+    This is a private struct of numba. The layout was checked against numba 0.60 and is verified by a round trip in
+    pgfa/tests/test_checkpoint.py.
+    """
+    _fields_ = [
+        ('index', ctypes.c_int),
+        ('mt', ctypes.c_uint * 624),
+        ('has_gauss', ctypes.c_int),
+        ('gauss', ctypes.c_double),
+        ('is_initialized', ctypes.c_int)
+    ]
+
+
+def get_numba_rng_state():
+    """ Get the state of the random number generator used by compiled functions in this thread.
+
+    Unlike `np.random.get_state` inside a compiled function this includes the cached normal variate, so restoring it
+    reproduces the exact sequence of draws.
+    """
+    state = _NumbaRandomState.from_address(_helperlib.rnd_get_np_state_ptr())
+
+    return (state.index, list(state.mt), state.has_gauss, state.gauss)
+
+
+def set_numba_rng_state(rng_state):
+    """ Restore a state returned by `get_numba_rng_state`.
+    """
+    index, mt, has_gauss, gauss = rng_state
+
+    state = _NumbaRandomState.from_address(_helperlib.rnd_get_np_state_ptr())
+
+    state.index = index
+
+    state.mt[:] = mt
+
+    state.has_gauss = has_gauss
+
+    state.gauss = gauss
+
+    state.is_initialized = 1
+
+
+@numba.njit(cache=True)
 def summarize_feature_allocation_matrix(Zs, burnin=0, thin=1):
     I = len(Zs)
 
@@ -70,7 +166,7 @@ def summarize_feature_allocation_matrix(Zs, burnin=0, thin=1):
     return best_Z
 
 
-@numba.njit
+@numba.njit(cache=True)
 def get_b_cubed_score(features_true, features_pred):
     n = len(features_pred)
 
@@ -113,6 +209,14 @@ def get_b_cubed_score(features_true, features_pred):
     return f, p, r
 
 
+def format_table(rows):
+    """ Format rows of strings as a text table with left aligned columns. The first row is the header.
+    """
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+    return '\n'.join('  '.join(x.ljust(w) for x, w in zip(row, widths)) for row in rows)
+
+
 def lof_argsort(Z):
     return np.argsort(
         np.apply_along_axis(